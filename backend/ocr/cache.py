@@ -0,0 +1,260 @@
+"""
+cache.py
+
+Content-addressed cache for per-page OCR results.
+
+Entries are keyed by the SHA-256 of the PDF bytes plus page index, OCR engine
+version (see engines.py) and the settings that shape results (see
+ocr_settings_fingerprint), so a re-upload of the same file (under
+any name) hits the cache and skips rasterization and OCR entirely. Each entry holds the
+page_data dict produced for one page (size and text_blocks).
+
+Two size-bounded LRU backends are available, selected by OCR_CACHE_BACKEND:
+  - 'disk':  JSON files under OCR_CACHE_DIR, recency tracked by file mtime.
+  - 'redis': the Redis already used as CELERY_RESULT_BACKEND (or OCR_CACHE_REDIS_URL),
+             recency tracked in a sorted set.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from .engines import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Bump when the post-processing that builds text_blocks changes shape or meaning
+OCR_RESULT_SCHEMA = 3
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ocr_engine_version(engine=None):
+    """
+    Identify the OCR engine (by name, OCR_ENGINE if None) and its build, so results of
+    another engine or an older build are never served.
+    """
+    return get_engine(engine).version
+
+
+def ocr_settings_fingerprint(dpi=150):
+    """
+    Identify everything besides the engine that shapes a page's OCR result: render
+    DPI, result schema and the thresholds for using the native text layer.
+    """
+    min_coverage = getattr(settings, 'OCR_NATIVE_TEXT_MIN_COVERAGE', 0.6)
+    max_image_area = getattr(settings, 'OCR_NATIVE_TEXT_MAX_IMAGE_AREA', 0.05)
+    return f'd{dpi}-s{OCR_RESULT_SCHEMA}-n{min_coverage}-i{max_image_area}'
+
+
+def page_cache_key(file_digest, page_index, dpi, engine_version=None):
+    """Build the cache key for one page (page_index is 0-indexed)."""
+    if engine_version is None:
+        engine_version = ocr_engine_version()
+    return f'{file_digest}-p{page_index}-{engine_version}-{ocr_settings_fingerprint(dpi)}'
+
+
+class DiskCacheBackend:
+    """
+    Stores each entry as a JSON file. Reads refresh the file mtime, and writes evict
+    the least recently used files once the directory grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._total_bytes = None  # Lazily measured, then tracked incrementally
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        # Fan out over subdirectories so no single directory gets huge
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return value
+
+    def contains(self, key):
+        """True if key has an entry, without reading it or refreshing its recency."""
+        return os.path.exists(self._path(key))
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        try:
+            previous_size = os.path.getsize(path)  # Overwriting an entry frees its old bytes
+        except OSError:
+            previous_size = 0
+
+        # Write atomically so concurrent workers never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, _, size in self._entries())
+            else:
+                self._total_bytes += len(payload) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under 90% of max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._total_bytes = total
+
+
+class RedisCacheBackend:
+    """
+    Stores each entry as a Redis string, with a sorted set of last-access times and
+    a hash of entry sizes used to evict the least recently used entries.
+    """
+
+    PREFIX = 'ocr-cache'
+
+    def __init__(self, url, max_bytes):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.max_bytes = max_bytes
+        self._lru_key = f'{self.PREFIX}:lru'
+        self._sizes_key = f'{self.PREFIX}:sizes'
+        self._total_key = f'{self.PREFIX}:bytes'
+
+    def _entry_key(self, key):
+        return f'{self.PREFIX}:page:{key}'
+
+    def get(self, key):
+        raw = self.client.get(self._entry_key(key))
+        if raw is None:
+            return None
+        self.client.zadd(self._lru_key, {key: time.time()})
+        return json.loads(raw)
+
+    def contains(self, key):
+        """True if key has an entry, without reading it or refreshing its recency."""
+        return bool(self.client.exists(self._entry_key(key)))
+
+    def set(self, key, value):
+        payload = json.dumps(value, separators=(',', ':'))
+        previous_size = self.client.hget(self._sizes_key, key)
+
+        pipe = self.client.pipeline()
+        pipe.set(self._entry_key(key), payload)
+        pipe.zadd(self._lru_key, {key: time.time()})
+        pipe.hset(self._sizes_key, key, len(payload))
+        pipe.incrby(self._total_key, len(payload) - int(previous_size or 0))
+        total = pipe.execute()[-1]
+
+        while total > self.max_bytes:
+            oldest = self.client.zpopmin(self._lru_key)
+            if not oldest:
+                break
+            old_key = oldest[0][0].decode('utf-8')
+            size = int(self.client.hget(self._sizes_key, old_key) or 0)
+            pipe = self.client.pipeline()
+            pipe.delete(self._entry_key(old_key))
+            pipe.hdel(self._sizes_key, old_key)
+            pipe.decrby(self._total_key, size)
+            total = pipe.execute()[-1]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """
+    Return the configured cache backend for this process, or None when caching is
+    disabled (OCR_CACHE_BACKEND empty).
+    """
+    global _cache
+    backend = getattr(settings, 'OCR_CACHE_BACKEND', 'disk')
+    if not backend:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            max_bytes = getattr(settings, 'OCR_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+            if backend == 'redis':
+                url = getattr(settings, 'OCR_CACHE_REDIS_URL', None) or settings.CELERY_RESULT_BACKEND
+                _cache = RedisCacheBackend(url, max_bytes)
+            elif backend == 'disk':
+                _cache = DiskCacheBackend(settings.OCR_CACHE_DIR, max_bytes)
+            else:
+                raise ValueError(f'Unknown OCR_CACHE_BACKEND: {backend}')
+    return _cache
+
+
+def cache_get(cache, key):
+    """Read from the cache, treating backend errors as a miss."""
+    try:
+        return cache.get(key)
+    except Exception:
+        logger.exception('OCR cache read failed for %s', key)
+        return None
+
+
+def cache_contains(cache, key):
+    """Check for an entry without reading it, treating backend errors as a miss."""
+    try:
+        return cache.contains(key)
+    except Exception:
+        logger.exception('OCR cache lookup failed for %s', key)
+        return False
+
+
+def cache_set(cache, key, value):
+    """Write to the cache, logging (never raising) backend errors."""
+    try:
+        cache.set(key, value)
+    except Exception:
+        logger.exception('OCR cache write failed for %s', key)
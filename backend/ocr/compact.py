@@ -0,0 +1,134 @@
+"""
+compact.py
+
+Compact columnar encoding of one page of OCR output.
+
+As JSON, every text block repeats its key names, a string id that is just its
+position, a 4-point bbox polygon next to its rect, two hex colour strings and
+full-precision floats. pack_page() stores a page as msgpack instead, with one
+typed array per field:
+
+  - rect x, y, w, h and font_size: float32
+  - bbox polygons: int32, 8 per block
+  - fg/bg colours and text_align: uint16/uint8 indices into small palettes
+  - confidence: uint8 (0-255)
+  - text: uint32 indices into a table of distinct strings
+
+unpack_page() expands it back into the usual page_data dict at the API edge,
+optionally only with the block fields a client asked for. Floats come back
+rounded to 2 decimals and confidences to 1/255, which is far below what the
+editor can display. Pages with blocks that don't follow the standard shape are
+left to the caller to store as JSON (pack_page returns None).
+"""
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+PAGE_KEYS = ('page_number', 'width', 'height', 'text_source')
+BLOCK_ORDER = ('id', 'text', 'confidence', 'bbox', 'fg_color', 'bg_color', 'font_size', 'text_align', 'rect')
+BLOCK_KEYS = frozenset(BLOCK_ORDER)
+
+
+def _palette(values):
+    """Return (distinct values in first-seen order, index of each value)."""
+    table, indices = {}, []
+    for value in values:
+        indices.append(table.setdefault(value, len(table)))
+    return list(table), indices
+
+
+def _is_standard(page_number, blocks):
+    for index, block in enumerate(blocks):
+        if block.keys() != BLOCK_KEYS or block['id'] != f'page{page_number}_block{index}':
+            return False
+        if len(block['bbox']) != 4 or block['rect'].keys() != {'x', 'y', 'width', 'height'}:
+            return False
+    return True
+
+
+def pack_page(page_data):
+    """Encode a page_data dict as compact msgpack bytes, or return None if it can't be."""
+    import msgpack
+
+    blocks = page_data.get('text_blocks', [])
+    if set(page_data) != set(PAGE_KEYS) | {'text_blocks'} or not _is_standard(page_data['page_number'], blocks):
+        return None
+
+    texts, text_index = _palette(block['text'] for block in blocks)
+    colors, color_index = _palette(color for block in blocks for color in (block['fg_color'], block['bg_color']))
+    aligns, align_index = _palette(block['text_align'] for block in blocks)
+    if len(colors) > 0xffff or len(aligns) > 0xff:
+        return None
+
+    rects = np.array(
+        [(b['rect']['x'], b['rect']['y'], b['rect']['width'], b['rect']['height'], b['font_size']) for b in blocks],
+        dtype='<f4'
+    ).reshape(-1, 5)
+    packed = {
+        'v': FORMAT_VERSION,
+        'page': [page_data[key] for key in PAGE_KEYS],
+        'n': len(blocks),
+        'texts': texts,
+        'text_index': np.array(text_index, dtype='<u4').tobytes(),
+        'colors': colors,
+        'color_index': np.array(color_index, dtype='<u2').tobytes(),
+        'aligns': aligns,
+        'align_index': np.array(align_index, dtype='u1').tobytes(),
+        'confidence': np.rint(np.clip([b['confidence'] for b in blocks], 0, 1) * 255).astype('u1').tobytes(),
+        'rects': np.ascontiguousarray(rects.T).tobytes(),  # x, y, w, h, font_size columns
+        'bbox': np.array([b['bbox'] for b in blocks], dtype='<i4').reshape(-1, 8).tobytes(),
+    }
+    return msgpack.packb(packed, use_bin_type=True)
+
+
+def unpack_page(payload, fields=None):
+    """
+    Expand pack_page() bytes into a page_data dict.
+
+    Args:
+        payload (bytes): Output of pack_page().
+        fields (set): Block keys to build ('id' is always included), None for all.
+    """
+    import msgpack
+
+    packed = msgpack.unpackb(payload, raw=False)
+    if packed.get('v') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact page version: {packed.get('v')}")
+
+    page_data = dict(zip(PAGE_KEYS, packed['page']))
+    count = packed['n']
+    page_number = page_data['page_number']
+    wanted = BLOCK_KEYS if fields is None else BLOCK_KEYS & (set(fields) | {'id'})
+
+    columns = {}
+    if wanted & {'rect', 'font_size'}:
+        rects = np.frombuffer(packed['rects'], dtype='<f4').reshape(5, count).astype(float).round(2)
+        columns['x'], columns['y'], columns['w'], columns['h'], columns['font_size'] = (c.tolist() for c in rects)
+    if 'text' in wanted:
+        texts = packed['texts']
+        columns['text'] = [texts[i] for i in np.frombuffer(packed['text_index'], dtype='<u4').tolist()]
+    if wanted & {'fg_color', 'bg_color'}:
+        colors = packed['colors']
+        color_index = np.frombuffer(packed['color_index'], dtype='<u2').tolist()
+        columns['fg_color'] = [colors[i] for i in color_index[0::2]]
+        columns['bg_color'] = [colors[i] for i in color_index[1::2]]
+    if 'text_align' in wanted:
+        aligns = packed['aligns']
+        columns['text_align'] = [aligns[i] for i in np.frombuffer(packed['align_index'], dtype='u1').tolist()]
+    if 'confidence' in wanted:
+        columns['confidence'] = (np.frombuffer(packed['confidence'], dtype='u1') / 255).round(3).tolist()
+    if 'bbox' in wanted:
+        columns['bbox'] = np.frombuffer(packed['bbox'], dtype='<i4').reshape(count, 4, 2).tolist()
+
+    columns['id'] = [f'page{page_number}_block{index}' for index in range(count)]
+    if 'rect' in wanted:
+        columns['rect'] = [
+            {'x': x, 'y': y, 'width': w, 'height': h}
+            for x, y, w, h in zip(columns['x'], columns['y'], columns['w'], columns['h'])
+        ]
+
+    keys = [key for key in BLOCK_ORDER if key in wanted]
+    blocks = [dict(zip(keys, values)) for values in zip(*(columns[key] for key in keys))]
+    page_data['text_blocks'] = blocks
+    return page_data
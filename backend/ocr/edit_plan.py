@@ -0,0 +1,237 @@
+"""
+edit_plan.py
+
+Shared edit-application engine for the preview and save paths.
+
+A change list from the editor is parsed and validated once into an EditPlan:
+typed, immutable TextEdit records grouped by page, with colours already
+converted to RGB floats and alignment to PyMuPDF constants. apply_page_edits()
+then burns one page's edits into a fitz.Page (redaction of the old text, then
+insertion of the new text). Both views.preview_pdf_edits and
+tasks.apply_pdf_changes go through here, and compiled plans are cached so a
+preview of an already validated change list doesn't parse it again.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from .fonts import DocumentFonts
+
+_ALIGNMENTS = {
+    'left': fitz.TEXT_ALIGN_LEFT,
+    'center': fitz.TEXT_ALIGN_CENTER,
+    'right': fitz.TEXT_ALIGN_RIGHT,
+}
+
+_PLAN_CACHE_SIZE = 32
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+
+class TextEdit(NamedTuple):
+    """One validated change. Geometry is in fractions of the page size."""
+    page_index: int
+    text: str
+    x_percent: float
+    y_percent: float
+    w_percent: float
+    h_percent: float
+    font_size_percent: Optional[float]
+    font_size: float
+    fill_rgb: Tuple[float, float, float]
+    bg_rgb: Optional[Tuple[float, float, float]]  # None means transparent / not set
+    redact_box_percent: Optional[Tuple[float, float, float, float]]
+    is_new: bool
+    align: int
+
+
+class EditPlan:
+    """Validated edits grouped by 0-indexed page."""
+
+    def __init__(self, edits):
+        self.pages = {}
+        for edit in edits:
+            self.pages.setdefault(edit.page_index, []).append(edit)
+        self.pages = {p_idx: tuple(page_edits) for p_idx, page_edits in self.pages.items()}
+
+    def page_indices(self):
+        return list(self.pages)
+
+    def edits_for_page(self, page_index):
+        return self.pages.get(page_index, ())
+
+    def __len__(self):
+        return sum(len(page_edits) for page_edits in self.pages.values())
+
+
+def parse_hex_color(value):
+    """Convert '#rrggbb' to an (r, g, b) tuple of floats in 0..1. Raises ValueError if malformed."""
+    hex_value = str(value).lstrip('#')
+    if len(hex_value) != 6:
+        raise ValueError(f'Invalid color: {value!r}')
+    return tuple(int(hex_value[i:i+2], 16) / 255.0 for i in (0, 2, 4))
+
+
+def _optional_color(value):
+    if not value or value == 'transparent':
+        return None
+    return parse_hex_color(value)
+
+
+def _compile_change(change):
+    page = int(change.get('page', 1))
+    if page < 1:
+        raise ValueError(f'Invalid page number: {page}')
+
+    is_new = bool(change.get('is_new'))
+    redact_box = None
+    orig_box_pct = change.get('original_box_percent')
+    if not is_new and orig_box_pct and len(orig_box_pct) == 4:
+        redact_box = tuple(float(v) for v in orig_box_pct)
+
+    font_size_percent = change.get('font_size_percent')
+    align_str = str(change.get('text_align') or 'left').lower()
+
+    return TextEdit(
+        page_index=page - 1,
+        text=change.get('text', ''),
+        x_percent=float(change.get('x_percent', 0)),
+        y_percent=float(change.get('y_percent', 0)),
+        w_percent=float(change.get('w_percent', 0)),
+        h_percent=float(change.get('h_percent', 0)),
+        font_size_percent=None if font_size_percent is None else float(font_size_percent),
+        font_size=float(change.get('font_size', 16)),
+        fill_rgb=parse_hex_color(change.get('fill_color') or '#000000'),
+        bg_rgb=_optional_color(change.get('bg_color')),
+        redact_box_percent=redact_box,
+        is_new=is_new,
+        align=_ALIGNMENTS.get(align_str, fitz.TEXT_ALIGN_LEFT),
+    )
+
+
+def compile_edit_plan(changes):
+    """
+    Parse and validate a change list into an EditPlan.
+
+    Args:
+        changes (list): Change dicts from the editor (page, x_percent, y_percent, ...).
+
+    Returns:
+        EditPlan: Shared with any earlier call for an identical change list.
+
+    Raises:
+        ValueError: If a change has an invalid page, number or colour.
+    """
+    digest = hashlib.sha1(json.dumps(changes, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    with _plan_cache_lock:
+        plan = _plan_cache.get(digest)
+        if plan is not None:
+            _plan_cache.move_to_end(digest)
+            return plan
+
+    try:
+        plan = EditPlan([_compile_change(change) for change in changes])
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f'Invalid change: {e}')
+
+    with _plan_cache_lock:
+        _plan_cache[digest] = plan
+        while len(_plan_cache) > _PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def apply_page_edits(page, edits, fonts=None):
+    """
+    Burn a page's edits into a fitz.Page: redact the original text, then insert the new text.
+
+    Args:
+        page (fitz.Page): The page to modify in place.
+        edits (iterable): TextEdit records for this page (EditPlan.edits_for_page).
+        fonts (DocumentFonts): Font registry of the page's document. Pass the same one
+            for every page of a document so the font is embedded only once.
+    """
+    if fonts is None:
+        fonts = DocumentFonts(page.parent)
+    font_name = fonts.prepare(page)
+
+    pdf_w = page.rect.width
+    pdf_h = page.rect.height
+
+    # CRITICAL: PDF pages don't always start at (0,0), especially if they've been cropped!
+    x0 = page.rect.x0
+    y0 = page.rect.y0
+
+    # Pass A: Redaction (Erasing old text)
+    redacted = False
+    for edit in edits:
+        if edit.redact_box_percent is None:
+            continue
+
+        # Use percentage-based original box for perfect scaling.
+        # Expand the redaction area by 2 points in every direction
+        # to ensure all 'ink' from the scan is removed.
+        box = edit.redact_box_percent
+        ox = x0 + (box[0] * pdf_w) - 2
+        oy = y0 + (box[1] * pdf_h) - 2
+        ow = (box[2] * pdf_w) + 4
+        oh = (box[3] * pdf_h) + 4
+
+        # Add redaction annotation (removes underlying selectable text)
+        rect = fitz.Rect(ox, oy, ox + ow, oy + oh)
+        page.add_redact_annot(rect, fill=edit.bg_rgb or (1, 1, 1))
+        redacted = True
+
+    # Apply all redactions for the page
+    if redacted:
+        page.apply_redactions()
+
+    # Pass B: Insert new/modified text
+    for edit in edits:
+        tx = x0 + (edit.x_percent * pdf_w)
+        ty = y0 + (edit.y_percent * pdf_h)
+        tw = edit.w_percent * pdf_w
+        th = edit.h_percent * pdf_h
+
+        if edit.font_size_percent is not None:
+            target_fontsize = edit.font_size_percent * pdf_h
+        else:
+            target_fontsize = edit.font_size
+
+        # If there's a specific background color set for NEW text, draw a rect
+        if edit.is_new and edit.bg_rgb is not None:
+            page.draw_rect(fitz.Rect(tx, ty, tx + tw, ty + th), color=None, fill=edit.bg_rgb)
+
+        # Logic: Is it a header or a paragraph?
+        is_paragraph = "\n" in edit.text or len(edit.text) > 60
+
+        if not is_paragraph:
+            # HEADER PRECISION: No box, no clipping.
+            page.insert_text(
+                (tx, ty + (target_fontsize * 0.8)),
+                edit.text,
+                fontsize=target_fontsize,
+                color=edit.fill_rgb,
+                fontname=font_name
+            )
+        else:
+            # PARAGRAPH WRAPPING: Use a box with a safety buffer.
+            target_rect = fitz.Rect(
+                tx - 2,
+                ty - (target_fontsize * 0.1),
+                tx + tw + 4,
+                ty + th + (target_fontsize * 0.4)
+            )
+            page.insert_textbox(
+                target_rect,
+                edit.text,
+                fontsize=target_fontsize,
+                color=edit.fill_rgb,
+                align=edit.align,
+                fontname=font_name
+            )
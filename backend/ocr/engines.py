@@ -0,0 +1,355 @@
+"""
+engines.py
+
+OCR engines behind one interface.
+
+Every engine turns an RGB page or crop image (a numpy array) into EasyOCR-style
+(bbox, text, confidence) triples: bbox is the 4-point polygon of a text line in
+image pixels, confidence is 0..1. The OCR tasks only talk to this interface, so
+the engine can be chosen per request (OCR_ENGINE by default):
+
+  - 'easyocr':   EasyOCR, through the per-process reader pool (reader_pool.py).
+  - 'tesseract': Tesseract through pytesseract. Much lighter on CPU, good
+                 enough for clean scans of plain text.
+  - 'auto':      Per page: Tesseract first, and EasyOCR for pages where
+                 Tesseract finds nothing or its mean line confidence is below
+                 OCR_AUTO_MIN_CONFIDENCE.
+
+readtext_batch() OCRs several pages in one go. EasyOCR uses it to recognize
+the text lines detected on all of them in large batches (see
+EasyOcrEngine.readtext_batch); the other engines just take one page at a time.
+
+Each engine has a version string that identifies its build and configuration.
+It is part of OCR cache keys and OcrRun.engine, so results of one engine are
+never served for another.
+"""
+
+import hashlib
+import inspect
+import logging
+import time
+from functools import lru_cache
+from importlib import metadata
+
+from django.conf import settings
+
+from .reader_pool import timed_get_reader
+
+logger = logging.getLogger(__name__)
+
+# EasyOCR language codes -> Tesseract traineddata names, for the common ones
+TESSERACT_LANGUAGES = {
+    'en': 'eng', 'fr': 'fra', 'de': 'deu', 'es': 'spa', 'it': 'ita', 'pt': 'por', 'nl': 'nld',
+}
+
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+@lru_cache(maxsize=1)
+def _tesseract_version():
+    """The installed Tesseract's version, or None without pytesseract or the tesseract binary."""
+    try:
+        import pytesseract
+
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=1)
+def _easyocr_internals():
+    """
+    The EasyOCR internals EasyOcrEngine.readtext_batch calls, as (easyocr.easyocr
+    module, get_text, get_image_list, reformat_input), or None if this EasyOCR
+    doesn't have them with the arguments used (written against easyocr 1.7.2).
+    """
+    try:
+        from easyocr import easyocr as easyocr_module
+        from easyocr.recognition import get_text
+        from easyocr.utils import get_image_list, reformat_input
+
+        inspect.signature(easyocr_module.Reader.detect).bind(None, None, reformat=False)
+        inspect.signature(get_image_list).bind([], [], None, model_height=easyocr_module.imgH)
+        inspect.signature(get_text).bind(
+            '', 0, 0, None, None, [], ignore_char='', batch_size=1, workers=0, device='cpu'
+        )
+    except (ImportError, AttributeError, TypeError, ValueError) as e:
+        logger.warning('EasyOCR internals unavailable (%s), batched recognition falls back to readtext()', e)
+        return None
+    return easyocr_module, get_text, get_image_list, reformat_input
+
+
+def _tesseract_lang():
+    lang = getattr(settings, 'OCR_TESSERACT_LANG', None)
+    if lang:
+        return lang
+    languages = getattr(settings, 'OCR_LANGUAGES', ['en'])
+    return '+'.join(TESSERACT_LANGUAGES.get(code, code) for code in languages)
+
+
+class OcrEngine:
+    """
+    Base class of the engines. load() prepares the engine and reports how long that
+    took; readtext() may be called without it and loads on first use.
+    """
+
+    name = None
+
+    @property
+    def version(self):
+        raise NotImplementedError
+
+    def load(self):
+        """
+        Returns:
+            dict: {'engine', 'reader_path': 'cold' | 'warm', 'reader_seconds'}
+        """
+        return {'engine': self.name, 'reader_path': 'warm', 'reader_seconds': 0.0}
+
+    def readtext(self, image):
+        raise NotImplementedError
+
+    def readtext_batch(self, images):
+        """readtext() for each of images (an iterable), as a list of result lists."""
+        return [self.readtext(image) for image in images]
+
+
+class EasyOcrEngine(OcrEngine):
+    name = 'easyocr'
+
+    def __init__(self):
+        self.reader = None
+        self.languages = list(getattr(settings, 'OCR_LANGUAGES', ['en']))
+        self.gpu = bool(getattr(settings, 'OCR_USE_GPU', False))
+
+    @property
+    def version(self):
+        # Languages pick the recognition model and character set; GPU runs batch and
+        # round differently from CPU ones
+        device = 'gpu' if self.gpu else 'cpu'
+        return f"easyocr-{_package_version('easyocr')}-{'+'.join(self.languages)}-{device}"
+
+    def load(self):
+        self.reader, timing = timed_get_reader(self.languages, self.gpu)
+        return dict(timing, engine=self.name)
+
+    def readtext(self, image):
+        if self.reader is None:
+            self.load()
+        # detail=1 (the default) returns [bbox, text, confidence]
+        return self.reader.readtext(image)
+
+    def readtext_batch(self, images):
+        """
+        Detect text lines on each image, then recognize the lines of all images
+        together, OCR_RECOGNITION_BATCH_SIZE crops per forward pass.
+
+        Reader.readtext() runs the recognizer once per line on CPU. Here the crops
+        are grouped by the width they are padded to, which is the same for every
+        line of a group, so each crop goes through the model exactly as it would
+        in readtext(). The results are scattered back to their images in
+        readtext()'s order.
+
+        These are EasyOCR internals, not its public API (hence the pinned version
+        in requirements.txt). If they are missing or their signatures changed,
+        each image goes through readtext() instead.
+        """
+        if self.reader is None:
+            self.load()
+        reader = self.reader
+        internals = _easyocr_internals()
+        reader_ready = all(
+            hasattr(reader, name) for name in ('character', 'lang_char', 'recognizer', 'converter', 'device')
+        )
+        if internals is None or not reader_ready or getattr(reader, 'model_lang', None) == 'arabic':
+            # readtext() also reorders right-to-left text after recognition
+            return super().readtext_batch(images)
+        easyocr_module, get_text, get_image_list, reformat_input = internals
+
+        model_height = easyocr_module.imgH  # Module global, custom models may change it
+        ignore_char = ''.join(set(reader.character) - set(reader.lang_char))
+        batch_size = max(1, getattr(settings, 'OCR_RECOGNITION_BATCH_SIZE', 32))
+
+        results = []
+        lines = {}  # padded width -> [(image index, line index, (box, crop))]
+        for index, image in enumerate(images):
+            img, img_cv_grey = reformat_input(image)
+            horizontal_list, free_list = reader.detect(img, reformat=False)
+            # Horizontal lines first, then free (rotated) ones, like readtext() on CPU
+            boxes = [([box], []) for box in horizontal_list[0]] + [([], [box]) for box in free_list[0]]
+            count = 0
+            for h_list, f_list in boxes:
+                image_list, max_width = get_image_list(h_list, f_list, img_cv_grey, model_height=model_height)
+                for item in image_list:
+                    lines.setdefault(int(max_width), []).append((index, count, item))
+                    count += 1
+            results.append([None] * count)
+            del img, img_cv_grey
+
+        for width, group in lines.items():
+            for start in range(0, len(group), batch_size):
+                chunk = group[start:start + batch_size]
+                recognized = get_text(
+                    reader.character, model_height, width, reader.recognizer, reader.converter,
+                    [item for _, _, item in chunk],
+                    ignore_char=ignore_char, batch_size=batch_size, workers=0, device=reader.device,
+                )
+                for (index, line, _), result in zip(chunk, recognized):
+                    results[index][line] = result
+        return results
+
+
+class TesseractEngine(OcrEngine):
+    """Tesseract, with its words grouped into lines like EasyOCR's detections."""
+
+    name = 'tesseract'
+
+    def __init__(self):
+        self.lang = _tesseract_lang()
+        self.config = getattr(settings, 'OCR_TESSERACT_CONFIG', '--psm 3')
+
+    @property
+    def version(self):
+        # The config (page segmentation mode, ...) changes what is recognized; it may hold
+        # paths, so it goes in as a short digest
+        config = hashlib.sha1(self.config.encode('utf-8')).hexdigest()[:8]
+        return f"tesseract-{_tesseract_version() or 'unavailable'}-{self.lang}-{config}"
+
+    def load(self):
+        started = time.perf_counter()
+        # Fail here rather than on the first page: without the tesseract binary this
+        # raises pytesseract.TesseractNotFoundError
+        import pytesseract
+
+        pytesseract.get_tesseract_version()
+        return {'engine': self.name, 'reader_path': 'warm', 'reader_seconds': round(time.perf_counter() - started, 4)}
+
+    def readtext(self, image):
+        import pytesseract
+
+        data = pytesseract.image_to_data(
+            image, lang=self.lang, config=self.config, output_type=pytesseract.Output.DICT
+        )
+        lines = {}  # (block, paragraph, line) -> [x0, y0, x1, y1, words, confidences]
+        for i, word in enumerate(data['text']):
+            conf = float(data['conf'][i])
+            if conf < 0 or not word.strip():
+                continue
+            x0, y0 = data['left'][i], data['top'][i]
+            x1, y1 = x0 + data['width'][i], y0 + data['height'][i]
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            line = lines.get(key)
+            if line is None:
+                lines[key] = [x0, y0, x1, y1, [word], [conf]]
+                continue
+            line[0], line[1] = min(line[0], x0), min(line[1], y0)
+            line[2], line[3] = max(line[2], x1), max(line[3], y1)
+            line[4].append(word)
+            line[5].append(conf)
+
+        return [
+            (
+                [[x0, y0], [x1, y0], [x1, y1], [x0, y1]],
+                ' '.join(words),
+                sum(confs) / len(confs) / 100,
+            )
+            for x0, y0, x1, y1, words, confs in lines.values()
+        ]
+
+
+class AutoEngine(OcrEngine):
+    """
+    Tesseract for every page, EasyOCR for the pages Tesseract reads poorly or fails
+    on. The dict returned by load() counts those pages in 'fallback_pages'.
+
+    Without a working Tesseract (e.g. no tesseract binary) every page goes to
+    EasyOCR, and the version is EasyOCR's, since that is what produces the results.
+    """
+
+    name = 'auto'
+
+    def __init__(self):
+        self.primary = TesseractEngine()
+        self.fallback = EasyOcrEngine()
+        self.min_confidence = getattr(settings, 'OCR_AUTO_MIN_CONFIDENCE', 0.8)
+        self.timing = {'engine': self.name, 'reader_path': 'warm', 'reader_seconds': 0.0, 'fallback_pages': 0}
+
+    @property
+    def version(self):
+        if self.primary is None or _tesseract_version() is None:
+            return self.fallback.version
+        return f'auto-{self.primary.version}-{self.fallback.version}-c{self.min_confidence}'
+
+    def load(self):
+        try:
+            self.timing.update(self.primary.load(), engine=self.name)
+        except Exception as e:
+            logger.warning('Tesseract unavailable (%s), OCR engine auto uses EasyOCR for every page', e)
+            self.primary = None
+            self._load_fallback()
+        return self.timing
+
+    def _good_enough(self, results):
+        return bool(results) and sum(conf for _, _, conf in results) / len(results) >= self.min_confidence
+
+    def _load_fallback(self):
+        if self.fallback.reader is None:
+            # EasyOCR is only loaded once a page needs it
+            timing = self.fallback.load()
+            self.timing['fallback_reader_path'] = timing['reader_path']
+            self.timing['fallback_reader_seconds'] = timing['reader_seconds']
+
+    def _primary_readtext(self, image):
+        """Tesseract's results for image, or None if there is no Tesseract or it failed."""
+        if self.primary is None:
+            return None
+        try:
+            return self.primary.readtext(image)
+        except Exception:
+            logger.exception('Tesseract failed on a page, falling back to EasyOCR')
+            return None
+
+    def readtext(self, image):
+        results = self._primary_readtext(image)
+        if self._good_enough(results):
+            return results
+        self._load_fallback()
+        self.timing['fallback_pages'] += 1
+        return self.fallback.readtext(image)
+
+    def readtext_batch(self, images):
+        images = list(images)
+        results = [self._primary_readtext(image) for image in images]
+        poor = [index for index, page in enumerate(results) if not self._good_enough(page)]
+        if poor:
+            self._load_fallback()
+            self.timing['fallback_pages'] += len(poor)
+            for index, page in zip(poor, self.fallback.readtext_batch(images[i] for i in poor)):
+                results[index] = page
+        return results
+
+
+ENGINES = {engine.name: engine for engine in (EasyOcrEngine, TesseractEngine, AutoEngine)}
+
+
+def default_engine_name():
+    return getattr(settings, 'OCR_ENGINE', 'easyocr')
+
+
+def get_engine(name=None):
+    """
+    Return a new engine instance by name (OCR_ENGINE if None).
+
+    Raises:
+        ValueError: If there is no engine of that name.
+    """
+    name = name or default_engine_name()
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown OCR engine {name!r}, expected one of {', '.join(ENGINES)}") from None
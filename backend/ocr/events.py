@@ -0,0 +1,149 @@
+"""
+events.py
+
+Push channel for task progress, consumed by the /api/tasks/<id>/events/ SSE view.
+
+Polling task_status builds an AsyncResult per request, and once an OCR job has
+finished every poll re-serializes the whole result. Instead, tasks built on
+EventTask append their events to a Redis stream per job:
+
+  - 'progress': the meta passed to update_state(), plus the publishing task_id
+  - 'page':     one page_data dict, as soon as that page is done
+  - 'done':     the task's return value, with bulky fields already sent as
+                'page' events left out
+  - 'error':    {'error': message}
+
+A Redis stream rather than pub/sub, so a client that connects late (or
+reconnects with Last-Event-ID) replays what it missed. Streams expire
+TASK_EVENTS_TTL seconds after the last event.
+"""
+
+import json
+import logging
+import threading
+
+from celery import Task
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = 'task-events'
+TERMINAL_EVENTS = ('done', 'error')
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def stream_key(job_id):
+    return f'{STREAM_PREFIX}:{job_id}'
+
+
+def events_redis_url():
+    return getattr(settings, 'TASK_EVENTS_REDIS_URL', None) or settings.CELERY_RESULT_BACKEND
+
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            import redis
+
+            _client = redis.Redis.from_url(events_redis_url())
+    return _client
+
+
+def publish_event(job_id, event, data):
+    """Append an event to a job's stream. Errors are logged, never raised into the task."""
+    if not job_id or not getattr(settings, 'TASK_EVENTS_ENABLED', True):
+        return
+    key = stream_key(job_id)
+    try:
+        pipe = _get_client().pipeline()
+        pipe.xadd(
+            key,
+            {'event': event, 'data': json.dumps(data, separators=(',', ':'))},
+            maxlen=getattr(settings, 'TASK_EVENTS_MAX_LEN', 10000),
+            approximate=True,
+        )
+        pipe.expire(key, getattr(settings, 'TASK_EVENTS_TTL', 3600))
+        pipe.execute()
+    except Exception:
+        logger.exception('Publishing %s event for %s failed', event, job_id)
+
+
+async def read_events(job_id, last_id='0', block_seconds=15):
+    """
+    Async generator over a job's stream, starting after last_id ('0' replays all).
+
+    Yields:
+        (event_id, event, data_json) tuples, or None after block_seconds without
+        events so the caller can send a keep-alive or check on the task. Stops
+        after a 'done' or 'error' event.
+    """
+    import redis.asyncio as aioredis
+
+    client = aioredis.Redis.from_url(events_redis_url())
+    key = stream_key(job_id)
+    try:
+        while True:
+            response = await client.xread({key: last_id}, count=100, block=int(block_seconds * 1000))
+            if not response:
+                yield None
+                continue
+            for entry_id, fields in response[0][1]:
+                last_id = entry_id.decode('utf-8')
+                event = fields[b'event'].decode('utf-8')
+                yield last_id, event, fields[b'data'].decode('utf-8')
+                if event in TERMINAL_EVENTS:
+                    return
+    finally:
+        await client.aclose()
+
+
+def format_sse(event, data, event_id=None):
+    """Serialize one Server-Sent Event. data is JSON text (or an object to encode)."""
+    if not isinstance(data, str):
+        data = json.dumps(data, separators=(',', ':'))
+    lines = [f'id: {event_id}'] if event_id else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventTask(Task):
+    """
+    Celery base task that mirrors PROCESSING update_state() metas and its final
+    result onto the job's event stream.
+
+    Subtasks of a larger job pass job_id=<job's task id> as a keyword argument;
+    their progress and pages then go to the job's stream, and the job's own task
+    sends the final 'done'.
+    """
+
+    # Result keys not repeated in the 'done' event, e.g. pages already sent one by one
+    events_omit = ()
+
+    @property
+    def job_id(self):
+        return (self.request.kwargs or {}).get('job_id') or self.request.id
+
+    def publish(self, event, data):
+        publish_event(self.job_id, event, data)
+
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        super().update_state(task_id=task_id, state=state, meta=meta, **kwargs)
+        if task_id is None and state == 'PROCESSING':
+            self.publish('progress', dict(meta or {}, task_id=self.request.id))
+
+    def on_success(self, retval, task_id, args, kwargs):
+        if self.job_id != task_id:
+            return  # Part of a larger job; the job's own task reports completion
+        if isinstance(retval, dict) and retval.get('error'):
+            self.publish('error', {'error': retval['error']})
+        elif isinstance(retval, dict):
+            self.publish('done', {key: value for key, value in retval.items() if key not in self.events_omit})
+        else:
+            self.publish('done', retval)
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        self.publish('error', {'error': str(exc)})
@@ -0,0 +1,207 @@
+"""
+fonts.py
+
+Font handling for burning edits into PDFs.
+
+page.insert_font() parses the font file again for every page it is called on,
+and the saved document carries the whole TTF even if the edits only use a
+handful of glyphs. DocumentFonts embeds the edit font once per document, links
+that same font object into the resources of every other edited page, and
+subsets it to the glyphs actually used before the document is saved. The font
+bytes and the parsed fitz.Font used for text metrics are cached per worker
+process, so they are read once rather than once per task.
+
+Only the edit font is subset (with fontTools, see subset_edit_font); the fonts
+the document came with are saved as they are.
+"""
+
+import hashlib
+import io
+import logging
+import os
+from functools import lru_cache
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets/fonts/Inter-Regular.ttf')
+FONT_NAME = 'inter'
+FALLBACK_FONT_NAME = 'helv'
+
+
+@lru_cache(maxsize=8)
+def load_font_buffer(path=FONT_PATH):
+    """Return the bytes of a font file, or None if it doesn't exist."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=8)
+def edit_font(path=FONT_PATH):
+    """Parsed fitz.Font for the edit font (Helvetica if the font file is missing), for text metrics."""
+    buffer = load_font_buffer(path)
+    if buffer is None:
+        return fitz.Font(FALLBACK_FONT_NAME)
+    return fitz.Font(fontbuffer=buffer)
+
+
+def _link_font(doc, page, fontname, xref):
+    """
+    Reference an already embedded font from page's /Resources/Font dict.
+
+    Returns:
+        bool: False if the page inherits its resources from the page tree, in which
+            case the caller should fall back to page.insert_font().
+    """
+    kind, value = doc.xref_get_key(page.xref, 'Resources')
+    if kind == 'xref':
+        owner, path = int(value.split()[0]), 'Font'
+    elif kind == 'dict':
+        owner, path = page.xref, 'Resources/Font'
+    else:
+        return False
+
+    # xref_set_key() can't follow indirect objects along a key path
+    kind, value = doc.xref_get_key(owner, path)
+    if kind == 'xref':
+        owner, path = int(value.split()[0]), ''
+    elif kind not in ('dict', 'null'):
+        return False
+
+    if not doc.xref_object(owner, compressed=True).startswith('<<'):
+        return False
+    key = f'{path}/{fontname}' if path else fontname
+    if doc.xref_get_key(owner, key)[0] != 'null':
+        return True  # Page already has a font of that name, like insert_font() we keep it
+    doc.xref_set_key(owner, key, f'{xref} 0 R')
+    return True
+
+
+class DocumentFonts:
+    """
+    Per-document registry of the fonts used for edits.
+
+    Args:
+        doc (fitz.Document): The document being edited.
+        font_path (str): TrueType font to embed. Missing files fall back to Helvetica,
+            which is a base-14 font and never embedded.
+    """
+
+    def __init__(self, doc, font_path=FONT_PATH):
+        self.doc = doc
+        self.buffer = load_font_buffer(font_path)
+        self.fontname = FONT_NAME if self.buffer is not None else FALLBACK_FONT_NAME
+        self.xref = None
+
+    def reuse_existing(self, pages):
+        """
+        Adopt the edit font if one of pages already carries it (e.g. from an earlier
+        incremental save), so it isn't embedded a second time.
+        """
+        if self.buffer is None or self.xref is not None:
+            return
+        for page in pages:
+            for font in page.get_fonts():
+                if font[4] == self.fontname:
+                    self.xref = font[0]
+                    return
+
+    def prepare(self, page):
+        """Make the edit font available on page and return the fontname to draw with."""
+        if self.buffer is None:
+            return self.fontname
+        if self.xref is None or not _link_font(self.doc, page, self.fontname, self.xref):
+            xref = page.insert_font(fontname=self.fontname, fontbuffer=self.buffer)
+            if self.xref is None:
+                self.xref = xref
+        return self.fontname
+
+    def subset(self):
+        """Shrink the edit font to the glyphs in use. Call once, right before saving."""
+        if self.xref is None:
+            return
+        subset_edit_font(self.doc, self.fontname)
+
+
+def _xref_of(value):
+    """Object number of an indirect reference ('12 0 R', or a one-element array of one)."""
+    return int(value.strip('[] ').split()[0])
+
+
+def _subset_tag(gids):
+    """Six capital letters naming a subset, as PDF requires in a subset font's name."""
+    digest = hashlib.sha1(repr(sorted(gids)).encode('ascii')).digest()
+    return ''.join(chr(ord('A') + byte % 26) for byte in digest[:6])
+
+
+def subset_edit_font(doc, fontname=FONT_NAME):
+    """
+    Shrink the embedded edit font(s) of doc to the glyphs drawn with them, leaving
+    every other font untouched. Glyph ids are kept, so the content streams and
+    width arrays stay valid as they are. A font none of whose glyphs can be
+    found in the page text is left whole.
+
+    Needs fontTools. Without it, or if subsetting fails, the full font is kept
+    (bigger, but still correct) and the failure is logged, not raised.
+    """
+    try:
+        from fontTools import subset as ft_subset
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        logger.warning('fontTools is not installed, saving the edit font without subsetting it')
+        return
+
+    fonts = {}  # Type0 font xref -> pages drawing with it
+    for page in doc:
+        for xref, ext, kind, basefont, name, _ in page.get_fonts():
+            # A '+' marks a font that was already subset
+            if name == fontname and ext == 'ttf' and kind == 'Type0' and '+' not in basefont:
+                fonts.setdefault(xref, []).append(page.number)
+
+    for xref, page_numbers in fonts.items():
+        try:
+            descendant = _xref_of(doc.xref_get_key(xref, 'DescendantFonts')[1])
+            descriptor = _xref_of(doc.xref_get_key(descendant, 'FontDescriptor')[1])
+            font_file = _xref_of(doc.xref_get_key(descriptor, 'FontFile2')[1])
+            names = {
+                doc.xref_get_key(xref, 'BaseFont')[1],
+                doc.xref_get_key(descendant, 'BaseFont')[1],
+                doc.xref_get_key(descriptor, 'FontName')[1],
+            }
+            names = {name.lstrip('/') for name in names}
+
+            gids = set()
+            for page_number in page_numbers:
+                for span in doc[page_number].get_texttrace():
+                    if span['font'] in names:
+                        gids.update(char[1] for char in span['chars'])
+            if not gids:
+                continue
+
+            font = TTFont(io.BytesIO(doc.xref_stream(font_file)))
+            options = ft_subset.Options()
+            options.retain_gids = True  # Text is drawn with Identity-H glyph ids
+            options.notdef_outline = True
+            subsetter = ft_subset.Subsetter(options)
+            subsetter.populate(gids=sorted(gids))
+            subsetter.subset(font)
+            buffer = io.BytesIO()
+            font.save(buffer)
+            doc.update_stream(font_file, buffer.getvalue())
+
+            tag = _subset_tag(gids)
+            for owner, key in ((xref, 'BaseFont'), (descendant, 'BaseFont'), (descriptor, 'FontName')):
+                base = doc.xref_get_key(owner, key)[1].lstrip('/').replace(' ', '#20')
+                doc.xref_set_key(owner, key, f'/{tag}+{base}')
+        except Exception:
+            # A full font is bigger but still correct
+            logger.exception('Subsetting edit font %s failed, saving it whole', xref)
+
+
+def has_edit_font(doc, fontname=FONT_NAME):
+    """True if any page of doc uses the edit font, i.e. it was edited and saved without subsetting."""
+    return any(font[4] == fontname for page in doc for font in page.get_fonts())
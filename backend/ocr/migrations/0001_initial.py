@@ -0,0 +1,67 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('server_filename', models.CharField(max_length=255, unique=True)),
+                ('original_name', models.CharField(max_length=255)),
+                ('file_hash', models.CharField(db_index=True, max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('page_count', models.PositiveIntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OcrRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('PROCESSING', 'PROCESSING'), ('SUCCESS', 'SUCCESS'), ('FAILURE', 'FAILURE')], default='PENDING', max_length=16)),
+                ('engine', models.CharField(max_length=100)),
+                ('page_count', models.PositiveIntegerField(null=True)),
+                ('pages_done', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocr_runs', to='ocr.document')),
+                ('reused_from', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ocr.ocrrun')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Page',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('text_source', models.CharField(max_length=16)),
+                ('text_blocks', models.JSONField()),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='ocr.ocrrun')),
+            ],
+            options={
+                'ordering': ['page_number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='page',
+            constraint=models.UniqueConstraint(fields=('run', 'page_number'), name='ocr_page_run_page_number'),
+        ),
+        migrations.AddIndex(
+            model_name='ocrrun',
+            index=models.Index(fields=['status', 'engine'], name='ocr_ocrrun_status_39a2fa_idx'),
+        ),
+    ]
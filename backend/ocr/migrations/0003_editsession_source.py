@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocr', '0002_editsession_editversion_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='editsession',
+            name='source_mtime_ns',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='editsession',
+            name='source_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='editsession',
+            name='source_size',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocr', '0003_editsession_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrrun',
+            name='settings_fingerprint',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
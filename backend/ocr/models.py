@@ -0,0 +1,118 @@
+from django.db import models
+
+
+class Document(models.Model):
+    """An uploaded PDF, stored under MEDIA_ROOT/uploads as server_filename."""
+
+    server_filename = models.CharField(max_length=255, unique=True)
+    original_name = models.CharField(max_length=255)
+    file_hash = models.CharField(max_length=64, db_index=True)  # SHA-256 of the file bytes
+    size = models.BigIntegerField()
+    page_count = models.PositiveIntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.server_filename
+
+
+class OcrRun(models.Model):
+    """
+    One OCR job over a Document. task_id is the id handed to the client (the Celery
+    task, or chord callback, that reports the job's completion).
+    """
+
+    PENDING = 'PENDING'
+    PROCESSING = 'PROCESSING'
+    SUCCESS = 'SUCCESS'
+    FAILURE = 'FAILURE'
+    STATUS_CHOICES = [(status, status) for status in (PENDING, PROCESSING, SUCCESS, FAILURE)]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ocr_runs')
+    task_id = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    engine = models.CharField(max_length=100)
+    # cache.ocr_settings_fingerprint() of the run: DPI, result schema, native text thresholds
+    settings_fingerprint = models.CharField(max_length=100, blank=True)
+    page_count = models.PositiveIntegerField(null=True)
+    pages_done = models.PositiveIntegerField(default=0)
+    # The task's return value without its pages (page_count, timings, ...)
+    result = models.JSONField(null=True)
+    error = models.TextField(blank=True)
+    # Set when an identical file was already OCR'd with the same engine and settings; its pages are served instead
+    reused_from = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'engine']),
+        ]
+
+    def __str__(self):
+        return f'{self.task_id} ({self.status})'
+
+    @property
+    def pages_run_id(self):
+        """Id of the run whose Page rows hold this run's output."""
+        return self.reused_from_id or self.id
+
+
+class Page(models.Model):
+    """OCR output for one page of a run, in the page_data shape served to the editor."""
+
+    run = models.ForeignKey(OcrRun, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.PositiveIntegerField()
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    text_source = models.CharField(max_length=16)
+    text_blocks = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'page_number'], name='ocr_page_run_page_number'),
+        ]
+        ordering = ['page_number']
+
+    def __str__(self):
+        return f'{self.run_id}:{self.page_number}'
+
+
+class EditSession(models.Model):
+    """The saved versions of one uploaded PDF, stored as deltas over the upload (see sessions.py)."""
+
+    source_filename = models.CharField(max_length=255, unique=True)
+    # The upload the deltas are appended to; versions can't be rebuilt over other bytes
+    source_size = models.BigIntegerField(null=True)
+    source_mtime_ns = models.BigIntegerField(null=True)
+    source_sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.source_filename
+
+
+class EditVersion(models.Model):
+    """
+    One save of an EditSession: the PDF incremental update appended to the previous
+    version, holding only the pages whose edits changed.
+    """
+
+    session = models.ForeignKey(EditSession, on_delete=models.CASCADE, related_name='versions')
+    number = models.PositiveIntegerField()
+    # Bytes of the whole version (upload + every delta up to this one), checked on materialization
+    size = models.BigIntegerField()
+    delta_size = models.BigIntegerField()
+    # Page index (as a string) -> signature of the edits burned into that page; absent pages are original
+    page_edits = models.JSONField(default=dict)
+    changed_pages = models.JSONField(default=list)
+    changes = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'number'], name='ocr_editversion_session_number'),
+        ]
+        ordering = ['number']
+
+    def __str__(self):
+        return f'{self.session_id}:v{self.number}'
@@ -0,0 +1,143 @@
+"""
+native_text.py
+
+Fast path for born-digital pages.
+
+A page that already carries a real text layer doesn't need to be rasterized and
+run through EasyOCR: its spans give exact text, position, font size and colour.
+text_layer_coverage() estimates how much of the page's visible content is native
+text (as opposed to embedded images such as scans), and native_page_data() turns
+the spans of a sufficiently covered page straight into text_blocks.
+
+Text inside embedded images is only found by OCR, so pages whose images cover
+more than a negligible share of the page (image_area_share()) are always OCR'd,
+however much native text they have.
+"""
+
+import math
+
+import fitz  # PyMuPDF
+
+OCR_DPI = 150
+
+
+def extract_native_spans(text_dict):
+    """Flatten a page.get_text("dict") result into its visible, non-blank text spans."""
+    spans = []
+    for block in text_dict.get("blocks", []):
+        if block["type"] != 0:  # Text blocks only
+            continue
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                if not span.get("text", "").strip():
+                    continue
+                # Invisible text (e.g. an OCR layer under a scan) says nothing about what is drawn
+                if span.get("alpha", 255) == 0:
+                    continue
+                spans.append(span)
+    return spans
+
+
+def _clipped_area(rect, clip):
+    area = fitz.Rect(rect) & clip
+    return 0.0 if area.is_empty else area.width * area.height
+
+
+def text_layer_coverage(pdf_page, spans):
+    """
+    Return the share (0..1) of the page's content area that is native text.
+
+    Text area is the summed span boxes, content area is text plus the area of
+    embedded images. A page with text and no images scores 1.0, a scan with no
+    text layer scores 0.0, and a page mixing text with large pictures falls in
+    between.
+    """
+    page_rect = pdf_page.rect
+    text_area = sum(_clipped_area(span["bbox"], page_rect) for span in spans)
+    if text_area <= 0:
+        return 0.0
+
+    image_area = sum(_clipped_area(info["bbox"], page_rect) for info in pdf_page.get_image_info())
+    return text_area / (text_area + image_area)
+
+
+def image_area_share(pdf_page):
+    """Return the share (0..1) of the page area covered by embedded images."""
+    page_rect = pdf_page.rect
+    page_area = page_rect.width * page_rect.height
+    if page_area <= 0:
+        return 0.0
+    image_area = sum(_clipped_area(info["bbox"], page_rect) for info in pdf_page.get_image_info())
+    return min(1.0, image_area / page_area)
+
+
+def native_page_data(pdf_page, page_number, spans):
+    """
+    Build the page_data dict for a page directly from its native spans.
+
+    Coordinates use the same 150 DPI CropBox pixel space as the rendered pages,
+    so the editor can't tell these blocks from OCR output (apart from
+    text_source and a confidence of 1.0).
+    """
+    page_rect = pdf_page.rect
+    width = math.ceil(page_rect.width * OCR_DPI / 72)
+    height = math.ceil(page_rect.height * OCR_DPI / 72)
+    scale_x = page_rect.width / width
+    scale_y = page_rect.height / height
+
+    page_data = {
+        'page_number': page_number,
+        'width': width,
+        'height': height,
+        'text_source': 'native',
+        'text_blocks': []
+    }
+
+    for span in spans:
+        s_bbox = span["bbox"]
+        rect_x = (s_bbox[0] - page_rect.x0) / scale_x
+        rect_y = (s_bbox[1] - page_rect.y0) / scale_y
+        rect_w = (s_bbox[2] - s_bbox[0]) / scale_x
+        rect_h = (s_bbox[3] - s_bbox[1]) / scale_y
+
+        fg_rgb = fitz.sRGB_to_pdf(span.get('color', 0))
+        x1, y1 = int(rect_x), int(rect_y)
+        x2, y2 = int(rect_x + rect_w), int(rect_y + rect_h)
+
+        page_data['text_blocks'].append({
+            'id': f'page{page_number}_block{len(page_data["text_blocks"])}',
+            'text': span["text"].strip(),
+            'confidence': 1.0,
+            'bbox': [[x1, y1], [x2, y1], [x2, y2], [x1, y2]],
+            'fg_color': '#{:02x}{:02x}{:02x}'.format(
+                int(fg_rgb[0] * 255), int(fg_rgb[1] * 255), int(fg_rgb[2] * 255)
+            ),
+            # Same default the OCR path uses for native matches (no background detection)
+            'bg_color': '#ffffff',
+            'font_size': span.get('size', 12) * (OCR_DPI / 72),
+            'text_align': 'left',
+            'rect': {
+                'x': rect_x,
+                'y': rect_y,
+                'width': rect_w,
+                'height': rect_h
+            }
+        })
+
+    return page_data
+
+
+def try_native_page(pdf_page, page_number, min_coverage, max_image_area=0.05):
+    """
+    Return native page_data if the page's text layer covers at least min_coverage
+    of its content and its images cover at most max_image_area of the page,
+    otherwise None (the page needs OCR).
+    """
+    if min_coverage is None:
+        return None
+    if max_image_area is not None and image_area_share(pdf_page) > max_image_area:
+        return None
+    spans = extract_native_spans(pdf_page.get_text("dict"))
+    if not spans or text_layer_coverage(pdf_page, spans) < min_coverage:
+        return None
+    return native_page_data(pdf_page, page_number, spans)
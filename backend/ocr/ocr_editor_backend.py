@@ -10,32 +10,73 @@ It uses Pillow to:
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import os
+from functools import lru_cache
+
+
+_FONT_CANDIDATES = [
+    # Project-local font
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static", "fonts", "arial.ttf"),
+    # System fonts (Linux)
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+]
+
+# Resolved once at import instead of stat-ing every candidate on each call
+_FONT_PATHS = [path for path in _FONT_CANDIDATES if os.path.exists(path)]
+
+
+@lru_cache(maxsize=256)
+def _load_font(path, font_size):
+    """Load (and keep) a TrueType font object for a (path, size) pair."""
+    return ImageFont.truetype(path, font_size)
 
 
 def _get_font(font_size):
     """
     Get a font at the specified size. Tries common font paths in order.
     """
-    font_candidates = [
-        # Project-local font
-        os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static", "fonts", "arial.ttf"),
-        # System fonts (Linux)
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-    ]
-    
-    for path in font_candidates:
-        if os.path.exists(path):
-            try:
-                return ImageFont.truetype(path, font_size)
-            except IOError:
-                continue
+    for path in _FONT_PATHS:
+        try:
+            return _load_font(path, font_size)
+        except IOError:
+            continue
     
     # Ultimate fallback
     return ImageFont.load_default()
 
 
+def _text_fits(font, text, target_w, target_h):
+    """True if text rendered with font fits within target_w x target_h."""
+    # getbbox returns (left, top, right, bottom)
+    bbox = font.getbbox(text)
+    if not bbox: return True
+    tw = bbox[2] - bbox[0]
+    th = bbox[3] - bbox[1]
+    return tw <= target_w and th <= target_h
+
+
+def _fit_font_size(text, target_w, target_h, font_size, min_size=6):
+    """
+    Best-fit font size: the largest size <= font_size at which the text fits the box,
+    or min_size if nothing larger fits. Bisects over sizes, so the number of font
+    loads and measurements is logarithmic in font_size.
+    """
+    if font_size <= min_size or _text_fits(_get_font(font_size), text, target_w, target_h):
+        return font_size
+
+    best = min_size
+    lo, hi = min_size + 1, font_size - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if _text_fits(_get_font(mid), text, target_w, target_h):
+            best = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
 def _hex_to_rgb(hex_color):
     """Convert hex color string to RGB tuple."""
     if not hex_color or not hex_color.startswith('#'):
@@ -52,8 +93,15 @@ def _sample_background_color(pil_image, x, y, w, h):
     Takes pixels from the edges of the region to estimate the background.
     Returns an RGB tuple.
     """
-    img_w, img_h = pil_image.size
-    pixels = []
+    return _sample_background_color_array(np.asarray(pil_image), x, y, w, h)
+
+
+def _border_pixels(img_array, x, y, w, h):
+    """
+    Gather every other pixel along a thin border around the region as an (N, 3) int array,
+    in the order top, bottom, left, right edge.
+    """
+    img_h, img_w = img_array.shape[:2]
     
     # Sample pixels from a thin border around the region
     pad = 2
@@ -62,31 +110,39 @@ def _sample_background_color(pil_image, x, y, w, h):
     x2 = min(img_w - 1, x + w + pad)
     y2 = min(img_h - 1, y + h + pad)
     
-    # Sample top edge
-    for sx in range(x1, x2, 2):
+    strips = []
+    if x2 > x1:
+        # Top and bottom edges
         if 0 <= y1 < img_h:
-            pixels.append(pil_image.getpixel((sx, y1))[:3])
-    # Sample bottom edge
-    for sx in range(x1, x2, 2):
+            strips.append(img_array[y1, x1:x2:2, :3])
         if 0 <= y2 < img_h:
-            pixels.append(pil_image.getpixel((sx, y2))[:3])
-    # Sample left edge
-    for sy in range(y1, y2, 2):
+            strips.append(img_array[y2, x1:x2:2, :3])
+    if y2 > y1:
+        # Left and right edges
         if 0 <= x1 < img_w:
-            pixels.append(pil_image.getpixel((x1, sy))[:3])
-    # Sample right edge
-    for sy in range(y1, y2, 2):
+            strips.append(img_array[y1:y2:2, x1, :3])
         if 0 <= x2 < img_w:
-            pixels.append(pil_image.getpixel((x2, sy))[:3])
+            strips.append(img_array[y1:y2:2, x2, :3])
     
-    if not pixels:
+    if not strips:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.concatenate(strips).astype(np.int64)
+
+
+def _sample_background_color_array(img_array, x, y, w, h):
+    """
+    Same as _sample_background_color, on an (H, W, 3+) uint8 array.
+    Border strips are sliced out instead of read pixel by pixel.
+    """
+    pixels_arr = _border_pixels(img_array, x, y, w, h)
+    
+    if not len(pixels_arr):
         return (255, 255, 255)  # Default white
     
     # Robust median sampling:
     # Instead of bright pixel thresholds (which fail on tinted documents),
     # we take all sampled pixels, sort them, and take the median.
     # We can also trim extreme values (dark text, bright noise) for better accuracy.
-    pixels_arr = np.array(pixels)
     if len(pixels_arr) > 10:
         # Sort by brightness (sum of RGB)
         brightness = np.sum(pixels_arr, axis=1)
@@ -123,14 +179,13 @@ def process_pil_image(pil_image, edits):
         - bg_color: Hex color for background fill behind text
         - text_align: Alignment ('left', 'center', 'right'). Default: 'left'
     """
-    # Work on a copy
-    pil_img_out = pil_image.copy()
-    if pil_img_out.mode == 'RGBA':
-        pil_img_out = pil_img_out.convert('RGB')
-    
-    draw = ImageDraw.Draw(pil_img_out)
+    # Work on a copy, held as one array for the erase pass
+    pil_img_out = pil_image if pil_image.mode == 'RGB' else pil_image.convert('RGB')
+    canvas = np.array(pil_img_out)
 
-    # Pass 1: Erase old text regions with background color fill
+    # Pass 1: Erase old text regions with background color fill.
+    # Edits are handled in order on the same array, so a region sampled after an
+    # earlier erase sees that erase, exactly as when drawing on the image directly.
     for edit in edits:
         # Skip erasing for new user-added text
         if edit.get('is_new', False):
@@ -150,7 +205,7 @@ def process_pil_image(pil_image, edits):
         if bg_color_hex:
             bg_sampled = _hex_to_rgb(bg_color_hex)
         else:
-            bg_sampled = _sample_background_color(pil_img_out, ox, oy, ow, oh)
+            bg_sampled = _sample_background_color_array(canvas, ox, oy, ow, oh)
         
         # Erase by filling with background color (pad minimally to avoid over-erasing adjacent lines)
         pad = 1
@@ -158,7 +213,11 @@ def process_pil_image(pil_image, edits):
         y1 = max(0, oy - pad)
         x2 = ox + ow + pad
         y2 = oy + oh + pad
-        draw.rectangle([x1, y1, x2, y2], fill=bg_sampled)
+        if x2 >= x1 and y2 >= y1:
+            canvas[y1:y2 + 1, x1:x2 + 1] = bg_sampled
+
+    pil_img_out = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(pil_img_out)
 
     # Pass 2: Draw new/replacement text
     for edit in edits:
@@ -175,7 +234,6 @@ def process_pil_image(pil_image, edits):
         
         # Get font with size correction
         font_size = max(8, font_size)
-        font = _get_font(font_size)
         
         # Alignment handling
         text_align = edit.get('text_align', 'left').lower()
@@ -189,18 +247,9 @@ def process_pil_image(pil_image, edits):
         text_rgb = _hex_to_rgb(fill_color)
         
         # 1. Best-Fit Font Scaling:
-        # If text is too wide OR too tall for the box, reduce font size until it fits
-        def check_fit(f, t, target_w, target_h):
-            # getbbox returns (left, top, right, bottom)
-            bbox = f.getbbox(t)
-            if not bbox: return True
-            tw = bbox[2] - bbox[0]
-            th = bbox[3] - bbox[1]
-            return tw <= target_w and th <= target_h
-
-        while not check_fit(font, text_content, w, h) and font_size > 6:
-            font_size -= 1
-            font = _get_font(font_size)
+        # If text is too wide OR too tall for the box, use the largest size that fits
+        font_size = _fit_font_size(text_content, w, h, font_size)
+        font = _get_font(font_size)
             
         # 2. Alignment Anchor logic:
         # We always center vertically in the box for visual consistency
@@ -0,0 +1,330 @@
+"""
+preview.py
+
+Incremental preview rendering for the editor.
+
+Re-rendering the whole page for every preview request is wasteful when the user
+only nudged one text box. The preview engine keeps, per (file, page, zoom), the
+last rendered composite pixmap and the edit set it shows. On the next request it
+diffs the edit sets and re-renders only the union of the rects touched by the
+edits that changed, pasting those tiles into the cached composite.
+
+A full re-render is still done when the set of redactions changes, because
+apply_redactions() can remove line art and images that reach outside the
+redacted rect.
+
+Unedited pages (e.g. thumbnails) are rendered by render_page() without this
+cache, so browsing the page strip doesn't evict the pages being edited.
+
+Async views hand rendering to run_in_render_pool(), a small bounded thread
+pool (PREVIEW_RENDER_WORKERS), so CPU-bound MuPDF work never runs on the event
+loop and a burst of previews queues up instead of taking every thread.
+"""
+
+import asyncio
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+from django.conf import settings
+
+from .edit_plan import apply_page_edits
+from .fonts import edit_font
+from .uploads import content_key
+
+IMAGE_FORMATS = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+
+_states = OrderedDict()  # (file_path, mtime, page_index, zoom) -> _PageState
+_states_lock = threading.Lock()
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+class _PageState:
+    """Cached rendering state of one page at one zoom."""
+
+    def __init__(self):
+        self.base = None       # Unedited page pixmap, rendered on demand
+        self.composite = None  # Page with `applied` edits burned in
+        self.applied = frozenset()
+        self.redactions = frozenset()
+        self.lock = threading.Lock()
+
+    @property
+    def version(self):
+        return edit_set_version(self.applied)
+
+
+def edit_set_version(edits):
+    """Stable token identifying an edit set, so clients can ask for tiles since a version."""
+    digest = hashlib.sha1(repr(sorted(map(repr, edits))).encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def _redaction_signature(edits):
+    return frozenset((e.redact_box_percent, e.bg_rgb) for e in edits if e.redact_box_percent)
+
+
+def edit_affected_rect(edit, page_rect):
+    """
+    Return the page-space rect an edit can draw into (redaction box, background
+    and text, including text running past its box), padded for anti-aliasing.
+    """
+    pdf_w, pdf_h = page_rect.width, page_rect.height
+    x0, y0 = page_rect.x0, page_rect.y0
+
+    tx = x0 + edit.x_percent * pdf_w
+    ty = y0 + edit.y_percent * pdf_h
+    tw = edit.w_percent * pdf_w
+    th = edit.h_percent * pdf_h
+    fontsize = edit.font_size_percent * pdf_h if edit.font_size_percent is not None else edit.font_size
+
+    # insert_text() doesn't clip, so single lines can run past the box
+    text_w = max(tw, edit_font().text_length(edit.text.split('\n')[0], fontsize=fontsize))
+    rect = fitz.Rect(tx - 2, ty - fontsize * 0.5, tx + text_w + fontsize, ty + max(th, fontsize) + fontsize * 0.5)
+
+    if edit.redact_box_percent:
+        box = edit.redact_box_percent
+        ox = x0 + box[0] * pdf_w - 2
+        oy = y0 + box[1] * pdf_h - 2
+        rect |= fitz.Rect(ox, oy, ox + box[2] * pdf_w + 4, oy + box[3] * pdf_h + 4)
+
+    return rect + (-2, -2, 2, 2)
+
+
+def _merge_rects(rects):
+    """Merge overlapping rects so each area is rendered once."""
+    merged = []
+    for rect in sorted(rects, key=lambda r: (r.y0, r.x0)):
+        for i, existing in enumerate(merged):
+            if existing.intersects(rect):
+                merged[i] = existing | rect
+                break
+        else:
+            merged.append(fitz.Rect(rect))
+    # One more pass in case unions created new overlaps
+    if len(merged) != len(rects):
+        return _merge_rects(merged)
+    return merged
+
+
+def _state_for(file_path, page_index, zoom):
+    # Keyed by the stored bytes rather than the name, so uploads of the same file share renders
+    key = (content_key(file_path), page_index, zoom)
+    max_pages = getattr(settings, 'PREVIEW_CACHE_MAX_PAGES', 8)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = _PageState()
+        _states.move_to_end(key)
+        while len(_states) > max_pages:
+            _states.popitem(last=False)
+    return state
+
+
+def _discard_state(state):
+    """Drop a state that never got a render (e.g. for a page that doesn't exist)."""
+    if state.composite is not None:
+        return
+    with _states_lock:
+        for key, value in list(_states.items()):
+            if value is state:
+                del _states[key]
+
+
+def render_preview(file_path, page_index, edits, zoom=2, since=None, encode=None):
+    """
+    Render a page with edits, reusing the cached composite where possible.
+
+    Args:
+        file_path (str): Path to the source PDF.
+        page_index (int): 0-indexed page.
+        edits (iterable): TextEdit records for the page (EditPlan.edits_for_page).
+        zoom (float): Render scale (2 matches the old fixed fitz.Matrix(2, 2)).
+        since (str): Version the client already displays. When it matches the cached
+            composite, only the changed tiles are returned instead of the full image.
+        encode (callable): fitz.Pixmap -> bytes, defaults to PNG.
+
+    Returns:
+        dict: {
+            'image': encoded full page, or None when tiles are returned,
+            'tiles': list of {'x', 'y', 'width', 'height', 'image'} in pixels,
+            'width', 'height': full image size in pixels,
+            'version': token for the edit set now shown,
+        }
+
+    Raises:
+        ValueError: If the document has no page page_index. The file is only opened
+            when something must be rendered, so this is checked then.
+    """
+    if encode is None:
+        encode = lambda pix: pix.tobytes("png")
+
+    edits = frozenset(edits)
+    matrix = fitz.Matrix(zoom, zoom)
+    state = _state_for(file_path, page_index, zoom)
+
+    with state.lock:
+        client_current = state.composite is not None and since == state.version
+        redactions = _redaction_signature(edits)
+
+        if state.composite is not None and edits == state.applied:
+            dirty_irects = []
+        else:
+            doc = fitz.open(file_path)
+            try:
+                if not 0 <= page_index < len(doc):
+                    _discard_state(state)
+                    raise ValueError('Invalid page number')
+                page = doc[page_index]
+                dirty_irects = _render_into_state(state, page, edits, redactions, matrix)
+            finally:
+                doc.close()
+            state.applied = edits
+            state.redactions = redactions
+
+        composite = state.composite
+        result = {
+            'image': None,
+            'tiles': [],
+            'width': composite.width,
+            'height': composite.height,
+            'version': state.version,
+        }
+        # Encode while holding the lock so a concurrent request can't repaint mid-encode
+        if client_current and dirty_irects is not None:
+            for irect in dirty_irects:
+                tile = fitz.Pixmap(composite.colorspace, irect, composite.alpha)
+                tile.copy(composite, irect)
+                result['tiles'].append({
+                    'x': irect.x0 - composite.x,
+                    'y': irect.y0 - composite.y,
+                    'width': irect.width,
+                    'height': irect.height,
+                    'image': encode(tile),
+                })
+        else:
+            result['image'] = encode(composite)
+        return result
+
+
+def render_page(page, zoom=2, encode=None):
+    """
+    Render an unedited page straight to an image, outside the composite cache.
+
+    Args:
+        page (fitz.Page): The page to render.
+        zoom (float): Render scale.
+        encode (callable): fitz.Pixmap -> bytes, defaults to PNG.
+
+    Returns:
+        dict: {'image', 'width', 'height', 'version'}, like render_preview() with no edits.
+    """
+    if encode is None:
+        encode = lambda pix: pix.tobytes("png")
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    return {
+        'image': encode(pix),
+        'width': pix.width,
+        'height': pix.height,
+        'version': edit_set_version(frozenset()),
+    }
+
+
+def _render_into_state(state, page, edits, redactions, matrix):
+    """
+    Bring state.composite up to date with edits.
+
+    Returns:
+        list of fitz.IRect that changed, or None if the whole page was re-rendered.
+    """
+    full = state.composite is None or redactions != state.redactions
+
+    if full and redactions:
+        # Redactions changed: only a full render is guaranteed correct
+        apply_page_edits(page, edits)
+        state.composite = page.get_pixmap(matrix=matrix)
+        return None
+
+    if full:
+        # No redactions: start from the unedited page and paint every edit
+        if state.base is None:
+            state.base = page.get_pixmap(matrix=matrix)
+        state.composite = fitz.Pixmap(state.base, 0)  # Copy without alpha, like get_pixmap()
+        changed = edits
+    else:
+        changed = edits ^ state.applied
+
+    dirty = _merge_rects([edit_affected_rect(e, page.rect) for e in changed])
+    apply_page_edits(page, edits)
+
+    irects = []
+    for rect in dirty:
+        # Snap to the pixel grid so tiles line up exactly with a full render
+        irect = (rect * matrix).irect & fitz.IRect(state.composite.irect)
+        if irect.is_empty:
+            continue
+        tile = page.get_pixmap(matrix=matrix, clip=fitz.Rect(irect) * ~matrix)
+        state.composite.copy(tile, tile.irect)
+        irects.append(fitz.IRect(tile.irect) & fitz.IRect(state.composite.irect))
+    return None if full else irects
+
+
+def _get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            workers = getattr(settings, 'PREVIEW_RENDER_WORKERS', 2)
+            _render_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview-render')
+    return _render_pool
+
+
+async def run_in_render_pool(func, *args, **kwargs):
+    """Run a blocking render function on the preview render pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_render_pool(), functools.partial(func, *args, **kwargs))
+
+
+def negotiate_format(requested=None, accept=''):
+    """
+    Pick an output format: an explicit ?format= wins, otherwise the best of WebP,
+    JPEG and PNG (in that order) that the Accept header allows. Defaults to PNG.
+    """
+    if requested:
+        requested = requested.lower().replace('jpg', 'jpeg')
+        if requested not in IMAGE_FORMATS:
+            raise ValueError(f'Unsupported image format: {requested}')
+        return requested
+    accept = accept or ''
+    for fmt in ('webp', 'jpeg'):
+        if IMAGE_FORMATS[fmt] in accept:
+            return fmt
+    return 'png'
+
+
+def make_encoder(fmt, quality=80):
+    """Return a fitz.Pixmap -> bytes function for the given format and lossy quality (1-100)."""
+    quality = max(1, min(100, int(quality)))
+    if fmt == 'jpeg':
+        return lambda pix: pix.tobytes("jpeg", jpg_quality=quality)
+    if fmt == 'webp':
+        # MuPDF can't write WebP; go through Pillow
+        return lambda pix: pix.pil_tobytes(format="WEBP", quality=quality)
+    return lambda pix: pix.tobytes("png")
+
+
+def zoom_for(page_rect, width=None, dpi=None, default=2):
+    """Render scale for a target pixel width or DPI, falling back to the old fixed 2x."""
+    if width:
+        return max(0.05, min(8.0, float(width) / page_rect.width))
+    if dpi:
+        return max(0.05, min(8.0, float(dpi) / 72))
+    return default
@@ -0,0 +1,92 @@
+"""
+rasterize.py
+
+Streaming PDF rasterization for the OCR tasks.
+
+convert_from_path() on a whole document keeps every page in memory as a
+full-resolution PIL image before OCR even starts. iter_page_images() renders
+pages one at a time through poppler instead, keeping at most
+OCR_RASTER_IN_FLIGHT_PAGES pages rendered ahead of the consumer, so peak
+memory no longer depends on the length of the document.
+
+The consumer holds pages too: _ocr_page_range collects OCR_RECOGNITION_BATCH_PAGES
+of them before OCR'ing the group, so up to OCR_RASTER_IN_FLIGHT_PAGES +
+OCR_RECOGNITION_BATCH_PAGES rendered pages are in memory at once.
+
+Each page is its own poppler (pdftoppm) process, which parses the PDF again
+before rendering. That start-up cost is paid per page; rendering ahead on
+threads hides it behind OCR rather than removing it.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from pdf2image import convert_from_path
+
+
+def render_page(file_path, page_number, dpi=150):
+    """
+    Render a single page (1-indexed) using its CropBox to match visible coordinates.
+
+    Returns:
+        PIL.Image.Image or None if poppler produced no image.
+    """
+    images = convert_from_path(
+        file_path,
+        dpi=dpi,
+        first_page=page_number,
+        last_page=page_number,
+        use_cropbox=True,
+    )
+    return images[0] if images else None
+
+
+def iter_page_images(file_path, page_numbers, dpi=150, max_in_flight=None):
+    """
+    Yield (page_number, PIL image) pairs in order, rendering pages lazily.
+
+    Args:
+        file_path (str): Path to the PDF.
+        page_numbers (iterable): 1-indexed pages to render, in the order to yield them.
+        dpi (int): Rendering resolution.
+        max_in_flight (int): Pages that may be rendered but not yet consumed.
+            Defaults to settings.OCR_RASTER_IN_FLIGHT_PAGES. 1 renders strictly serially.
+
+    The generator itself never holds more than max_in_flight pages. Pages the caller
+    keeps (e.g. a recognition batch) come on top of that, so the caller should drop
+    its reference to each image as soon as it is done with it.
+    """
+    if max_in_flight is None:
+        max_in_flight = getattr(settings, 'OCR_RASTER_IN_FLIGHT_PAGES', 2)
+    max_in_flight = max(1, int(max_in_flight))
+
+    pages = iter(page_numbers)
+
+    if max_in_flight == 1:
+        for page_number in pages:
+            yield page_number, render_page(file_path, page_number, dpi)
+        return
+
+    # poppler runs as a subprocess, so rendering ahead on a thread overlaps with OCR
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    pending = deque()
+    try:
+        for page_number in pages:
+            pending.append((page_number, executor.submit(render_page, file_path, page_number, dpi)))
+            if len(pending) >= max_in_flight:
+                break
+
+        while pending:
+            page_number, future = pending.popleft()
+            img = future.result()
+            yield page_number, img
+            del img
+            # Only queue the next render once the consumer is done with this page
+            next_page = next(pages, None)
+            if next_page is not None:
+                pending.append((next_page, executor.submit(render_page, file_path, next_page, dpi)))
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
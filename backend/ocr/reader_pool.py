@@ -0,0 +1,180 @@
+"""
+reader_pool.py
+
+Process-wide registry of EasyOCR readers.
+
+Building an ``easyocr.Reader`` loads the detection and recognition weights from
+disk, which takes seconds and several hundred MB. Celery tasks used to do that on
+every call; instead each worker process keeps its readers here, keyed by language
+set and options, and hands the same instance to every task that asks for it.
+
+The registry is bounded two ways:
+  - OCR_READER_POOL_SIZE: maximum number of distinct readers kept resident.
+  - OCR_READER_MAX_MEMORY_MB: budget for the estimated resident size of all
+    readers together. Least recently used readers are evicted first.
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_readers = OrderedDict()  # key -> {'reader': Reader, 'memory_mb': float}
+_lock = threading.Lock()
+_stats = {
+    'cold_loads': 0,
+    'warm_hits': 0,
+    'evictions': 0,
+    'cold_seconds_total': 0.0,
+    'last_cold_seconds': None,
+}
+
+
+def _reader_key(languages, gpu, options):
+    """Build a hashable registry key from the reader configuration."""
+    return (tuple(sorted(languages)), bool(gpu), tuple(sorted(options.items())))
+
+
+def _current_rss_mb():
+    """Return the resident set size of this process in MB (0.0 if unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _evict_if_needed(incoming_mb=0.0):
+    """Drop least recently used readers until the pool fits its limits. Caller holds _lock."""
+    max_readers = getattr(settings, 'OCR_READER_POOL_SIZE', 2)
+    max_memory_mb = getattr(settings, 'OCR_READER_MAX_MEMORY_MB', None)
+
+    while _readers:
+        used_mb = sum(entry['memory_mb'] for entry in _readers.values())
+        over_count = len(_readers) + 1 > max_readers
+        over_memory = max_memory_mb is not None and used_mb + incoming_mb > max_memory_mb
+        if not (over_count or over_memory):
+            break
+        key, _ = _readers.popitem(last=False)
+        _stats['evictions'] += 1
+        logger.info('Evicted OCR reader %s from pool', key)
+
+    gc.collect()
+
+
+def _configure_torch():
+    """
+    Apply OCR_TORCH_THREADS, torch's intra-op thread count for CPU inference. The
+    default is one thread per core, which oversubscribes the CPU when several
+    worker processes run inference at once.
+    """
+    threads = getattr(settings, 'OCR_TORCH_THREADS', None)
+    if not threads:
+        return
+    import torch
+
+    if torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+        logger.info('Set torch intra-op threads to %d', threads)
+
+
+def get_reader(languages=None, gpu=None, **options):
+    """
+    Return a cached easyocr.Reader for the given configuration, loading it on first use.
+
+    Args:
+        languages (list): Language codes, defaults to settings.OCR_LANGUAGES.
+        gpu (bool): Use CUDA, defaults to settings.OCR_USE_GPU.
+        **options: Extra keyword arguments forwarded to easyocr.Reader.
+
+    Returns:
+        easyocr.Reader: A reader shared with every other task in this process.
+    """
+    if languages is None:
+        languages = getattr(settings, 'OCR_LANGUAGES', ['en'])
+    if gpu is None:
+        gpu = getattr(settings, 'OCR_USE_GPU', False)
+
+    key = _reader_key(languages, gpu, options)
+
+    with _lock:
+        entry = _readers.get(key)
+        if entry is not None:
+            _readers.move_to_end(key)
+            _stats['warm_hits'] += 1
+            return entry['reader']
+
+        # Cold path: make room first so the old weights are freed before the new ones load
+        estimated_mb = max((e['memory_mb'] for e in _readers.values()), default=0.0)
+        _evict_if_needed(incoming_mb=estimated_mb)
+
+        _configure_torch()
+        import easyocr
+
+        rss_before = _current_rss_mb()
+        started = time.perf_counter()
+        reader = easyocr.Reader(list(languages), gpu=gpu, verbose=False, **options)
+        elapsed = time.perf_counter() - started
+        memory_mb = max(0.0, _current_rss_mb() - rss_before)
+
+        _readers[key] = {'reader': reader, 'memory_mb': memory_mb}
+        _stats['cold_loads'] += 1
+        _stats['cold_seconds_total'] += elapsed
+        _stats['last_cold_seconds'] = elapsed
+
+    logger.info(
+        'Loaded OCR reader %s in %.2fs (~%.0f MB resident)', key, elapsed, memory_mb
+    )
+    return reader
+
+
+def timed_get_reader(languages=None, gpu=None, **options):
+    """
+    Same as get_reader, but also report how long the lookup took.
+
+    Returns:
+        tuple: (reader, {'reader_path': 'cold' | 'warm', 'reader_seconds': float})
+    """
+    cold_loads_before = _stats['cold_loads']
+    started = time.perf_counter()
+    reader = get_reader(languages, gpu, **options)
+    elapsed = time.perf_counter() - started
+    path = 'cold' if _stats['cold_loads'] > cold_loads_before else 'warm'
+    return reader, {'reader_path': path, 'reader_seconds': round(elapsed, 4)}
+
+
+def preload_readers():
+    """Load the default reader so the first task in this process takes the warm path."""
+    if not getattr(settings, 'OCR_PRELOAD_READERS', True):
+        return
+    if getattr(settings, 'OCR_ENGINE', 'easyocr') != 'easyocr':
+        # Other engines load EasyOCR only when a request or page needs it
+        return
+    try:
+        get_reader()
+    except Exception:
+        # Never keep a worker from starting; tasks will retry the load on demand
+        logger.exception('Failed to preload OCR reader')
+
+
+def clear_readers():
+    """Drop every cached reader (mainly for tests and worker shutdown)."""
+    with _lock:
+        _readers.clear()
+    gc.collect()
+
+
+def reader_pool_stats():
+    """Return a snapshot of pool usage and cold-start vs warm-path counters."""
+    with _lock:
+        stats = dict(_stats)
+        stats['resident_readers'] = len(_readers)
+        stats['resident_memory_mb'] = round(sum(e['memory_mb'] for e in _readers.values()), 1)
+    return stats
@@ -0,0 +1,243 @@
+"""
+records.py
+
+Durable records of uploads and OCR jobs in the database (see models.py).
+
+The upload view registers a Document and an OcrRun whose task_id is the id the
+client polls. While the job runs, RunRecorder writes finished pages to Page
+rows in bulk and counts them in OcrRun.pages_done (atomically, so the parallel
+subtasks of a chord can share one run), and the job's task records the final
+state. task_status then answers from the run instead of AsyncResult, so results
+outlive the Redis result backend.
+
+A file whose hash matches an earlier successful run with the same OCR engine
+and settings fingerprint (cache.ocr_settings_fingerprint) isn't OCR'd again: its new run points at the earlier one (reused_from) and
+serves its pages.
+
+Models are imported where they are used, so ocr.tasks (which uses this module)
+stays importable without a configured Django app registry.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import ocr_settings_fingerprint
+
+logger = logging.getLogger(__name__)
+
+PAGE_FIELDS = ('page_number', 'width', 'height', 'text_source', 'text_blocks')
+
+
+def recording_enabled():
+    return getattr(settings, 'OCR_RUN_RECORDS', True)
+
+
+def create_run(server_filename, original_name, size, file_hash, task_id, engine):
+    """
+    Register an upload and the OCR run about to be queued for it.
+
+    Returns:
+        OcrRun: The new run. If OCR_RUN_REUSE is on and the same file was already
+            OCR'd successfully with this engine and the current settings, the run is
+            created finished, with reused_from set, and nothing needs to be queued.
+    """
+    from .models import Document, OcrRun
+
+    fingerprint = ocr_settings_fingerprint()
+    with transaction.atomic():
+        document = Document.objects.create(
+            server_filename=server_filename, original_name=original_name, size=size, file_hash=file_hash
+        )
+        previous = None
+        if getattr(settings, 'OCR_RUN_REUSE', True):
+            previous = (
+                OcrRun.objects
+                .filter(
+                    document__file_hash=file_hash,
+                    engine=engine,
+                    settings_fingerprint=fingerprint,
+                    status=OcrRun.SUCCESS,
+                    reused_from=None,
+                )
+                .order_by('-finished_at')
+                .first()
+            )
+        if previous is None:
+            return OcrRun.objects.create(
+                document=document, task_id=task_id, engine=engine, settings_fingerprint=fingerprint
+            )
+
+        document.page_count = previous.page_count
+        document.save(update_fields=['page_count'])
+        return OcrRun.objects.create(
+            document=document,
+            task_id=task_id,
+            engine=engine,
+            settings_fingerprint=fingerprint,
+            status=OcrRun.SUCCESS,
+            page_count=previous.page_count,
+            pages_done=previous.pages_done,
+            result=previous.result,
+            reused_from=previous,
+            finished_at=timezone.now(),
+        )
+
+
+class RunRecorder:
+    """
+    Buffers the pages of one task's share of an OCR job and bulk-inserts them into
+    its run's Page rows, every OCR_RUN_PAGE_BATCH pages or OCR_RUN_FLUSH_SECONDS,
+    whichever comes first.
+
+    If the job has no OcrRun (or recording is off), .active is False and nothing is
+    written. Database errors are logged, never raised into the task: add() and
+    flush() hand back the pages that couldn't be written so the task can return
+    them inline instead.
+    """
+
+    def __init__(self, job_id, page_count):
+        self.run_id = None
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.batch_size = max(1, getattr(settings, 'OCR_RUN_PAGE_BATCH', 20))
+        self.flush_seconds = getattr(settings, 'OCR_RUN_FLUSH_SECONDS', 2)
+        if not job_id or not recording_enabled():
+            return
+        from .models import Document, OcrRun
+
+        try:
+            self.run_id = OcrRun.objects.filter(task_id=job_id).values_list('id', flat=True).first()
+            if self.run_id is not None:
+                OcrRun.objects.filter(id=self.run_id, status=OcrRun.PENDING).update(
+                    status=OcrRun.PROCESSING, page_count=page_count
+                )
+                Document.objects.filter(ocr_runs=self.run_id, page_count=None).update(page_count=page_count)
+        except Exception:
+            logger.exception('Looking up the OCR run of %s failed', job_id)
+            self.run_id = None
+
+    @property
+    def active(self):
+        return self.run_id is not None
+
+    def add(self, page_data):
+        """Queue a page for insertion. Returns pages that couldn't be written, if a flush was due."""
+        self.pending.append(page_data)
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_seconds:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Insert the queued pages. Returns the ones that couldn't be written."""
+        pages, self.pending = self.pending, []
+        self.last_flush = time.monotonic()
+        if not pages:
+            return []
+        from .models import OcrRun
+
+        try:
+            with transaction.atomic():
+                _insert_pages(self.run_id, pages)
+                OcrRun.objects.filter(id=self.run_id).update(pages_done=F('pages_done') + len(pages))
+            return []
+        except Exception:
+            logger.exception('Recording %d pages of OCR run %s failed', len(pages), self.run_id)
+            return pages
+
+
+def _insert_pages(run_id, pages):
+    from .models import Page
+
+    # Upsert, so a retried task overwrites its earlier pages instead of failing
+    Page.objects.bulk_create(
+        [Page(run_id=run_id, **{key: page[key] for key in PAGE_FIELDS}) for page in pages],
+        update_conflicts=True,
+        unique_fields=['run', 'page_number'],
+        update_fields=['width', 'height', 'text_source', 'text_blocks'],
+    )
+
+
+def finish_run(task_id, result):
+    """Record the return value of a job's task. Results carrying 'error' fail the run."""
+    if not recording_enabled():
+        return
+    from .models import OcrRun
+
+    try:
+        run = OcrRun.objects.filter(task_id=task_id).first()
+        if run is None:
+            return
+        if isinstance(result, dict) and result.get('error'):
+            _fail(run, result['error'])
+            return
+        # Pages the subtasks couldn't record came back inline; try once more
+        pages = result.get('pages', []) if isinstance(result, dict) else []
+        with transaction.atomic():
+            if pages:
+                _insert_pages(run.id, pages)
+            run.status = OcrRun.SUCCESS
+            run.result = {key: value for key, value in result.items() if key != 'pages'}
+            run.pages_done = run.page_count or len(pages)
+            run.finished_at = timezone.now()
+            run.save(update_fields=['status', 'result', 'pages_done', 'finished_at'])
+    except Exception:
+        logger.exception('Recording the result of OCR run %s failed', task_id)
+
+
+def fail_run(task_id, error):
+    if not recording_enabled():
+        return
+    from .models import OcrRun
+
+    try:
+        run = OcrRun.objects.filter(task_id=task_id).first()
+        if run is not None:
+            _fail(run, error)
+    except Exception:
+        logger.exception('Recording the failure of OCR run %s failed', task_id)
+
+
+def _fail(run, error):
+    from .models import OcrRun
+
+    run.status = OcrRun.FAILURE
+    run.error = str(error)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def get_run(task_id):
+    """The OcrRun for a task id, or None (also when recording is off)."""
+    if not recording_enabled():
+        return None
+    from .models import OcrRun
+
+    return OcrRun.objects.filter(task_id=task_id).first()
+
+
+def iter_run_pages(run):
+    """Every recorded page of a run in page order, as page_data dicts."""
+    from .models import Page
+
+    rows = Page.objects.filter(run_id=run.pages_run_id).order_by('page_number').values(*PAGE_FIELDS)
+    return rows.iterator(chunk_size=100)
+
+
+def load_run_pages(run, page_numbers):
+    """The recorded pages of a run among page_numbers (sorted), as page_data dicts."""
+    from .models import Page
+
+    if not page_numbers:
+        return []
+    wanted = set(page_numbers)
+    rows = (
+        Page.objects
+        .filter(run_id=run.pages_run_id, page_number__gte=page_numbers[0], page_number__lte=page_numbers[-1])
+        .values(*PAGE_FIELDS)
+    )
+    return [row for row in rows if row['page_number'] in wanted]
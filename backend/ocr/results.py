@@ -0,0 +1,144 @@
+"""
+results.py
+
+Per-page storage of OCR job results.
+
+Returning every page from the Celery task puts the whole document (all
+text_blocks with their bbox polygons) into one result blob, which the result
+backend stores and task_status re-parses and re-serializes on every request.
+OCR tasks now write each page to a Redis hash keyed by job id as soon as it is
+done and return a small stub ({'page_count', 'timings', 'pages_stored': True}).
+task_status reads back only the pages a client asks for (?pages=10-20) and
+can drop block fields it doesn't need (?fields=text,rect).
+
+With OCR_RESULT_FORMAT = 'compact' pages are stored in the columnar msgpack
+encoding of ocr/compact.py and only expanded here, when they are read back;
+'json' stores plain JSON. Both can be read whatever the current setting.
+"""
+
+import json
+import logging
+import threading
+
+from django.conf import settings
+
+from .compact import pack_page, unpack_page
+
+logger = logging.getLogger(__name__)
+
+RESULT_PREFIX = 'ocr-result'
+
+# Keys that are always returned, whatever ?fields= asks for
+PAGE_KEYS = ('page_number', 'width', 'height', 'text_source')
+BLOCK_KEYS = ('id',)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            import redis
+
+            url = getattr(settings, 'OCR_RESULT_REDIS_URL', None) or settings.CELERY_RESULT_BACKEND
+            _client = redis.Redis.from_url(url)
+    return _client
+
+
+def _result_key(job_id):
+    return f'{RESULT_PREFIX}:{job_id}'
+
+
+def _encode_page(page_data):
+    if getattr(settings, 'OCR_RESULT_FORMAT', 'json') == 'compact':
+        packed = pack_page(page_data)
+        if packed is not None:
+            return packed
+    return json.dumps(page_data, separators=(',', ':'))
+
+
+def _decode_page(raw, fields=None):
+    # JSON pages always start with '{'; a msgpack map never does
+    if raw[:1] == b'{':
+        return json.loads(raw)
+    return unpack_page(raw, fields)
+
+
+def store_page(job_id, page_data):
+    """
+    Save one page of a job's result. Returns False (after logging) if it couldn't be
+    stored, in which case the task should return its pages inline instead.
+    """
+    if not job_id or not getattr(settings, 'OCR_RESULT_PAGE_STORE', True):
+        return False
+    key = _result_key(job_id)
+    try:
+        pipe = _get_client().pipeline()
+        pipe.hset(key, page_data['page_number'], _encode_page(page_data))
+        pipe.expire(key, getattr(settings, 'OCR_RESULT_TTL', 24 * 3600))
+        pipe.execute()
+        return True
+    except Exception:
+        logger.exception('Storing page %s of %s failed', page_data.get('page_number'), job_id)
+        return False
+
+
+def load_pages(job_id, page_numbers, fields=None):
+    """
+    Return the stored pages of a job among page_numbers, in order. Missing pages are
+    skipped. fields (as from parse_fields) lets compact pages skip expanding block
+    keys that project_page() would drop anyway.
+    """
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return []
+    raw_pages = _get_client().hmget(_result_key(job_id), page_numbers)
+    return [_decode_page(raw, fields) for raw in raw_pages if raw is not None]
+
+
+def parse_page_range(value, page_count):
+    """
+    Parse a ?pages= value such as '10-20', '7', '-5', '30-' or '1-3,8' into sorted
+    1-indexed page numbers, clamped to the document.
+
+    Raises:
+        ValueError: If the value is malformed.
+    """
+    if not value:
+        return list(range(1, page_count + 1))
+
+    pages = set()
+    for part in str(value).split(','):
+        part = part.strip()
+        if '-' in part:
+            first, _, last = part.partition('-')
+            first = int(first) if first.strip() else 1
+            last = int(last) if last.strip() else page_count
+        else:
+            first = last = int(part)
+        if first < 1 or last < first:
+            raise ValueError(f'Invalid page range: {part!r}')
+        pages.update(range(first, min(last, page_count) + 1))
+    return sorted(pages)
+
+
+def parse_fields(value):
+    """Parse a ?fields= value ('text,rect,confidence') into a set of block keys, or None for all."""
+    if not value:
+        return None
+    return {field.strip() for field in str(value).split(',') if field.strip()}
+
+
+def project_page(page_data, fields):
+    """Copy of a page with each text block cut down to fields (None keeps everything)."""
+    if fields is None:
+        return page_data
+    projected = {key: page_data[key] for key in PAGE_KEYS if key in page_data}
+    fields = set(fields).union(BLOCK_KEYS)
+    projected['text_blocks'] = [
+        {key: value for key, value in block.items() if key in fields}
+        for block in page_data.get('text_blocks', [])
+    ]
+    return projected
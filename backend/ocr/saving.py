@@ -0,0 +1,152 @@
+"""
+saving.py
+
+Writing edited PDFs.
+
+A full save (garbage=4, deflate=True) rewrites and recompresses every object in
+the file, so saving one edited word in a large scan costs as much as rewriting
+the scan. With PDF_SAVE_INCREMENTAL the source is copied to the output (a plain
+file copy, no parsing) and the edits are appended to the copy as an incremental
+update that holds only the objects they changed. Save time then follows the
+size of the edit rather than the document.
+
+Incremental updates are never compacted, and the edit font is appended whole
+rather than subset. optimize_file() does the full rewrite as a separate step,
+which the optimize_pdf task runs on demand or PDF_OPTIMIZE_DELAY seconds after
+a save.
+
+Outputs are written to a temporary file next to their final path and moved
+into place, so readers never see a half-written PDF.
+
+Only derived outputs (<name>_edited.pdf, <name>_v<n>.pdf) are ever optimized.
+An upload must keep its bytes: edit session deltas are appended to them, and
+the OCR cache, Document.file_hash and the blob store all know it by its hash.
+"""
+
+import contextlib
+import logging
+import os
+import re
+import shutil
+
+import fitz  # PyMuPDF
+
+from .fonts import has_edit_font, subset_edit_font
+
+logger = logging.getLogger(__name__)
+
+_DERIVED_NAME = re.compile(r'.+(_edited|_v\d+)\.pdf$')
+
+
+def is_derived_output(filename):
+    """True for the names of files written from an upload (saves and materialized versions)."""
+    return bool(_DERIVED_NAME.fullmatch(filename))
+
+
+def derived_output_path(directory, filename):
+    """
+    Path of a derived output named filename inside directory.
+
+    Raises:
+        ValueError: If filename isn't a plain derived output name (an upload, or a
+            path reaching outside directory).
+    """
+    if os.path.basename(filename) != filename or filename in ('.', '..'):
+        raise ValueError('Invalid filename')
+    if not is_derived_output(filename):
+        raise ValueError('Only saved outputs (_edited.pdf, _v<n>.pdf) can be optimized, not uploads')
+    directory = os.path.abspath(directory)
+    path = os.path.abspath(os.path.join(directory, filename))
+    if os.path.dirname(path) != directory:
+        raise ValueError('Invalid filename')
+    return path
+
+
+@contextlib.contextmanager
+def staged_file(path):
+    """
+    Yield a temporary path next to path. It replaces path if the block completes
+    (and the file exists), and is removed otherwise.
+    """
+    tmp_path = f'{path}.{os.urandom(4).hex()}.tmp'
+    try:
+        yield tmp_path
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def open_for_edit(source_path, work_path, incremental=True):
+    """
+    Open the document that edits of source_path will be applied to.
+
+    For an incremental save, source_path is copied to work_path and the copy is
+    opened. Files MuPDF can't update incrementally (e.g. ones it had to repair)
+    fall back to a full save of source_path.
+
+    Returns:
+        tuple: (fitz.Document, whether it can be saved incrementally to work_path)
+    """
+    if incremental:
+        shutil.copyfile(source_path, work_path)
+        doc = fitz.open(work_path)
+        if doc.can_save_incrementally():
+            return doc, True
+        doc.close()
+        logger.info('%s cannot be saved incrementally, doing a full save', source_path)
+    return fitz.open(source_path), False
+
+
+def save_edited(doc, path, incremental, fonts=None):
+    """
+    Save a document opened with open_for_edit() to path (its work_path).
+
+    Args:
+        fonts (DocumentFonts): Registry of the edit font, subset on full saves only.
+    """
+    if incremental:
+        doc.save(path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+        return
+    if fonts is not None:
+        fonts.subset()
+    doc.save(path, garbage=4, deflate=True)
+
+
+def _file_state(path):
+    st = os.stat(path)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def optimize_file(path):
+    """
+    Rewrite a PDF in place with garbage collection, compression and the edit font
+    subset, dropping the history of incremental updates.
+
+    If the file is replaced (e.g. by a newer save) while it is being rewritten,
+    the rewrite is discarded.
+
+    Returns:
+        tuple: (size before, size after, whether the file was replaced)
+
+    Raises:
+        ValueError: If path isn't a derived output, or shares its bytes with another
+            name (a link into the upload blob store).
+    """
+    if not is_derived_output(os.path.basename(path)):
+        raise ValueError(f'{os.path.basename(path)} is not a saved output and is never rewritten')
+    if os.path.islink(path) or os.stat(path).st_nlink > 1:
+        raise ValueError(f'{os.path.basename(path)} is linked to other files and is never rewritten')
+    before = _file_state(path)
+    with staged_file(path) as tmp_path:
+        with fitz.open(path) as doc:
+            if has_edit_font(doc):
+                subset_edit_font(doc)
+            doc.save(tmp_path, garbage=4, deflate=True)
+        if _file_state(path) != before:
+            logger.info('%s changed while being optimized, keeping the newer file', path)
+            os.remove(tmp_path)
+            return before[1], before[1], False
+        size = os.path.getsize(tmp_path)
+    return before[1], size, True
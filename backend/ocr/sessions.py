@@ -0,0 +1,324 @@
+"""
+sessions.py
+
+Versioned edit sessions over an uploaded PDF.
+
+Every save sends the whole change list, and without sessions each save burns all
+of it into a fresh copy of the upload. An EditSession keeps the saves of one
+upload as numbered EditVersions instead:
+
+  - Version n+1 starts from version n and only touches the pages whose edits
+    differ from version n (compared by a signature of each page's edits). Pages
+    edited before are first restored to the upload's objects, then the new edits
+    are burned in. Unchanged pages are reused as they are.
+  - The result is saved as a PDF incremental update, and only the bytes that
+    update appended are stored (EDIT_SESSION_DIR/<session id>/v<n>.delta).
+  - Any version is materialized on demand by concatenating the upload with the
+    deltas up to it. Each delta's xref table points back into the bytes before
+    it, so the concatenation is a valid PDF. The latest version is always
+    materialized as the _edited.pdf that the save returns.
+
+The deltas only make sense on top of the exact bytes of the upload, so the
+session records its size, mtime and SHA-256 and refuses to save or rebuild
+versions once the upload has changed.
+
+Uploads MuPDF can't update incrementally aren't versioned; save_version()
+returns None for them and the caller does a plain full save.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+
+import fitz  # PyMuPDF
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .cache import file_sha256
+from .edit_plan import apply_page_edits
+from .fonts import DocumentFonts
+from .saving import save_edited, staged_file
+
+logger = logging.getLogger(__name__)
+
+_REF = re.compile(r'(\d+) 0 R\b')
+_PARENT_REF = re.compile(r'/Parent\s*\d+ 0 R')
+
+# Attempts at committing a version when another save of the same session wins the race
+SAVE_ATTEMPTS = 3
+
+
+class SessionError(Exception):
+    """A version can't be saved or materialized."""
+
+
+def sessions_enabled():
+    return getattr(settings, 'PDF_EDIT_SESSIONS', True) and getattr(settings, 'PDF_SAVE_INCREMENTAL', True)
+
+
+def session_dir(session_id):
+    root = getattr(settings, 'EDIT_SESSION_DIR', None) or os.path.join(settings.BASE_DIR, 'sessions')
+    return os.path.join(root, str(session_id))
+
+
+def delta_path(session_id, number):
+    return os.path.join(session_dir(session_id), f'v{number}.delta')
+
+
+def page_signature(edits):
+    """Identify the edits of one page. Unlike preview's edit_set_version, drawing order counts."""
+    return hashlib.sha1(repr(tuple(edits)).encode('utf-8')).hexdigest()[:16]
+
+
+def _check_source(session, source_path):
+    """
+    Make sure source_path still holds the bytes the session's deltas were appended
+    to, recording them if the session has no versions yet.
+
+    Raises:
+        SessionError: If the upload changed after its edits were first saved.
+    """
+    st = os.stat(source_path)
+    if session.source_size == st.st_size and session.source_mtime_ns == st.st_mtime_ns:
+        return
+
+    digest = file_sha256(source_path)
+    if session.source_sha256 and digest != session.source_sha256 and session.versions.exists():
+        raise SessionError(
+            f'{os.path.basename(source_path)} changed after its edits were first saved '
+            f'({st.st_size} bytes, sha256 {digest[:12]}, expected {session.source_size} bytes, '
+            f'sha256 {session.source_sha256[:12]}); its saved versions can no longer be rebuilt'
+        )
+    # First save, or the same bytes with a new mtime
+    session.source_size, session.source_mtime_ns, session.source_sha256 = st.st_size, st.st_mtime_ns, digest
+    session.save(update_fields=['source_size', 'source_mtime_ns', 'source_sha256'])
+
+
+def materialize(source_path, version, path):
+    """
+    Write version (an EditVersion, or None for the unedited upload) of source_path to path.
+
+    Returns:
+        int: The size of the written file.
+
+    Raises:
+        SessionError: If the result doesn't have the size recorded for the version,
+            e.g. because the upload or a delta was changed.
+    """
+    shutil.copyfile(source_path, path)
+    if version is None:
+        return os.path.getsize(path)
+
+    with open(path, 'ab') as out:
+        for number in range(1, version.number + 1):
+            with open(delta_path(version.session_id, number), 'rb') as delta:
+                shutil.copyfileobj(delta, out)
+    size = os.path.getsize(path)
+    if size != version.size:
+        raise SessionError(f'Version {version.number} of {source_path} is corrupt ({size} != {version.size} bytes)')
+    return size
+
+
+def _page_objects(doc, page_xref, page_xrefs):
+    """
+    Xrefs of the objects a page is made of: the page itself and everything it refers
+    to, except other pages and the page tree above it (/Parent).
+    """
+    seen, todo = set(), [page_xref]
+    while todo:
+        xref = todo.pop()
+        if xref in seen or not 0 < xref < doc.xref_length():
+            continue
+        seen.add(xref)
+        obj = _PARENT_REF.sub('', doc.xref_object(xref, compressed=True))
+        todo.extend(
+            ref for ref in map(int, _REF.findall(obj)) if ref not in page_xrefs or ref == page_xref
+        )
+    return seen
+
+
+def _changed_objects(doc, source, page_index, page_xrefs):
+    """Xrefs of the objects of an upload page that doc no longer has as they were in the upload."""
+    changed = set()
+    for xref in _page_objects(source, source.page_xref(page_index), page_xrefs):
+        if doc.xref_object(xref, compressed=True) != source.xref_object(xref, compressed=True):
+            changed.add(xref)
+        elif source.xref_is_stream(xref) and (
+            not doc.xref_is_stream(xref) or doc.xref_stream_raw(xref) != source.xref_stream_raw(xref)
+        ):
+            changed.add(xref)
+    return changed
+
+
+def _plan_restore(doc, source, pages, kept_pages):
+    """
+    Work out how to put pages of doc back to the upload: the objects their edits
+    changed, and the pages of kept_pages (which keep their edits) that share one of
+    those objects, e.g. a resource dictionary or an image an edit redacted. Those
+    pages have to be restored and edited again as well.
+
+    Returns:
+        tuple: (set of xrefs to restore, set of extra page indices to edit again)
+    """
+    page_xrefs = {source.page_xref(i) for i in range(source.page_count)}
+    kept_objects = {p: _page_objects(doc, doc.page_xref(p), page_xrefs) for p in kept_pages}
+    objects, redo, todo = set(), set(), list(pages)
+    while todo:
+        objects |= _changed_objects(doc, source, todo.pop(), page_xrefs)
+        for p in list(kept_objects):
+            if kept_objects[p] & objects:
+                del kept_objects[p]
+                redo.add(p)
+                todo.append(p)
+    return objects, redo
+
+
+def _restore_objects(doc, source, xrefs):
+    for xref in xrefs:
+        if source.xref_is_stream(xref):
+            # Copy the stream as stored; update_object() then brings back the /Filter
+            # that update_stream() drops for uncompressed data
+            doc.update_stream(xref, source.xref_stream_raw(xref), compress=False)
+        doc.update_object(xref, source.xref_object(xref, compressed=True))
+
+
+def _copy_page(doc, source, page_index):
+    """Replace a page of doc with a fresh copy of the same page of the upload."""
+    doc.insert_pdf(source, from_page=page_index, to_page=page_index, start_at=page_index)
+    doc.delete_page(page_index + 1)
+
+
+def _same_pages(doc, source):
+    return doc.page_count == source.page_count and all(
+        doc.page_xref(i) == source.page_xref(i) for i in range(doc.page_count)
+    )
+
+
+def save_version(file_path, output_path, plan, changes, progress=None):
+    """
+    Save plan (the compiled changes) as the next version of file_path's session and
+    materialize it at output_path.
+
+    Args:
+        progress (callable): Called with the 0-indexed number of each page being edited.
+
+    Returns:
+        tuple: (EditVersion, whether it was created). The version is the latest one if
+            no page's edits changed, and None if file_path can't be saved incrementally.
+
+    Raises:
+        SessionError: If file_path changed since the session's first version was saved.
+    """
+    from .models import EditSession, EditVersion
+
+    session, _ = EditSession.objects.get_or_create(source_filename=os.path.basename(file_path))
+    _check_source(session, file_path)
+
+    with fitz.open(file_path) as source:
+        if not source.can_save_incrementally():
+            return None, False
+        page_count = source.page_count
+
+    page_edits = {
+        str(p_idx): page_signature(plan.edits_for_page(p_idx))
+        for p_idx in plan.page_indices()
+        if p_idx < page_count
+    }
+
+    for _ in range(SAVE_ATTEMPTS):
+        head = session.versions.order_by('-number').first()
+        head_edits = head.page_edits if head else {}
+        changed = sorted(
+            int(p) for p in set(head_edits) | set(page_edits) if head_edits.get(p) != page_edits.get(p)
+        )
+        number = head.number + 1 if head else 1
+
+        with staged_file(output_path) as work_path:
+            head_size = materialize(file_path, head, work_path)
+            if not changed:
+                return head, False
+
+            doc = fitz.open(work_path)
+            fonts = DocumentFonts(doc)
+            fonts.reuse_existing(doc[int(p)] for p in head_edits)
+            with fitz.open(file_path) as source:
+                restore = [p_idx for p_idx in changed if str(p_idx) in head_edits]
+                if restore and _same_pages(doc, source):
+                    kept = [int(p) for p in head_edits if int(p) not in changed]
+                    objects, redo = _plan_restore(doc, source, restore, kept)
+                    _restore_objects(doc, source, objects)
+                    changed = sorted(set(changed) | redo)
+                else:
+                    for p_idx in restore:
+                        _copy_page(doc, source, p_idx)
+
+                for p_idx in changed:
+                    if progress is not None:
+                        progress(p_idx)
+                    if str(p_idx) in page_edits:
+                        apply_page_edits(doc[p_idx], plan.edits_for_page(p_idx), fonts=fonts)
+            save_edited(doc, work_path, True)
+            doc.close()
+
+            # Keep just what this save appended
+            size = os.path.getsize(work_path)
+            os.makedirs(session_dir(session.id), exist_ok=True)
+            delta = delta_path(session.id, number)
+            with staged_file(delta) as delta_tmp:
+                with open(work_path, 'rb') as src, open(delta_tmp, 'wb') as dst:
+                    src.seek(head_size)
+                    shutil.copyfileobj(src, dst)
+                try:
+                    with transaction.atomic():
+                        version = EditVersion.objects.create(
+                            session=session,
+                            number=number,
+                            size=size,
+                            delta_size=size - head_size,
+                            page_edits=page_edits,
+                            changed_pages=[p + 1 for p in changed],
+                            changes=changes,
+                        )
+                        os.replace(delta_tmp, delta)
+                    return version, True
+                except IntegrityError:
+                    # Another save of this session committed version `number` first; drop this
+                    # attempt (so neither staged file replaces the winner's) and redo on top of it
+                    os.remove(delta_tmp)
+                    os.remove(work_path)
+                    logger.info('Version %s of %s was saved concurrently, retrying', number, session)
+
+    raise SessionError(f'Could not save a new version of {session}: too many concurrent saves')
+
+
+def version_filename(source_filename, number):
+    return source_filename.replace('.pdf', f'_v{number}.pdf')
+
+
+def materialize_version(source_path, number):
+    """
+    Write version number of source_path's session next to it (as <name>_v<n>.pdf)
+    unless it is already there, and return that path (None if there is no such version).
+
+    Raises:
+        SessionError: If the version is corrupt or the upload changed since it was saved.
+    """
+    from .models import EditVersion
+
+    version = (
+        EditVersion.objects
+        .filter(session__source_filename=os.path.basename(source_path), number=number)
+        .first()
+    )
+    if version is None:
+        return None
+
+    path = os.path.join(os.path.dirname(source_path), version_filename(os.path.basename(source_path), number))
+    if os.path.exists(path) and os.path.getsize(path) == version.size:
+        return path
+    _check_source(version.session, source_path)
+    with staged_file(path) as work_path:
+        materialize(source_path, version, work_path)
+    return path
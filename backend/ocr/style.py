@@ -0,0 +1,54 @@
+"""
+style.py
+
+Per-page text style lookup.
+
+detect_style_in_rect() runs page.get_text("dict", clip=rect) for every OCR block,
+i.e. one full text extraction pass per block. PageStyleLookup extracts the text
+dict once per page, indexes the spans by position and answers the same
+(background, foreground, font_size) queries from memory.
+"""
+
+import fitz  # PyMuPDF
+
+from .spatial import SpanIndex
+
+DEFAULT_STYLE = ((1, 1, 1), (0, 0, 0), 12)  # White background, black text, 12pt
+
+
+class PageStyleLookup:
+    """
+    Answers detect_style_in_rect() queries for one page from a single text extraction.
+
+    Args:
+        page (fitz.Page): The page to index.
+        text_dict (dict): An already extracted page.get_text("dict") result to reuse.
+
+    A span matches a rect when their boxes overlap, and the first matching span in
+    page order provides the style, as the first span of a clipped extraction does.
+    """
+
+    def __init__(self, page, text_dict=None):
+        if text_dict is None:
+            try:
+                text_dict = page.get_text("dict")
+            except Exception:
+                text_dict = {}
+
+        spans = []
+        for block in text_dict.get("blocks", []):
+            if block["type"] != 0:  # 0 is text block
+                continue
+            for line in block.get("lines", []):
+                spans.extend(line.get("spans", []))
+        self._index = SpanIndex(spans)
+
+    def style(self, rect):
+        """Return (background_rgb, foreground_rgb, font_size) for a fitz.Rect in page coordinates."""
+        bg, fg, font_size = DEFAULT_STYLE
+        span = self._index.first_overlap(tuple(rect))
+        if span is not None:
+            # PyMuPDF colors are integers; convert to RGB tuple
+            fg = fitz.sRGB_to_pdf(span.get('color', 0))
+            font_size = span.get('size', 12)
+        return bg, fg, font_size
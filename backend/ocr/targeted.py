@@ -0,0 +1,222 @@
+"""
+targeted.py
+
+Helpers for OCR of user-selected regions rather than whole pages.
+
+When a user lassoes several regions, running one EasyOCR pass per region means
+paying the detector and recognizer overhead over and over on tiny images.
+stitch_crops() lays the region crops out on shared white sheets so a whole
+batch goes through the model in a few readtext() calls. assign_results() then
+maps each detection back to the crop it came from. build_blocks() turns
+crop-relative detections into the blocks the frontend expects, in 150-DPI
+page pixels.
+
+render_region() renders just the padded region straight from the PDF with a
+fitz clip instead of rasterizing the whole page and cropping it. Small regions
+are rendered above 150 DPI, up to OCR_TARGETED_MAX_DPI, which helps EasyOCR on
+small text. Because the clip and zoom are derived from the 150-DPI pixel grid,
+detections map back onto that grid exactly.
+"""
+
+import math
+
+import fitz  # PyMuPDF
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+OCR_DPI = 150
+CROP_PADDING = 2  # Pixels of context around each region
+SHEET_GAP = 32  # Blank rows between stitched crops, so detections never bridge two regions
+SHEET_MAX_HEIGHT = 2560  # EasyOCR's default canvas_size; taller sheets would be downscaled
+
+
+def crop_box(rect, width, height, pad=CROP_PADDING):
+    """
+    Padded crop box (left, upper, right, lower) for a region, clamped to the image.
+
+    Args:
+        rect (dict): {x, y, width, height} in 150-DPI page pixels.
+        width, height (int): Size of the page image.
+    """
+    rx, ry, rw, rh = int(rect['x']), int(rect['y']), int(rect['width']), int(rect['height'])
+    return (
+        max(0, rx - pad),
+        max(0, ry - pad),
+        min(width, rx + rw + pad),
+        min(height, ry + rh + pad)
+    )
+
+
+def page_pixel_size(pdf_page):
+    """(width, height) of a page in 150-DPI pixels, the grid poppler and native_page_data use."""
+    return (
+        math.ceil(pdf_page.rect.width * OCR_DPI / 72),
+        math.ceil(pdf_page.rect.height * OCR_DPI / 72)
+    )
+
+
+def region_scale(box, min_height=None, max_dpi=None, max_side=SHEET_MAX_HEIGHT):
+    """
+    Render scale relative to 150 DPI for a crop box: regions shorter than
+    OCR_TARGETED_MIN_HEIGHT_PX are enlarged until they reach it, without going past
+    OCR_TARGETED_MAX_DPI or making either side longer than max_side pixels.
+    """
+    if min_height is None:
+        min_height = getattr(settings, 'OCR_TARGETED_MIN_HEIGHT_PX', 96)
+    if max_dpi is None:
+        max_dpi = getattr(settings, 'OCR_TARGETED_MAX_DPI', 600)
+    width, height = max(1, box[2] - box[0]), max(1, box[3] - box[1])
+    scale = min(min_height / height, max_dpi / OCR_DPI, max_side / max(width, height))
+    return max(1.0, scale)
+
+
+def render_region(pdf_page, rect, page_size=None, scale=None):
+    """
+    Render only a region of a page (plus padding) for OCR.
+
+    Args:
+        pdf_page (fitz.Page): The page.
+        rect (dict): {x, y, width, height} in 150-DPI page pixels.
+        page_size (tuple): The page in 150-DPI pixels, defaults to page_pixel_size().
+        scale (float): Render scale relative to 150 DPI, defaults to region_scale().
+
+    Returns:
+        (PIL.Image.Image, origin, scale): origin is the image's top-left corner in
+            150-DPI page pixels and scale the 150-DPI pixels per image pixel, as
+            build_blocks() expects them.
+    """
+    if page_size is None:
+        page_size = page_pixel_size(pdf_page)
+    box = crop_box(rect, page_size[0], page_size[1])
+    if scale is None:
+        scale = region_scale(box)
+
+    page_rect = pdf_page.rect
+    scale_x = page_rect.width / page_size[0]  # PDF points per 150-DPI pixel
+    scale_y = page_rect.height / page_size[1]
+    clip = fitz.Rect(
+        page_rect.x0 + box[0] * scale_x,
+        page_rect.y0 + box[1] * scale_y,
+        page_rect.x0 + box[2] * scale_x,
+        page_rect.y0 + box[3] * scale_y
+    )
+    # Maps PDF points straight onto the 150-DPI grid enlarged by scale
+    matrix = fitz.Matrix(scale / scale_x, scale / scale_y)
+    pix = pdf_page.get_pixmap(matrix=matrix, clip=clip, alpha=False)
+    img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    origin = (
+        pix.x / scale - page_rect.x0 / scale_x,
+        pix.y / scale - page_rect.y0 / scale_y
+    )
+    return img, origin, 1 / scale
+
+
+def stitch_crops(crops, gap=SHEET_GAP, max_height=SHEET_MAX_HEIGHT):
+    """
+    Stack crops top to bottom on white RGB sheets no taller than max_height (a crop
+    taller than that gets a sheet of its own).
+
+    Args:
+        crops (list): PIL images.
+
+    Returns:
+        list of (sheet, placements): sheet is an (H, W, 3) uint8 array and placements
+            a list of (crop_index, y_offset, height) for the crops on it.
+    """
+    layouts = []
+    current, current_height = [], 0
+    for index, crop in enumerate(crops):
+        needed = crop.height if not current else current_height + gap + crop.height
+        if current and needed > max_height:
+            layouts.append(current)
+            current, current_height = [], 0
+            needed = crop.height
+        current.append((index, needed - crop.height))
+        current_height = needed
+    if current:
+        layouts.append(current)
+
+    sheets = []
+    for layout in layouts:
+        height = max(offset + crops[index].height for index, offset in layout)
+        width = max(crops[index].width for index, _ in layout)
+        sheet = np.full((height, width, 3), 255, dtype=np.uint8)
+        placements = []
+        for index, offset in layout:
+            crop = np.asarray(crops[index].convert('RGB'))
+            sheet[offset:offset + crop.shape[0], :crop.shape[1]] = crop
+            placements.append((index, offset, crop.shape[0]))
+        sheets.append((sheet, placements))
+    return sheets
+
+
+def assign_results(results, placements):
+    """
+    Map readtext() detections on a sheet back to their crops.
+
+    Yields:
+        (crop_index, (bbox, text, conf)) with bbox relative to the crop. Detections
+        whose centre falls in a gap are dropped.
+    """
+    for bbox, text, conf in results:
+        center_y = sum(pt[1] for pt in bbox) / len(bbox)
+        for index, offset, height in placements:
+            if offset <= center_y < offset + height:
+                yield index, ([[pt[0], pt[1] - offset] for pt in bbox], text, conf)
+                break
+
+
+def _hex(rgb):
+    return '#{:02x}{:02x}{:02x}'.format(int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
+
+
+def build_blocks(results, origin, page_size, pdf_page, style_lookup, scale=1.0):
+    """
+    Convert crop-relative readtext() detections to targeted OCR blocks.
+
+    Args:
+        results (list): (bbox, text, conf) tuples, bbox points relative to the crop.
+        origin (tuple): Crop's top-left corner in 150-DPI page pixels.
+        page_size (tuple): (width, height) of the page in 150-DPI pixels.
+        pdf_page (fitz.Page): Page the crop came from.
+        style_lookup (PageStyleLookup): Style lookup for pdf_page.
+        scale (float): 150-DPI page pixels per crop pixel, for crops rendered at another DPI.
+
+    Returns:
+        list: Block dicts with text, confidence, rect (150-DPI pixels), colours and font size.
+    """
+    page_rect = pdf_page.rect
+    scale_x = page_rect.width / page_size[0]
+    scale_y = page_rect.height / page_size[1]
+
+    blocks = []
+    for bbox, text, conf in results:
+        # Adjust bbox back to full page coordinates
+        clean_bbox = [[int(origin[0] + pt[0] * scale), int(origin[1] + pt[1] * scale)] for pt in bbox]
+
+        x_coords = [pt[0] for pt in clean_bbox]
+        y_coords = [pt[1] for pt in clean_bbox]
+        bx = min(x_coords)
+        by = min(y_coords)
+        bw = max(x_coords) - bx
+        bh = max(y_coords) - by
+
+        pdf_rect = (
+            bx * scale_x + page_rect.x0,
+            by * scale_y + page_rect.y0,
+            (bx + bw) * scale_x + page_rect.x0,
+            (by + bh) * scale_y + page_rect.y0
+        )
+        bg_rgb, fg_rgb, font_size = style_lookup.style(pdf_rect)
+
+        blocks.append({
+            'text': text,
+            'confidence': float(conf),
+            'rect': {'x': bx, 'y': by, 'width': bw, 'height': bh},
+            'fg_color': _hex(fg_rgb),
+            'bg_color': _hex(bg_rgb),
+            'font_size': font_size * (OCR_DPI / 72)
+        })
+    return blocks
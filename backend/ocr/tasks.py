@@ -1,206 +1,490 @@
-from celery import shared_task
-import easyocr
-from pdf2image import convert_from_path
+import logging
+from celery import chord, group, shared_task
+from celery.utils import uuid
+from django.conf import settings
 import numpy as np
 import os
 import fitz  # PyMuPDF
+from .cache import cache_contains, cache_get, cache_set, file_sha256, get_ocr_cache, ocr_engine_version, page_cache_key
+from .edit_plan import apply_page_edits, compile_edit_plan
+from .engines import get_engine
+from .events import EventTask, publish_event
+from .fonts import DocumentFonts
+from .native_text import try_native_page
 from .ocr_editor_backend import process_pil_image
+from .rasterize import iter_page_images
+from .records import RunRecorder, fail_run, finish_run
+from .results import store_page
+from .saving import open_for_edit, optimize_file, save_edited, staged_file
+from .sessions import save_version, sessions_enabled
+from .spatial import SpanIndex
+from .style import PageStyleLookup
+from .targeted import assign_results, build_blocks, page_pixel_size, render_region, stitch_crops
 
+logger = logging.getLogger(__name__)
 
-@shared_task(bind=True)
-def ocr_process_pdf(self, file_path):
+
+class UnreadablePDF(ValueError):
+    """The uploaded file can't be opened as a PDF."""
+
+
+class OcrJobTask(EventTask):
+    """
+    EventTask for the tasks of an OCR job, which also records the job's outcome on
+    its OcrRun (see records.py), if it has one.
+    """
+
+    def on_success(self, retval, task_id, args, kwargs):
+        super().on_success(retval, task_id, args, kwargs)
+        if self.job_id == task_id:
+            finish_run(task_id, retval)
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        super().on_failure(exc, task_id, args, kwargs, einfo)
+        # A failed chord member means the merge never runs, so fail the whole job here
+        fail_run(self.job_id, exc)
+
+
+def _build_page_data(results, img, doc, i):
+    """
+    Turn OCR results for one rendered page into the page_data dict served to the editor.
+
+    Args:
+        results (list): [bbox, text, confidence] triples for the page image (see engines.py).
+        img (PIL.Image.Image): The rendered page (150 DPI, CropBox).
+        doc (fitz.Document): The open PDF, used for color detection and native text.
+        i (int): 0-indexed page number.
+    """
+    page_data = {
+        'page_number': i + 1,
+        'width': img.width,
+        'height': img.height,
+        'text_source': 'ocr',
+        'text_blocks': []
+    }
+
+    # Get the corresponding PDF page for color detection and native text
+    if i < len(doc):
+        pdf_page = doc[i]
+        # Calculate scale factors: PDF points / Image pixels
+        scale_x = pdf_page.rect.width / img.width
+        scale_y = pdf_page.rect.height / img.height
+
+        # Extract native text spans for alignment
+        native_dict = pdf_page.get_text("dict")
+        native_spans = []
+        for b in native_dict.get("blocks", []):
+            if b["type"] == 0:  # Text block
+                for l in b.get("lines", []):
+                    for s in l.get("spans", []):
+                        native_spans.append(s)
+        span_index = SpanIndex(native_spans)
+        style_lookup = PageStyleLookup(pdf_page, text_dict=native_dict)
+    else:
+        pdf_page = None
+        scale_x = 1.0
+        scale_y = 1.0
+        native_spans = []
+
+    for bbox, text, conf in results:
+        # Clean up data for JSON serialization (numpy ints/floats to python native)
+        # bbox is a list of 4 points: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+        clean_bbox = [[int(pt[0]), int(pt[1])] for pt in bbox]
+
+        # Calculate bounding box rectangle from polygon points
+        x_coords = [pt[0] for pt in clean_bbox]
+        y_coords = [pt[1] for pt in clean_bbox]
+
+        rect_x = min(x_coords)
+        rect_y = min(y_coords)
+        rect_w = max(x_coords) - rect_x
+        rect_h = max(y_coords) - rect_y
+
+        # Detect Colors and potentially refine coordinates from native text
+        fg_color = '#000000' # Default Black
+        bg_color = '#ffffff' # Default White
+        font_size = rect_h * 0.8 # Default fallback
+        text_align = 'left'
+
+        # REFINEMENT: Match OCR text with native PDF spans
+        matched_span = None
+        if native_spans:
+            # Match based on spatial overlap and text content similarity
+            # We look for a native span that roughly overlaps with our OCR rect
+            ocr_rect_pdf = fitz.Rect(
+                rect_x * scale_x, 
+                rect_y * scale_y, 
+                (rect_x + rect_w) * scale_x, 
+                (rect_y + rect_h) * scale_y
+            )
+
+            # Only spans near the OCR rect are considered; text check is fuzzy-ish containment
+            matched_span = span_index.best_match(tuple(ocr_rect_pdf), text)
+
+        if matched_span:
+            # USE NATIVE COORDINATES (converted back to OCR pixels)
+            # This provides pixel-perfect alignment for existing text
+            # We must subtract the page origin (x0, y0) because the image is the CropBox area
+            s_bbox = matched_span["bbox"]
+            rect_x = (s_bbox[0] - pdf_page.rect.x0) / scale_x
+            rect_y = (s_bbox[1] - pdf_page.rect.y0) / scale_y
+            rect_w = (s_bbox[2] - s_bbox[0]) / scale_x
+            rect_h = (s_bbox[3] - s_bbox[1]) / scale_y
+
+            # Use native style
+            font_size = matched_span.get('size', 12) * (150 / 72)
+            color_int = matched_span.get('color', 0)
+            fg_rgb = fitz.sRGB_to_pdf(color_int)
+            fg_color = '#{:02x}{:02x}{:02x}'.format(
+                int(fg_rgb[0] * 255), int(fg_rgb[1] * 255), int(fg_rgb[2] * 255)
+            )
+
+            # Sample background around the native rect
+            bg_rgb, _, _ = style_lookup.style(fitz.Rect(s_bbox))
+            bg_color = '#{:02x}{:02x}{:02x}'.format(
+                int(bg_rgb[0] * 255), int(bg_rgb[1] * 255), int(bg_rgb[2] * 255)
+            )
+        elif pdf_page:
+            # Fallback to the page style lookup if no direct span match
+            # We must add the page origin as rect_x/y are relative to the image (CropBox)
+            pdf_rect = fitz.Rect(
+                rect_x * scale_x + pdf_page.rect.x0,
+                rect_y * scale_y + pdf_page.rect.y0,
+                (rect_x + rect_w) * scale_x + pdf_page.rect.x0,
+                (rect_y + rect_h) * scale_y + pdf_page.rect.y0
+            )
+
+            bg_rgb, fg_rgb, detected_font_size = style_lookup.style(pdf_rect)
+
+            fg_color = '#{:02x}{:02x}{:02x}'.format(
+                int(fg_rgb[0] * 255), int(fg_rgb[1] * 255), int(fg_rgb[2] * 255)
+            )
+            bg_color = '#{:02x}{:02x}{:02x}'.format(
+                int(bg_rgb[0] * 255), int(bg_rgb[1] * 255), int(bg_rgb[2] * 255)
+            )
+            font_size = detected_font_size * (150 / 72)
+
+        page_data['text_blocks'].append({
+            'id': f'page{i+1}_block{len(page_data["text_blocks"])}',
+            'text': text,
+            'confidence': float(conf),
+            'bbox': clean_bbox,
+            'fg_color': fg_color,
+            'bg_color': bg_color,
+            'font_size': font_size,
+            'text_align': text_align,
+            # Simplified rectangle for easier positioning
+            'rect': {
+                'x': rect_x,
+                'y': rect_y,
+                'width': rect_w,
+                'height': rect_h
+            }
+        })
+
+    return page_data
+
+
+def _ocr_page_range(task, file_path, first_page, last_page, file_digest=None, engine=None):
+    """
+    OCR pages first_page..last_page (1-indexed, inclusive) with the named engine
+    (OCR_ENGINE if None), reporting progress on task (an EventTask) and publishing
+    each page as a 'page' event once it is ready. A last_page of None means the end
+    of the document.
+
+    Pages already in the OCR result cache are returned without rendering them, and
+    pages with a sufficient native text layer are built from their spans without
+    OCR. Freshly processed pages are added to the cache.
+
+    Each page is recorded in the job's OcrRun (in batches, see records.RunRecorder)
+    or, for jobs without one, written to the per-page result store as soon as it is
+    done, and then dropped from memory. Only pages that couldn't be stored are returned.
+
+    Returns:
+        tuple: (list of page_data dicts that weren't stored, total page count of the
+            document, reader timings)
+    """
+    # Update task state to PROCESSING
+    task.update_state(state='PROCESSING', meta={'status': 'Initializing OCR engine...'})
+
+    # Open PDF with PyMuPDF for page count, color detection and native text
+    engine = get_engine(engine)
+    doc = fitz.open(file_path)
+    page_count = len(doc)
+    last_page = page_count if last_page is None else min(last_page, page_count)
+    pages_total = max(0, last_page - first_page + 1)
+    pages_by_number = {}  # page_number -> page_data, or None once stored
+    recorder = RunRecorder(task.job_id, page_count)
+
+    def keep_inline(pages):
+        for page in pages:
+            pages_by_number[page['page_number']] = page
+
+    def page_done(page_number, page_data):
+        task.publish('page', page_data)
+        if recorder.active:
+            pages_by_number[page_number] = None
+            keep_inline(recorder.add(page_data))
+        else:
+            pages_by_number[page_number] = None if store_page(task.job_id, page_data) else page_data
+
+    # Consult the content-addressed cache before rendering anything
+    cache = get_ocr_cache()
+    cache_keys = {}
+    if cache is not None:
+        file_digest = file_digest or file_sha256(file_path)
+        engine_version = engine.version
+        for page_number in range(first_page, last_page + 1):
+            cache_keys[page_number] = page_cache_key(file_digest, page_number - 1, 150, engine_version)
+            cached = cache_get(cache, cache_keys[page_number])
+            if cached is not None:
+                page_done(page_number, cached)
+
+    # Born-digital pages come straight from their text layer; only the rest are OCR'd
+    min_coverage = getattr(settings, 'OCR_NATIVE_TEXT_MIN_COVERAGE', 0.6)
+    max_image_area = getattr(settings, 'OCR_NATIVE_TEXT_MAX_IMAGE_AREA', 0.05)
+    missing = []
+    for page_number in range(first_page, last_page + 1):
+        if page_number in pages_by_number:
+            continue
+        page_data = try_native_page(doc[page_number - 1], page_number, min_coverage, max_image_area)
+        if page_data is None:
+            missing.append(page_number)
+            continue
+        page_done(page_number, page_data)
+        if cache is not None:
+            cache_set(cache, cache_keys[page_number], page_data)
+
+    reader_timing = None
+    if missing:
+        # EasyOCR's Reader is shared by every task of the worker process (see reader_pool.py)
+        reader_timing = engine.load()
+        logger.info('OCR engine %(engine)s %(reader_path)s in %(reader_seconds)ss', reader_timing)
+
+    # With OCR_RECOGNITION_BATCH_PAGES > 1, pages are OCR'd in groups so the engine can
+    # batch recognition across them (see engines.EasyOcrEngine.readtext_batch). The
+    # pages of a group are published and cached together once the group is done.
+    batch_pages = max(1, getattr(settings, 'OCR_RECOGNITION_BATCH_PAGES', 1))
+    batch = []  # (page_number, PIL image) waiting for OCR
+
+    def ocr_batch():
+        if batch_pages == 1:
+            results = [engine.readtext(np.array(img)) for _, img in batch]
+        else:
+            # Each page is converted to a numpy array only while the engine detects its lines
+            results = engine.readtext_batch(np.array(img) for _, img in batch)
+        for (page_number, img), page_results in zip(batch, results):
+            page_data = _build_page_data(page_results, img, doc, page_number - 1)
+            page_done(page_number, page_data)
+            if cache is not None:
+                cache_set(cache, cache_keys[page_number], page_data)
+        # Free the rendered pages before the next ones are produced
+        batch.clear()
+
+    # Render pages one at a time (using CropBox to match visible coordinates)
+    # so memory stays bounded by OCR_RASTER_IN_FLIGHT_PAGES plus the pages of one
+    # batch, not document length
+    for page_number, img in iter_page_images(file_path, missing, dpi=150):
+        if img is None:
+            continue
+
+        # Update progress
+        task.update_state(
+            state='PROCESSING',
+            meta={
+                'status': f'Processing page {page_number} of {page_count}...',
+                'pages_done': len(pages_by_number),
+                'pages_total': pages_total,
+            }
+        )
+
+        batch.append((page_number, img))
+        del img
+        if len(batch) >= batch_pages:
+            ocr_batch()
+    if batch:
+        ocr_batch()
+
+    keep_inline(recorder.flush())
+    doc.close()
+    pages = [pages_by_number[n] for n in sorted(pages_by_number) if pages_by_number[n] is not None]
+    return pages, page_count, reader_timing
+
+
+@shared_task(bind=True, base=OcrJobTask, events_omit=('pages',))
+def ocr_process_pdf(self, file_path, file_digest=None, engine=None):
     """
-    Celery task to process a PDF file using EasyOCR.
+    Celery task to process a PDF file using OCR.
     
     Args:
         file_path (str): Absolute path to the uploaded PDF file.
+        file_digest (str): SHA-256 of the file, if the caller already has it.
+        engine (str): OCR engine name (see engines.py), OCR_ENGINE if None.
         
     Returns:
         dict: Structured data containing text, confidence scores, and bounding boxes per page.
+            Pages written to the per-page result store are left out of 'pages' and
+            'pages_stored' is set; task_status reads them back (see results.py).
     """
     if not os.path.exists(file_path):
         return {'error': f'File not found: {file_path}'}
 
     try:
-        # Update task state to PROCESSING
-        self.update_state(state='PROCESSING', meta={'status': 'Initializing OCR engine...'})
-        
-        # Initialize EasyOCR Reader
-        # Note: 'gpu=False' is safer for standard servers; set to True if you have CUDA setup.
-        reader = easyocr.Reader(['en'], gpu=False)
-
-        # Update state
-        self.update_state(state='PROCESSING', meta={'status': 'Converting PDF to images...'})
-        
-        # Convert PDF pages to images (using CropBox to match visible coordinates)
-        images = convert_from_path(file_path, dpi=150, use_cropbox=True)
-        
-        output = {
-            'page_count': len(images),
-            'pages': []
+        pages, page_count, reader_timing = _ocr_page_range(self, file_path, 1, None, file_digest, engine)
+        return {
+            'page_count': page_count,
+            'pages': pages,
+            'pages_stored': len(pages) < page_count,
+            'timings': reader_timing,
         }
 
-        # Open PDF with PyMuPDF for color detection
-        doc = fitz.open(file_path)
+    except Exception as e:
+        return {'error': str(e)}
 
-        for i, img in enumerate(images):
-            # Update progress
-            self.update_state(
-                state='PROCESSING', 
-                meta={'status': f'Processing page {i + 1} of {len(images)}...'}
-            )
-            
-            # Convert PIL image to numpy array for EasyOCR
-            img_array = np.array(img)
-            
-            # Run OCR - detail=1 returns [bbox, text, confidence]
-            results = reader.readtext(img_array)
-            
-            page_data = {
-                'page_number': i + 1,
-                'width': img.width,
-                'height': img.height,
-                'text_blocks': []
-            }
 
-            # Get the corresponding PDF page for color detection and native text
-            if i < len(doc):
-                pdf_page = doc[i]
-                # Calculate scale factors: PDF points / Image pixels
-                scale_x = pdf_page.rect.width / img.width
-                scale_y = pdf_page.rect.height / img.height
-                
-                # Extract native text spans for alignment
-                native_dict = pdf_page.get_text("dict")
-                native_spans = []
-                for b in native_dict.get("blocks", []):
-                    if b["type"] == 0:  # Text block
-                        for l in b.get("lines", []):
-                            for s in l.get("spans", []):
-                                native_spans.append(s)
-            else:
-                pdf_page = None
-                scale_x = 1.0
-                scale_y = 1.0
-                native_spans = []
-
-            for bbox, text, conf in results:
-                # Clean up data for JSON serialization (numpy ints/floats to python native)
-                # bbox is a list of 4 points: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
-                clean_bbox = [[int(pt[0]), int(pt[1])] for pt in bbox]
-                
-                # Calculate bounding box rectangle from polygon points
-                x_coords = [pt[0] for pt in clean_bbox]
-                y_coords = [pt[1] for pt in clean_bbox]
-                
-                rect_x = min(x_coords)
-                rect_y = min(y_coords)
-                rect_w = max(x_coords) - rect_x
-                rect_h = max(y_coords) - rect_y
-
-                # Detect Colors and potentially refine coordinates from native text
-                fg_color = '#000000' # Default Black
-                bg_color = '#ffffff' # Default White
-                font_size = rect_h * 0.8 # Default fallback
-                text_align = 'left'
-                
-                # REFINEMENT: Match OCR text with native PDF spans
-                matched_span = None
-                if native_spans:
-                    # Match based on spatial overlap and text content similarity
-                    # We look for a native span that roughly overlaps with our OCR rect
-                    ocr_rect_pdf = fitz.Rect(
-                        rect_x * scale_x, 
-                        rect_y * scale_y, 
-                        (rect_x + rect_w) * scale_x, 
-                        (rect_y + rect_h) * scale_y
-                    )
-                    
-                    best_overlap = 0
-                    for span in native_spans:
-                        span_rect = fitz.Rect(span["bbox"])
-                        intersect = ocr_rect_pdf & span_rect
-                        if not intersect.is_empty:
-                            overlap = intersect.width * intersect.height
-                            if overlap > best_overlap:
-                                # String overlap check (fuzzy-ish)
-                                if span["text"].strip() in text or text in span["text"].strip():
-                                    best_overlap = overlap
-                                    matched_span = span
-
-                if matched_span:
-                    # USE NATIVE COORDINATES (converted back to OCR pixels)
-                    # This provides pixel-perfect alignment for existing text
-                    # We must subtract the page origin (x0, y0) because the image is the CropBox area
-                    s_bbox = matched_span["bbox"]
-                    rect_x = (s_bbox[0] - pdf_page.rect.x0) / scale_x
-                    rect_y = (s_bbox[1] - pdf_page.rect.y0) / scale_y
-                    rect_w = (s_bbox[2] - s_bbox[0]) / scale_x
-                    rect_h = (s_bbox[3] - s_bbox[1]) / scale_y
-                    
-                    # Use native style
-                    font_size = matched_span.get('size', 12) * (150 / 72)
-                    color_int = matched_span.get('color', 0)
-                    fg_rgb = fitz.sRGB_to_pdf(color_int)
-                    fg_color = '#{:02x}{:02x}{:02x}'.format(
-                        int(fg_rgb[0] * 255), int(fg_rgb[1] * 255), int(fg_rgb[2] * 255)
-                    )
-                    
-                    # Sample background around the native rect
-                    bg_rgb, _, _ = detect_style_in_rect(pdf_page, fitz.Rect(s_bbox))
-                    bg_color = '#{:02x}{:02x}{:02x}'.format(
-                        int(bg_rgb[0] * 255), int(bg_rgb[1] * 255), int(bg_rgb[2] * 255)
-                    )
-                elif pdf_page:
-                    # Fallback to current detect_style_in_rect if no direct span match
-                    # We must add the page origin as rect_x/y are relative to the image (CropBox)
-                    pdf_rect = fitz.Rect(
-                        rect_x * scale_x + pdf_page.rect.x0,
-                        rect_y * scale_y + pdf_page.rect.y0,
-                        (rect_x + rect_w) * scale_x + pdf_page.rect.x0,
-                        (rect_y + rect_h) * scale_y + pdf_page.rect.y0
-                    )
-                    
-                    bg_rgb, fg_rgb, detected_font_size = detect_style_in_rect(pdf_page, pdf_rect)
-                    
-                    fg_color = '#{:02x}{:02x}{:02x}'.format(
-                        int(fg_rgb[0] * 255), int(fg_rgb[1] * 255), int(fg_rgb[2] * 255)
-                    )
-                    bg_color = '#{:02x}{:02x}{:02x}'.format(
-                        int(bg_rgb[0] * 255), int(bg_rgb[1] * 255), int(bg_rgb[2] * 255)
-                    )
-                    font_size = detected_font_size * (150 / 72)
-
-                page_data['text_blocks'].append({
-                    'id': f'page{i+1}_block{len(page_data["text_blocks"])}',
-                    'text': text,
-                    'confidence': float(conf),
-                    'bbox': clean_bbox,
-                    'fg_color': fg_color,
-                    'bg_color': bg_color,
-                    'font_size': font_size,
-                    'text_align': text_align,
-                    # Simplified rectangle for easier positioning
-                    'rect': {
-                        'x': rect_x,
-                        'y': rect_y,
-                        'width': rect_w,
-                        'height': rect_h
-                    }
-                })
-            
-            output['pages'].append(page_data)
-        
-        doc.close()
+@shared_task(bind=True, base=OcrJobTask)
+def ocr_process_page_range(self, file_path, first_page, last_page, file_digest=None, job_id=None, engine=None):
+    """
+    Chord member: OCR one page range of a document fanned out by start_ocr().
 
-        return output
+    Args:
+        file_path (str): Absolute path to the uploaded PDF file.
+        first_page (int): First 1-indexed page to process.
+        last_page (int): Last 1-indexed page to process (inclusive).
+        file_digest (str): SHA-256 of the file, so each subtask doesn't hash it again.
+        job_id (str): Id of the whole job, whose event stream gets this range's progress and pages.
+        engine (str): OCR engine name, as for ocr_process_pdf.
+    """
+    if not os.path.exists(file_path):
+        return {'error': f'File not found: {file_path}'}
+
+    try:
+        pages, _, reader_timing = _ocr_page_range(self, file_path, first_page, last_page, file_digest, engine)
+        return {
+            'first_page': first_page,
+            'last_page': last_page,
+            'pages': pages,
+            'pages_stored': len(pages) < last_page - first_page + 1,
+            'timings': reader_timing,
+        }
 
     except Exception as e:
         return {'error': str(e)}
 
 
-@shared_task(bind=True)
-def ocr_targeted_crop(self, file_path, page_num, rect):
+@shared_task(bind=True, base=OcrJobTask, events_omit=('pages',))
+def merge_ocr_results(self, range_results, page_count):
+    """
+    Chord callback: merge page-range results back into the ocr_process_pdf schema.
+
+    Block ids are derived from the page number and position on the page, so they
+    are identical to what a single serial task would have produced.
+    """
+    errors = [r['error'] for r in range_results if r.get('error')]
+    if errors:
+        return {'error': '; '.join(errors)}
+
+    # Normally only pages the subtasks couldn't store are left here
+    pages = [page for r in range_results for page in r['pages']]
+    pages.sort(key=lambda page: page['page_number'])
+    return {
+        'page_count': page_count,
+        'pages': pages,
+        'pages_stored': any(r.get('pages_stored') for r in range_results),
+        'timings': _merge_timings([r.get('timings') for r in range_results]),
+    }
+
+
+def _merge_timings(timings):
+    """
+    Combine the reader timings of page-range subtasks into the single-task schema:
+    'cold' if any subtask loaded its engine, the slowest load, and the sum of any
+    counters (e.g. AutoEngine's 'fallback_pages'). None if no subtask ran OCR.
+    """
+    timings = [t for t in timings if t]
+    if not timings:
+        return None
+    merged = dict(timings[0])
+    for timing in timings[1:]:
+        for key, value in timing.items():
+            if key.endswith('reader_path'):
+                merged[key] = 'cold' if 'cold' in (merged.get(key), value) else value
+            elif key.endswith('reader_seconds'):
+                merged[key] = max(merged.get(key, 0.0), value)
+            elif isinstance(value, int) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+
+def _fully_cached(file_path, page_count, file_digest=None, engine=None):
+    """True if every page of the file is already in the OCR result cache of the engine."""
+    cache = get_ocr_cache()
+    if cache is None:
+        return False
+    file_digest = file_digest or file_sha256(file_path)
+    engine_version = ocr_engine_version(engine)
+    # Existence checks only: the pages are read (and their recency refreshed) by the task
+    return all(
+        cache_contains(cache, page_cache_key(file_digest, i, 150, engine_version))
+        for i in range(page_count)
+    )
+
+
+def start_ocr(file_path, file_digest=None, task_id=None, engine=None):
+    """
+    Queue OCR for an uploaded PDF and return the AsyncResult the client should poll.
+    task_id fixes the id of that result (e.g. an OcrRun's), file_digest saves hashing
+    the file again if the caller already has it, and engine names the OCR engine
+    (OCR_ENGINE if None).
+
+    Short or fully cached documents run as a single ocr_process_pdf task. Longer ones are split into
+    OCR_PAGES_PER_SUBTASK-sized ranges that run in parallel as a chord, merged by
+    merge_ocr_results. The merge task's id is returned; until it finishes, its state
+    is PROCESSING with the list of subtasks so task_status can aggregate progress.
+
+    Raises:
+        UnreadablePDF: If the file can't be opened as a PDF; nothing is queued.
+    """
+    try:
+        with fitz.open(file_path) as doc:
+            page_count = len(doc)
+    except RuntimeError as e:  # fitz.FileDataError, EmptyFileError
+        raise UnreadablePDF(f'Not a readable PDF: {e}') from e
+
+    chunk = max(1, getattr(settings, 'OCR_PAGES_PER_SUBTASK', 10))
+    if page_count <= chunk or _fully_cached(file_path, page_count, file_digest, engine):
+        return ocr_process_pdf.apply_async((file_path, file_digest, engine), task_id=task_id)
+    if file_digest is None and get_ocr_cache() is not None:
+        file_digest = file_sha256(file_path)
+
+    subtasks = [
+        {'id': uuid(), 'first_page': first, 'last_page': min(first + chunk - 1, page_count)}
+        for first in range(1, page_count + 1, chunk)
+    ]
+    merge_id = task_id or uuid()
+
+    # Record the fan-out before anything runs so pollers never see an empty PENDING state
+    meta = {
+        'status': f'Processing {page_count} pages in {len(subtasks)} parts...',
+        'page_count': page_count,
+        'subtasks': subtasks,
+    }
+    merge_ocr_results.backend.store_result(merge_id, meta, 'PROCESSING')
+    publish_event(merge_id, 'progress', dict(meta, task_id=merge_id))
+
+    header = group(
+        ocr_process_page_range.s(
+            file_path, sub['first_page'], sub['last_page'], file_digest, job_id=merge_id, engine=engine
+        ).set(task_id=sub['id'])
+        for sub in subtasks
+    )
+    return chord(header)(merge_ocr_results.s(page_count).set(task_id=merge_id))
+
+
+@shared_task(bind=True, base=EventTask)
+def ocr_targeted_crop(self, file_path, page_num, rect, engine=None):
     """
     Runs OCR on a specific crop of a PDF page.
     
@@ -208,6 +492,7 @@ def ocr_targeted_crop(self, file_path, page_num, rect):
         file_path (str): Path to original PDF.
         page_num (int): 1-indexed page number.
         rect (dict): {x, y, width, height} in OCR pixels (150 DPI).
+        engine (str): OCR engine name (see engines.py), OCR_ENGINE if None.
     """
     if not os.path.exists(file_path):
         return {'error': 'File not found'}
@@ -215,82 +500,110 @@ def ocr_targeted_crop(self, file_path, page_num, rect):
     try:
         self.update_state(state='PROCESSING', meta={'status': f'Cropping page {page_num}...'})
         
-        # Convert specific page
-        images = convert_from_path(
-            file_path, 
-            first_page=page_num, 
-            last_page=page_num, 
-            dpi=150, 
-            use_cropbox=True
-        )
-        
-        if not images:
-            return {'error': 'Failed to convert page'}
-            
-        img = images[0]
-        
-        # Define crop (ensure integers)
-        rx, ry, rw, rh = int(rect['x']), int(rect['y']), int(rect['width']), int(rect['height'])
-        
-        # Image crop (box is left, upper, right, lower)
-        # Pad slightly to give OCR context
-        pad = 2
-        crop_box = (
-            max(0, rx - pad), 
-            max(0, ry - pad), 
-            min(img.width, rx + rw + pad), 
-            min(img.height, ry + rh + pad)
-        )
-        img_crop = img.crop(crop_box)
+        page_num = int(page_num)
+        doc = fitz.open(file_path)
+        if not 1 <= page_num <= len(doc):
+            doc.close()
+            return {'error': 'Page out of range'}
+        pdf_page = doc[page_num - 1]
+
+        # Render only the (padded) region, small regions at a higher DPI
+        page_size = page_pixel_size(pdf_page)
+        img_crop, origin, scale = render_region(pdf_page, rect, page_size)
         
         # OCR
         self.update_state(state='PROCESSING', meta={'status': 'Running targeted OCR...'})
-        reader = easyocr.Reader(['en'], gpu=False)
+        engine = get_engine(engine)
+        reader_timing = engine.load()
+        logger.info('ocr_targeted_crop engine %(engine)s %(reader_path)s in %(reader_seconds)ss', reader_timing)
         img_array = np.array(img_crop)
-        results = reader.readtext(img_array)
+        results = engine.readtext(img_array)
         
         if not results:
+            doc.close()
             return {'text': '', 'blocks': []}
 
-        # Open doc for style detection if possible
-        doc = fitz.open(file_path)
-        pdf_page = doc[page_num - 1]
-        scale_x = pdf_page.rect.width / img.width
-        scale_y = pdf_page.rect.height / img.height
+        # One text extraction for the page, shared by all blocks
+        style_lookup = PageStyleLookup(pdf_page)
+        blocks = build_blocks(results, origin, page_size, pdf_page, style_lookup, scale)
 
-        blocks = []
-        for bbox, text, conf in results:
-            # Adjust bbox back to full page coordinates
-            # bbox is relative to crop
-            clean_bbox = [[int(pt[0] + crop_box[0]), int(pt[1] + crop_box[1])] for pt in bbox]
-            
-            x_coords = [pt[0] for pt in clean_bbox]
-            y_coords = [pt[1] for pt in clean_bbox]
-            bx = min(x_coords)
-            by = min(y_coords)
-            bw = max(x_coords) - bx
-            bh = max(y_coords) - by
-
-            # Detect style (use detect_style_in_rect existing logic)
-            pdf_rect = fitz.Rect(
-                bx * scale_x + pdf_page.rect.x0,
-                by * scale_y + pdf_page.rect.y0,
-                (bx + bw) * scale_x + pdf_page.rect.x0,
-                (by + bh) * scale_y + pdf_page.rect.y0
+        doc.close()
+        return {'blocks': blocks, 'timings': reader_timing}
+
+    except Exception as e:
+        return {'error': str(e)}
+
+
+@shared_task(bind=True, base=EventTask)
+def ocr_targeted_batch(self, file_path, regions, engine=None):
+    """
+    Runs OCR on many regions at once: each region is rendered on its own with a
+    clip, and the crops of all regions go through the OCR engine together on stitched sheets.
+
+    Args:
+        file_path (str): Path to original PDF.
+        regions (list): {page, rect} dicts, page 1-indexed and rect {x, y, width, height}
+            in OCR pixels (150 DPI), as for ocr_targeted_crop.
+        engine (str): OCR engine name, as for ocr_targeted_crop.
+
+    Returns:
+        dict: {'regions': [{'page', 'rect', 'blocks'} or {'page', 'rect', 'error'}, ...]
+            in request order, 'timings': reader timing}
+    """
+    if not os.path.exists(file_path):
+        return {'error': 'File not found'}
+
+    try:
+        doc = fitz.open(file_path)
+        page_count = len(doc)
+
+        # Group regions by page so each page is rendered once
+        by_page = {}
+        output = []
+        for index, region in enumerate(regions):
+            page_num = int(region['page'])
+            output.append({'page': page_num, 'rect': region['rect']})
+            if 1 <= page_num <= page_count:
+                by_page.setdefault(page_num, []).append(index)
+            else:
+                output[index]['error'] = 'Page out of range'
+
+        crops, crop_regions, origins = [], [], {}
+        page_sizes, style_lookups = {}, {}
+        for n, page_num in enumerate(sorted(by_page), start=1):
+            self.update_state(state='PROCESSING', meta={'status': f'Cropping page {page_num} ({n}/{len(by_page)})...'})
+            pdf_page = doc[page_num - 1]
+            page_sizes[page_num] = page_pixel_size(pdf_page)
+            # Only the regions are rendered, never the whole page
+            for index in by_page[page_num]:
+                img_crop, origin, scale = render_region(pdf_page, output[index]['rect'], page_sizes[page_num])
+                origins[index] = (origin, scale)
+                crops.append(img_crop)
+                crop_regions.append(index)
+
+        reader_timing = {}
+        region_results = {index: [] for index in crop_regions}
+        if crops:
+            self.update_state(state='PROCESSING', meta={'status': f'Running targeted OCR on {len(crops)} regions...'})
+            engine = get_engine(engine)
+            reader_timing = engine.load()
+            logger.info('ocr_targeted_batch engine %(engine)s %(reader_path)s in %(reader_seconds)ss', reader_timing)
+            for sheet, placements in stitch_crops(crops):
+                for crop_index, result in assign_results(engine.readtext(sheet), placements):
+                    region_results[crop_regions[crop_index]].append(result)
+
+        for index in crop_regions:
+            page_num = output[index]['page']
+            pdf_page = doc[page_num - 1]
+            if page_num not in style_lookups:
+                style_lookups[page_num] = PageStyleLookup(pdf_page)
+            origin, scale = origins[index]
+            output[index]['blocks'] = build_blocks(
+                region_results[index], origin, page_sizes[page_num], pdf_page, style_lookups[page_num], scale
             )
-            bg_rgb, fg_rgb, font_size = detect_style_in_rect(pdf_page, pdf_rect)
-            
-            blocks.append({
-                'text': text,
-                'confidence': float(conf),
-                'rect': {'x': bx, 'y': by, 'width': bw, 'height': bh},
-                'fg_color': '#{:02x}{:02x}{:02x}'.format(int(fg_rgb[0] * 255), int(fg_rgb[1] * 255), int(fg_rgb[2] * 255)),
-                'bg_color': '#{:02x}{:02x}{:02x}'.format(int(bg_rgb[0] * 255), int(bg_rgb[1] * 255), int(bg_rgb[2] * 255)),
-                'font_size': font_size * (150 / 72)
-            })
 
         doc.close()
-        return {'blocks': blocks}
+        return {'regions': output, 'timings': reader_timing}
 
     except Exception as e:
         return {'error': str(e)}
@@ -322,7 +635,32 @@ def detect_style_in_rect(page, rect):
     return bg, fg, font_size
 
 
-@shared_task(bind=True)
+def _save_edits(file_path, output_path, plan, progress):
+    """
+    Burn every edit of plan into file_path and save the result to output_path, outside
+    any edit session. Returns whether it was saved incrementally.
+    """
+    with staged_file(output_path) as work_path:
+        # Open PyMuPDF on a copy of the source when saving incrementally
+        doc, incremental = open_for_edit(
+            file_path, work_path, getattr(settings, 'PDF_SAVE_INCREMENTAL', True)
+        )
+        fonts = DocumentFonts(doc)
+
+        # Process each modified page
+        for p_idx in plan.page_indices():
+            if p_idx >= len(doc):
+                continue
+            progress(p_idx)
+            apply_page_edits(doc[p_idx], plan.edits_for_page(p_idx), fonts=fonts)
+
+        # Append only the changed objects, or save cleanly with the edit font subset
+        save_edited(doc, work_path, incremental, fonts=fonts)
+        doc.close()
+    return incremental
+
+
+@shared_task(bind=True, base=EventTask)
 def apply_pdf_changes(self, file_path, changes):
     """
     Applies edits to a PDF natively using PyMuPDF (burn-in text and redacting background).
@@ -330,158 +668,80 @@ def apply_pdf_changes(self, file_path, changes):
     Args:
         file_path (str): Path to the source PDF.
         changes (list): List of dicts with keys: page, x_percent, y_percent, etc.
+
+    With PDF_SAVE_INCREMENTAL the edits are appended to a copy of the source as an
+    incremental update (see saving.py); PDF_OPTIMIZE_DELAY then queues optimize_pdf
+    to compact the output later. With PDF_EDIT_SESSIONS as well, each save is a new
+    version of the upload's edit session that only redoes the pages whose edits
+    changed since the previous save (see sessions.py).
     """
     if not os.path.exists(file_path):
         return {'error': 'File not found'}
 
     try:
+        # Parse and validate the change list once, grouped by page
+        plan = compile_edit_plan(changes)
+
         self.update_state(state='PROCESSING', meta={'status': 'Opening PDF for native editing...'})
-        
-        # Open PDF with PyMuPDF
-        doc = fitz.open(file_path)
-        
-        # 1. Group changes by page
-        changes_by_page = {}
-        for change in changes:
-            p_idx = change.get('page', 1) - 1 # 0-indexed
-            if p_idx not in changes_by_page:
-                changes_by_page[p_idx] = []
-            changes_by_page[p_idx].append(change)
-
-        # 2. Process each modified page
-        for p_idx, page_changes in changes_by_page.items():
-            if p_idx >= len(doc):
-                continue
-                
+
+        output_path = file_path.replace('.pdf', '_edited.pdf')
+
+        def progress(p_idx):
             self.update_state(
-                state='PROCESSING', 
+                state='PROCESSING',
                 meta={'status': f'Applying edits to page {p_idx + 1}...'}
             )
-            
-            page = doc[p_idx]
-            
-            # Register custom font if available
-            font_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets/fonts/Inter-Regular.ttf')
-            has_custom_font = os.path.exists(font_path)
-            if has_custom_font:
-                page.insert_font(fontname="inter", fontfile=font_path)
-
-            pdf_w = page.rect.width
-            pdf_h = page.rect.height
-            
-            # CRITICAL: PDF pages don't always start at (0,0), especially if they've been cropped!
-            x0 = page.rect.x0
-            y0 = page.rect.y0
-
-            # Pass A: Redaction (Erasing old text)
-            for change in page_changes:
-                if change.get('is_new'):
-                    continue
-                
-                # Use percentage-based original box for perfect scaling
-                orig_box_pct = change.get('original_box_percent')
-                if orig_box_pct and len(orig_box_pct) == 4:
-                    # Expand the redaction area by 2 pixels in every direction
-                    # to ensure all 'ink' from the scan is removed.
-                    ox = x0 + (orig_box_pct[0] * pdf_w) - 2
-                    oy = y0 + (orig_box_pct[1] * pdf_h) - 2
-                    ow = (orig_box_pct[2] * pdf_w) + 4
-                    oh = (orig_box_pct[3] * pdf_h) + 4
-                    
-                    # Get background color
-                    bg_color_hex = change.get('bg_color')
-                    if bg_color_hex and bg_color_hex != 'transparent':
-                        bg_hex = bg_color_hex.lstrip('#')
-                        bg_rgb = tuple(int(bg_hex[i:i+2], 16)/255.0 for i in (0, 2, 4))
-                    else:
-                        bg_rgb = (1, 1, 1) # Default to white
-                        
-                    # Add redaction annotation (removes underlying selectable text)
-                    rect = fitz.Rect(ox, oy, ox + ow, oy + oh)
-                    page.add_redact_annot(rect, fill=bg_rgb)
-            
-            # Apply all redactions for the page
-            page.apply_redactions()
-
-            # Pass B: Insert new/modified text
-            for change in page_changes:
-                tx = x0 + (change.get('x_percent', 0) * pdf_w)
-                ty = y0 + (change.get('y_percent', 0) * pdf_h)
-                tw = change.get('w_percent', 0) * pdf_w
-                th = change.get('h_percent', 0) * pdf_h
-                
-                text_content = change.get('text', '')
-                
-                if 'font_size_percent' in change:
-                    target_fontsize = change['font_size_percent'] * pdf_h
-                else:
-                    target_fontsize = change.get('font_size', 16)
-                
-                fill_color_hex = change.get('fill_color', '#000000')
-                fg_hex = fill_color_hex.lstrip('#')
-                fg_rgb = tuple(int(fg_hex[i:i+2], 16)/255.0 for i in (0, 2, 4))
-
-                bg_color_hex = change.get('bg_color')
-                
-                # If there's a specific background color set for NEW text, draw a rect
-                if change.get('is_new') and bg_color_hex and bg_color_hex != 'transparent':
-                    bg_hex = bg_color_hex.lstrip('#')
-                    bg_rgb = tuple(int(bg_hex[i:i+2], 16)/255.0 for i in (0, 2, 4))
-                    rect = fitz.Rect(tx, ty, tx + tw, ty + th)
-                    page.draw_rect(rect, color=None, fill=bg_rgb)
-                
-                align_str = change.get('text_align', 'left').lower()
-                align = fitz.TEXT_ALIGN_LEFT
-                if align_str == 'center':
-                    align = fitz.TEXT_ALIGN_CENTER
-                elif align_str == 'right':
-                    align = fitz.TEXT_ALIGN_RIGHT
-                
-                # Logic: Is it a header or a paragraph?
-                is_paragraph = "\n" in text_content or len(text_content) > 60
-                
-                font_kwargs = {}
-                if has_custom_font:
-                    font_kwargs['fontname'] = "inter"
-                else:
-                    font_kwargs['fontname'] = "helv"
-
-                if not is_paragraph:
-                    # HEADER PRECISION: No box, no clipping.
-                    page.insert_text(
-                        (tx, ty + (target_fontsize * 0.8)), 
-                        text_content,
-                        fontsize=target_fontsize,
-                        color=fg_rgb,
-                        **font_kwargs
-                    )
-                else:
-                    # PARAGRAPH WRAPPING: Use a box with a safety buffer.
-                    target_rect = fitz.Rect(
-                        tx - 2, 
-                        ty - (target_fontsize * 0.1), 
-                        tx + tw + 4, 
-                        ty + th + (target_fontsize * 0.4)
-                    )
-                    
-                    page.insert_textbox(
-                        target_rect, 
-                        text_content, 
-                        fontsize=target_fontsize, 
-                        color=fg_rgb,
-                        align=align,
-                        **font_kwargs
-                    )
 
-        output_path = file_path.replace('.pdf', '_edited.pdf')
-        
-        self.update_state(state='PROCESSING', meta={'status': 'Saving final PDF natively...'})
-        
-        # Save modifications cleanly
-        doc.save(output_path, garbage=4, deflate=True)
-        doc.close()
+        version, created = None, False
+        if sessions_enabled():
+            version, created = save_version(file_path, output_path, plan, changes, progress=progress)
+
+        if version is not None:
+            incremental = True
+        else:
+            incremental = _save_edits(file_path, output_path, plan, progress)
+
+        delay = getattr(settings, 'PDF_OPTIMIZE_DELAY', None)
+        if incremental and delay is not None:
+            optimize_pdf.apply_async((output_path,), countdown=delay)
         
-        return {'output_path': output_path, 'filename': os.path.basename(output_path)}
+        result = {
+            'output_path': output_path,
+            'filename': os.path.basename(output_path),
+            'incremental': incremental,
+        }
+        if version is not None:
+            result['version'] = version.number
+            result['changed_pages'] = version.changed_pages if created else []
+        return result
+
+    except Exception as e:
+        import traceback
+        return {'error': str(e), 'traceback': traceback.format_exc()}
+
+
+@shared_task(bind=True, base=EventTask)
+def optimize_pdf(self, file_path):
+    """
+    Compact a PDF in place: garbage collection, recompression, edit font subsetting,
+    and incremental updates folded into one revision.
+
+    Args:
+        file_path (str): Path to the PDF, e.g. an _edited.pdf written by apply_pdf_changes.
+    """
+    if not os.path.exists(file_path):
+        return {'error': 'File not found'}
+
+    try:
+        self.update_state(state='PROCESSING', meta={'status': 'Optimizing PDF...'})
+        size_before, size_after, replaced = optimize_file(file_path)
+        return {
+            'output_path': file_path,
+            'filename': os.path.basename(file_path),
+            'size_before': size_before,
+            'size_after': size_after,
+            'replaced': replaced,
+        }
 
     except Exception as e:
         import traceback
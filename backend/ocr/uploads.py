@@ -0,0 +1,156 @@
+"""
+uploads.py
+
+Streaming upload handling for PDF uploads.
+
+With Django's default handlers a large upload is spooled to a temporary file
+and then copied chunk by chunk into MEDIA_ROOT/uploads by the view, so every
+byte is written twice. PDFUploadHandler writes the chunks of the 'file' field
+straight to disk while the multipart body is parsed, hashing them on the way.
+
+With UPLOAD_DEDUP, uploads are stored once per content: the bytes go to
+UPLOAD_BLOB_DIR/<aa>/<sha256>.pdf, and the per-upload name the rest of the app
+uses (MEDIA_ROOT/uploads/<random>_<name>) is a hard link to that blob (a
+symlink if hard links aren't possible). Uploading bytes that are already
+stored only adds the link. Everything keyed by file content (OCR cache, OCR run
+reuse, preview renders via content_key()) is shared between the names.
+"""
+
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+logger = logging.getLogger(__name__)
+
+
+def upload_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'uploads')
+
+
+def blob_dir():
+    return getattr(settings, 'UPLOAD_BLOB_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'blobs')
+
+
+def blob_path(digest):
+    return os.path.join(blob_dir(), digest[:2], f'{digest}.pdf')
+
+
+def content_key(path):
+    """
+    Identify the stored bytes behind path: the same for every name linked to one blob,
+    different once the file is replaced.
+    """
+    st = os.stat(path)
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def link_blob(blob, path):
+    """Make path refer to blob: a hard link, or a symlink across filesystems."""
+    try:
+        os.link(blob, path)
+    except OSError:
+        os.symlink(os.path.abspath(blob), path)
+
+
+def store_blob(tmp_path, digest):
+    """
+    Move a fully written upload into the blob store, or drop it if the same bytes are
+    already there.
+
+    Returns:
+        tuple: (blob path, whether the bytes were already stored)
+    """
+    blob = blob_path(digest)
+    if os.path.exists(blob) and os.path.getsize(blob) == os.path.getsize(tmp_path):
+        os.remove(tmp_path)
+        return blob, True
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    # Concurrent uploads of the same bytes both land here; either rename leaves the same blob
+    os.replace(tmp_path, blob)
+    return blob, False
+
+
+class StoredPDF(UploadedFile):
+    """An uploaded PDF already written to its final path under MEDIA_ROOT/uploads."""
+
+    def __init__(self, file, name, server_filename, content_type, size, charset, content_type_extra=None,
+                 sha256=None, deduplicated=False):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.server_filename = server_filename
+        self.sha256 = sha256
+        self.deduplicated = deduplicated
+
+    @property
+    def path(self):
+        return os.path.join(upload_dir(), self.server_filename)
+
+
+class PDFUploadHandler(FileUploadHandler):
+    """
+    Streams the 'file' field of a PDF upload to disk under a random prefix, computing
+    its SHA-256 on the way. Other fields and non-PDF files are left to the next handlers.
+
+    Install per request, before request.FILES is first touched:
+        request.upload_handlers.insert(0, PDFUploadHandler(request))
+    """
+
+    field_name = 'file'
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.active = field_name == PDFUploadHandler.field_name and file_name.lower().endswith('.pdf')
+        if not self.active:
+            return
+
+        self.server_filename = f"{os.urandom(8).hex()}_{file_name}"
+        self.dedup = getattr(settings, 'UPLOAD_DEDUP', True)
+        if self.dedup:
+            # Written next to the blobs, so moving it into place is a rename
+            os.makedirs(blob_dir(), exist_ok=True)
+            path = os.path.join(blob_dir(), f'{os.urandom(8).hex()}.part')
+        else:
+            os.makedirs(upload_dir(), exist_ok=True)
+            path = os.path.join(upload_dir(), self.server_filename)
+        self.destination = open(path, 'wb')
+        self.digest = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.digest.update(raw_data)
+        self.destination.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.destination.close()
+        self.active = False
+        digest = self.digest.hexdigest()
+
+        deduplicated = False
+        if self.dedup:
+            blob, deduplicated = store_blob(self.destination.name, digest)
+            os.makedirs(upload_dir(), exist_ok=True)
+            link_blob(blob, os.path.join(upload_dir(), self.server_filename))
+            if deduplicated:
+                logger.info('Upload %s matches stored blob %s', self.server_filename, digest)
+
+        return StoredPDF(
+            None, self.file_name, self.server_filename, self.content_type,
+            file_size, self.charset, self.content_type_extra,
+            sha256=digest, deduplicated=deduplicated,
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, 'active', False):
+            self.destination.close()
+            try:
+                os.remove(self.destination.name)
+            except FileNotFoundError:
+                pass
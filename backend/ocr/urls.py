@@ -4,7 +4,13 @@ from . import views
 urlpatterns = [
     path('upload/', views.upload_pdf, name='upload_pdf'),
     path('tasks/<str:task_id>/status/', views.task_status, name='task_status'),
+    path('tasks/<str:task_id>/events/', views.task_events, name='task_events'),
     path('save/', views.save_pdf_edits, name='save_pdf_edits'),
+    path('versions/', views.edit_versions, name='edit_versions'),
+    path('versions/<int:number>/', views.edit_version_file, name='edit_version_file'),
+    path('optimize/', views.optimize_pdf_file, name='optimize_pdf_file'),
     path('ocr/targeted/', views.targeted_ocr, name='targeted_ocr'),
+    path('ocr/targeted/batch/', views.targeted_ocr_batch, name='targeted_ocr_batch'),
     path('preview/', views.preview_pdf_edits, name='preview_pdf_edits'),
+    path('preview/image/', views.preview_pdf_image, name='preview_pdf_image'),
 ]
@@ -1,48 +1,133 @@
 import os
 import json
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from celery.result import AsyncResult
-from .tasks import ocr_process_pdf, apply_pdf_changes, ocr_targeted_crop
+from celery.utils import uuid
+from .cache import ocr_engine_version
+from .edit_plan import compile_edit_plan
+from .engines import ENGINES
+from .events import format_sse, publish_event, read_events
+from .models import Document, EditVersion, OcrRun
+from .results import load_pages, parse_fields, parse_page_range, project_page
+from .saving import derived_output_path
+from .sessions import SessionError, materialize_version
+from .records import create_run, fail_run, get_run, iter_run_pages, load_run_pages, recording_enabled
+from .preview import (
+    IMAGE_FORMATS, make_encoder, negotiate_format, render_page, render_preview, run_in_render_pool, zoom_for,
+)
+from .tasks import UnreadablePDF, start_ocr, apply_pdf_changes, ocr_targeted_batch, ocr_targeted_crop, optimize_pdf
+from .uploads import PDFUploadHandler, StoredPDF
 
 
-@csrf_exempt
-def upload_pdf(request):
+def async_csrf_exempt(view_func):
+    """
+    csrf_exempt for async views. Django 4.2's decorator wraps the view in a plain
+    function, which hides that it is a coroutine function.
+    """
+    view_func.csrf_exempt = True
+    return view_func
+
+
+def in_thread(func):
+    """
+    Wrap a blocking call (file hashing, broker round trips) for use from an async view.
+    These calls don't touch the ORM, so they needn't share the single thread_sensitive thread.
+    """
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def _engine_error(engine):
+    """Error response for an OCR engine name that doesn't exist, None for a valid one (or None)."""
+    if engine is None or (isinstance(engine, str) and engine in ENGINES):
+        return None
+    return JsonResponse({'error': f"Unknown OCR engine, expected one of {', '.join(ENGINES)}"}, status=400)
+
+
+def _page_number(value):
+    """A 1-indexed page number from a request (int or numeric string). Raises ValueError otherwise."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('Invalid page number')
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Invalid page number') from None
+
+
+def _publish_reused_run(task_id, run):
+    """
+    Replay a reused run on the new task's event stream as an OCR job would send it:
+    each page as a 'page' event, then 'done' (which, as usual, has no pages).
+    """
+    for page in iter_run_pages(run):
+        publish_event(task_id, 'page', page)
+    publish_event(task_id, 'done', run.result)
+
+
+@async_csrf_exempt
+async def upload_pdf(request):
     """
     Handle PDF file upload and trigger OCR processing.
     
     POST /api/upload/
     - Accepts multipart form data with 'file' field
-    - Returns JSON with task_id for polling
+    - Optional 'engine' field picks the OCR engine (see engines.py), OCR_ENGINE by default
+    - Returns JSON with task_id for polling, or 400 if the file isn't a readable PDF
+
+    The 'file' field is streamed to disk and hashed by PDFUploadHandler while the body
+    is parsed, off the event loop; bytes already stored are kept once and linked under
+    the new name (see uploads.py). The upload and its OCR run are
+    recorded in the database; a file already OCR'd with the current engine gets a
+    run that is finished from the start (see records.create_run).
     """
-    if request.method == 'POST' and request.FILES.get('file'):
-        uploaded_file = request.FILES['file']
-        
-        # Validate file type
-        if not uploaded_file.name.lower().endswith('.pdf'):
+    if request.method == 'POST':
+        request.upload_handlers.insert(0, PDFUploadHandler(request))
+        files = await in_thread(lambda: request.FILES)()
+        uploaded_file = files.get('file')
+    else:
+        uploaded_file = None
+
+    if uploaded_file:
+        # Validate file type (only .pdf files are streamed to the uploads directory)
+        if not isinstance(uploaded_file, StoredPDF):
             return JsonResponse({'error': 'Only PDF files are allowed'}, status=400)
         
-        # Save file to uploads directory
-        file_name = f"{os.urandom(8).hex()}_{uploaded_file.name}"
-        file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', file_name)
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        # Write file to disk
-        with open(file_path, 'wb+') as destination:
-            for chunk in uploaded_file.chunks():
-                destination.write(chunk)
+        engine = request.POST.get('engine') or None
+        error = _engine_error(engine)
+        if error is not None:
+            return error
+
+        file_name = uploaded_file.server_filename
+        file_path = uploaded_file.path
         
-        # Trigger Celery task
-        task = ocr_process_pdf.delay(file_path)
+        task_id = uuid()
+        file_digest = uploaded_file.sha256
+        run = None
+        if recording_enabled():
+            engine_version = await in_thread(ocr_engine_version)(engine)
+            run = await sync_to_async(create_run)(
+                file_name, uploaded_file.name, uploaded_file.size, file_digest, task_id, engine_version
+            )
+
+        if run is not None and run.status == OcrRun.SUCCESS:
+            # Same file as an earlier run: nothing to queue, its pages are served as they are
+            await sync_to_async(_publish_reused_run)(task_id, run)
+        else:
+            # Trigger Celery task (long documents fan out over parallel page-range subtasks)
+            try:
+                await in_thread(start_ocr)(file_path, file_digest, task_id, engine)
+            except UnreadablePDF as e:
+                if run is not None:
+                    await sync_to_async(fail_run)(task_id, e)
+                return JsonResponse({'error': 'The file is not a readable PDF'}, status=400)
         
         # Return task ID and file URL for immediate preview
         file_url = f"{settings.MEDIA_URL}uploads/{file_name}"
         
         return JsonResponse({
-            'task_id': task.id,
+            'task_id': task_id,
             'server_filename': file_name, # Frontend needs this to save later
             'file_url': file_url,
             'file_name': uploaded_file.name
@@ -51,8 +136,8 @@ def upload_pdf(request):
     return JsonResponse({'error': 'Invalid request. POST with file required.'}, status=400)
 
 
-@csrf_exempt
-def save_pdf_edits(request):
+@async_csrf_exempt
+async def save_pdf_edits(request):
     """
     Apply edits to a previously uploaded PDF.
     
@@ -71,10 +156,54 @@ def save_pdf_edits(request):
             if not filename or not changes:
                 return JsonResponse({'error': 'Missing filename or changes'}, status=400)
 
+            # Validate up front so bad input is a 400, not a failed task
+            try:
+                compile_edit_plan(changes)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+
             file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', filename)
             
             # Trigger the modification task
-            task = apply_pdf_changes.delay(file_path, changes)
+            task = await in_thread(apply_pdf_changes.delay)(file_path, changes)
+            
+            return JsonResponse({'task_id': task.id})
+            
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+            
+    return JsonResponse({'error': 'POST required'}, status=405)
+
+
+@async_csrf_exempt
+async def optimize_pdf_file(request):
+    """
+    Compact a saved PDF, folding the incremental updates of fast saves into one revision.
+    
+    POST /api/optimize/
+    Body: {"filename": "server_filename_edited.pdf"}  (or a materialized <name>_v<n>.pdf; uploads are refused)
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            filename = data.get('filename')
+            
+            if not filename or not isinstance(filename, str):
+                return JsonResponse({'error': 'Missing filename'}, status=400)
+
+            # Uploads are never rewritten (see saving.py), only what was saved from them
+            try:
+                file_path = derived_output_path(os.path.join(settings.MEDIA_ROOT, 'uploads'), filename)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            
+            if not os.path.exists(file_path):
+                return JsonResponse({'error': 'File not found'}, status=404)
+            # An upload can itself be called <something>_edited.pdf
+            if await sync_to_async(Document.objects.filter(server_filename=filename).exists)():
+                return JsonResponse({'error': 'Uploads are never rewritten, optimize a saved output'}, status=400)
+
+            task = await in_thread(optimize_pdf.delay)(file_path)
             
             return JsonResponse({'task_id': task.id})
             
@@ -84,17 +213,154 @@ def save_pdf_edits(request):
     return JsonResponse({'error': 'POST required'}, status=405)
 
 
+def _list_versions(filename):
+    versions = EditVersion.objects.filter(session__source_filename=filename).values(
+        'number', 'size', 'delta_size', 'changed_pages', 'created_at'
+    )
+    return [dict(version, version=version.pop('number')) for version in versions]
+
+
+async def edit_versions(request):
+    """
+    List the saved versions of an upload's edit session.
+    
+    GET /api/versions/?filename=server_filename.pdf
+    
+    Returns {"versions": [{"version", "size", "delta_size", "changed_pages", "created_at"}, ...]},
+    oldest first. Each save through /api/save/ adds one if any page's edits changed.
+    """
+    filename = request.GET.get('filename')
+    if not filename:
+        return JsonResponse({'error': 'Missing filename'}, status=400)
+    return JsonResponse({'versions': await sync_to_async(_list_versions)(filename)})
+
+
+async def edit_version_file(request, number):
+    """
+    Materialize one saved version of an upload (written on first request, then reused).
+    
+    GET /api/versions/<number>/?filename=server_filename.pdf
+    
+    Returns {"version", "filename", "file_url"}.
+    """
+    filename = request.GET.get('filename')
+    if not filename:
+        return JsonResponse({'error': 'Missing filename'}, status=400)
+
+    file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', filename)
+    if not os.path.exists(file_path):
+        return JsonResponse({'error': 'File not found'}, status=404)
+
+    try:
+        path = await sync_to_async(materialize_version)(file_path, number)
+    except SessionError as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    if path is None:
+        return JsonResponse({'error': f'No version {number} of {filename}'}, status=404)
+
+    version_name = os.path.basename(path)
+    return JsonResponse({
+        'version': number,
+        'filename': version_name,
+        'file_url': f"{settings.MEDIA_URL}uploads/{version_name}",
+    })
+
+
+def _aggregate_subtask_progress(meta):
+    """
+    Combine the progress of the page-range subtasks of a fanned-out OCR job
+    (see tasks.start_ocr) into a single status for the client.
+    """
+    pages_done = 0
+    for sub in meta['subtasks']:
+        sub_result = AsyncResult(sub['id'])
+        if sub_result.state == 'SUCCESS':
+            pages_done += sub['last_page'] - sub['first_page'] + 1
+        elif sub_result.state == 'PROCESSING' and isinstance(sub_result.info, dict):
+            pages_done += sub_result.info.get('pages_done', 0)
+
+    page_count = meta['page_count']
+    return {
+        'status': f'Processed {pages_done} of {page_count} pages...',
+        'pages_done': pages_done,
+        'pages_total': page_count,
+    }
+
+
+def _select_pages(task_id, result, params):
+    """
+    Assemble the pages of an OCR result that the client asked for: ?pages=10-20
+    limits the page range, ?fields=text,rect limits the keys of each text block.
+    Pages the task wrote to the per-page result store are read back from there.
+    """
+    if not isinstance(result, dict) or 'pages' not in result or 'page_count' not in result:
+        return result
+
+    page_numbers = parse_page_range(params.get('pages'), result['page_count'])
+    fields = parse_fields(params.get('fields'))
+
+    wanted = set(page_numbers)
+    pages = [page for page in result['pages'] if page['page_number'] in wanted]
+    if result.get('pages_stored'):
+        inline = {page['page_number'] for page in pages}
+        pages += load_pages(task_id, [n for n in page_numbers if n not in inline], fields)
+        pages.sort(key=lambda page: page['page_number'])
+    return dict(result, pages=[project_page(page, fields) for page in pages])
+
+
+def _run_status(run, params):
+    """task_status response for an OCR job recorded in the database."""
+    response = {
+        'state': run.status,
+        'task_id': run.task_id,
+    }
+
+    if run.status == OcrRun.PENDING:
+        response['meta'] = {'status': 'Task is waiting to be processed...'}
+    elif run.status == OcrRun.PROCESSING:
+        pages_done = min(run.pages_done, run.page_count or 0)
+        response['meta'] = {
+            'status': f'Processed {pages_done} of {run.page_count} pages...',
+            'pages_done': pages_done,
+            'pages_total': run.page_count,
+        }
+    elif run.status == OcrRun.SUCCESS:
+        page_numbers = parse_page_range(params.get('pages'), run.result['page_count'])
+        fields = parse_fields(params.get('fields'))
+        pages = load_run_pages(run, page_numbers)
+        response['result'] = dict(run.result, pages=[project_page(page, fields) for page in pages])
+    elif run.status == OcrRun.FAILURE:
+        response['error'] = run.error
+
+    return response
+
+
 def task_status(request, task_id):
     """
     Poll this endpoint to check the status of an OCR Celery task.
     
-    GET /api/tasks/<task_id>/status/
+    GET /api/tasks/<task_id>/status/?pages=10-20&fields=text,rect
+    
+    Query options (OCR results only):
+        - pages: page numbers/ranges to return, e.g. '10-20' or '1-3,8' (default: all)
+        - fields: text block keys to return, e.g. 'text,rect' to skip bbox polygons
+          ('id' is always included; default: all)
     
     Returns:
         - state: 'PENDING', 'PROCESSING', 'SUCCESS', or 'FAILURE'
         - result: OCR data when state is SUCCESS
         - meta: Progress info when state is PROCESSING
+
+    OCR jobs started by upload_pdf are answered from their OcrRun in the database,
+    other tasks from the Celery result backend.
     """
+    run = get_run(task_id)
+    if run is not None:
+        try:
+            return JsonResponse(_run_status(run, request.GET))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
     task_result = AsyncResult(task_id)
     
     response = {
@@ -105,18 +371,94 @@ def task_status(request, task_id):
     if task_result.state == 'PENDING':
         response['meta'] = {'status': 'Task is waiting to be processed...'}
     elif task_result.state == 'PROCESSING':
-        response['meta'] = task_result.info if task_result.info else {'status': 'Processing...'}
+        meta = task_result.info if task_result.info else {'status': 'Processing...'}
+        if 'subtasks' in meta:
+            meta = _aggregate_subtask_progress(meta)
+        response['meta'] = meta
     elif task_result.state == 'SUCCESS':
         # task_result.result contains the return value of the Celery task (the OCR data)
-        response['result'] = task_result.result
+        try:
+            response['result'] = _select_pages(task_id, task_result.result, request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
     elif task_result.state == 'FAILURE':
         response['error'] = str(task_result.result)
         
     return JsonResponse(response)
 
 
-@csrf_exempt
-def targeted_ocr(request):
+def _finished_task_event(task_id):
+    """('done' | 'error', data) for a task that has finished, else None."""
+    run = get_run(task_id)
+    if run is not None:
+        if run.status == OcrRun.SUCCESS:
+            return 'done', run.result
+        if run.status == OcrRun.FAILURE:
+            return 'error', {'error': run.error}
+        return None
+
+    task_result = AsyncResult(task_id)
+    if task_result.state == 'SUCCESS':
+        result = task_result.result
+        if isinstance(result, dict) and result.get('error'):
+            return 'error', {'error': result['error']}
+        return 'done', result
+    if task_result.state == 'FAILURE':
+        return 'error', {'error': str(task_result.result)}
+    return None
+
+
+async def _task_event_stream(task_id, last_id):
+    heartbeat = getattr(settings, 'TASK_EVENTS_HEARTBEAT', 15)
+    async for item in read_events(task_id, last_id, block_seconds=heartbeat):
+        if item is not None:
+            event_id, event, data = item
+            yield format_sse(event, data, event_id)
+            continue
+        # Nothing new: the task may have finished before its events existed (or
+        # after they expired), in which case fall back to its stored result once
+        finished = await sync_to_async(_finished_task_event)(task_id)
+        if finished is not None:
+            yield format_sse(*finished)
+            return
+        yield ': keep-alive\n\n'
+
+
+async def task_events(request, task_id):
+    """
+    Server-Sent Events stream of a task's progress, replacing task_status polling.
+    
+    GET /api/tasks/<task_id>/events/
+    
+    Events:
+        - progress: the task's PROCESSING meta (status, pages_done, ...) and its task_id
+        - page: one page of OCR output, as soon as it is ready
+        - done: the final result, sent once (for OCR jobs without 'pages', which
+          were already sent as page events)
+        - error: {"error": message}
+    
+    Reconnecting clients send Last-Event-ID (EventSource does this itself) and only
+    get the events they missed.
+
+    Needs the ASGI server (see pdfedit/asgi.py): under WSGI, Django buffers a
+    streaming response over an async iterator until it ends, so nothing would
+    arrive before the job is over. There this answers 501 and clients poll
+    task_status instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'Event streams need the ASGI server; poll /api/tasks/<task_id>/status/ instead'},
+            status=501,
+        )
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or '0'
+    response = StreamingHttpResponse(_task_event_stream(task_id, last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
+@async_csrf_exempt
+async def targeted_ocr(request):
     """
     Perform OCR on a specific rectangular area of a PDF page.
     
@@ -124,7 +466,8 @@ def targeted_ocr(request):
     Body: {
         "filename": "server_filename.pdf",
         "page": 1,
-        "rect": {"x": 10, "y": 10, "w": 100, "h": 20}
+        "rect": {"x": 10, "y": 10, "w": 100, "h": 20},
+        "engine": "tesseract"  (optional, OCR_ENGINE by default)
     }
     """
     if request.method == 'POST':
@@ -137,13 +480,18 @@ def targeted_ocr(request):
             if not all([filename, page_num, rect]):
                 return JsonResponse({'error': 'Missing filename, page, or rect'}, status=400)
 
+            engine = data.get('engine')
+            error = _engine_error(engine)
+            if error is not None:
+                return error
+
             file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', filename)
             
             if not os.path.exists(file_path):
                 return JsonResponse({'error': 'File not found'}, status=404)
 
             # Trigger the targeted OCR task
-            task = ocr_targeted_crop.delay(file_path, page_num, rect)
+            task = await in_thread(ocr_targeted_crop.delay)(file_path, page_num, rect, engine)
             
             return JsonResponse({'task_id': task.id})
             
@@ -153,122 +501,203 @@ def targeted_ocr(request):
     return JsonResponse({'error': 'POST required'}, status=405)
 
 
-@csrf_exempt
-def preview_pdf_edits(request):
+@async_csrf_exempt
+async def targeted_ocr_batch(request):
+    """
+    Perform OCR on many rectangular areas in one task. Each page is rasterized
+    once, however many of its regions are requested.
+    
+    POST /api/ocr/targeted/batch/
+    Body: {
+        "filename": "server_filename.pdf",
+        "regions": [
+            {"page": 1, "rect": {"x": 10, "y": 10, "width": 100, "height": 20}},
+            ...
+        ],
+        "engine": "tesseract"  (optional, OCR_ENGINE by default)
+    }
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            filename = data.get('filename')
+            regions = data.get('regions')
+            
+            if not filename or not regions or not isinstance(regions, list):
+                return JsonResponse({'error': 'Missing filename or regions'}, status=400)
+
+            max_regions = getattr(settings, 'OCR_TARGETED_BATCH_MAX_REGIONS', 100)
+            if len(regions) > max_regions:
+                return JsonResponse({'error': f'At most {max_regions} regions per batch'}, status=400)
+
+            engine = data.get('engine')
+            error = _engine_error(engine)
+            if error is not None:
+                return error
+
+            try:
+                regions = [
+                    {
+                        'page': int(region['page']),
+                        'rect': {key: float(region['rect'][key]) for key in ('x', 'y', 'width', 'height')},
+                    }
+                    for region in regions
+                ]
+            except (KeyError, TypeError, ValueError):
+                return JsonResponse({'error': 'Each region needs a page and a rect with x, y, width, height'}, status=400)
+
+            file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', filename)
+            
+            if not os.path.exists(file_path):
+                return JsonResponse({'error': 'File not found'}, status=404)
+
+            task = await in_thread(ocr_targeted_batch.delay)(file_path, regions, engine)
+            
+            return JsonResponse({'task_id': task.id})
+            
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+            
+    return JsonResponse({'error': 'POST required'}, status=405)
+
+
+@async_csrf_exempt
+async def preview_pdf_edits(request):
     """
     Renders a live preview of edits for a single page and returns base64 image.
     
     POST /api/preview/
+    Body: {
+        "filename": "server_filename.pdf",
+        "page": 1,
+        "changes": [...],
+        "since": "version"   # optional: version from the previous response
+    }
+
+    Returns {"image", "version", ...}, or {"tiles": [{x, y, width, height, image}], "version", ...}
+    with only the changed regions when "since" matches the server's cached render.
     """
     import base64
-    import fitz
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
+            if not isinstance(data, dict):
+                return JsonResponse({'error': 'Request body must be a JSON object'}, status=400)
             filename = data.get('filename')
             changes = data.get('changes', [])
-            page_num = data.get('page', 1)
+            page_num = _page_number(data.get('page', 1))
             
             if not filename:
                 return JsonResponse({'error': 'Missing filename'}, status=400)
 
+            # Plans are cached, so an identical change list validated by a save is reused
+            plan = compile_edit_plan(changes)
+
             file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', filename)
             if not os.path.exists(file_path):
                 return JsonResponse({'error': 'File not found'}, status=404)
                 
-            doc = fitz.open(file_path)
             p_idx = page_num - 1
-            if p_idx >= len(doc):
-                doc.close()
-                return JsonResponse({'error': 'Invalid page number'}, status=400)
-                
-            page = doc[p_idx]
-            
-            # Apply edits to this page only
-            page_changes = [c for c in changes if c.get('page', 1) - 1 == p_idx]
-            
-            # --- Start apply edits logic ---
-            font_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets/fonts/Inter-Regular.ttf')
-            has_custom_font = os.path.exists(font_path)
-            if has_custom_font:
-                page.insert_font(fontname="inter", fontfile=font_path)
-
-            pdf_w = page.rect.width
-            pdf_h = page.rect.height
-            x0 = page.rect.x0
-            y0 = page.rect.y0
-
-            # Pass A: Redaction
-            for change in page_changes:
-                if change.get('is_new'): continue
-                orig_box_pct = change.get('original_box_percent')
-                if orig_box_pct and len(orig_box_pct) == 4:
-                    ox = x0 + (orig_box_pct[0] * pdf_w) - 2
-                    oy = y0 + (orig_box_pct[1] * pdf_h) - 2
-                    ow = (orig_box_pct[2] * pdf_w) + 4
-                    oh = (orig_box_pct[3] * pdf_h) + 4
-                    bg_color_hex = change.get('bg_color')
-                    if bg_color_hex and bg_color_hex != 'transparent':
-                        bg_hex = bg_color_hex.lstrip('#')
-                        bg_rgb = tuple(int(bg_hex[i:i+2], 16)/255.0 for i in (0, 2, 4))
-                    else:
-                        bg_rgb = (1, 1, 1)
-                    rect = fitz.Rect(ox, oy, ox + ow, oy + oh)
-                    page.add_redact_annot(rect, fill=bg_rgb)
-            
-            page.apply_redactions()
-
-            # Pass B: Insert new text
-            for change in page_changes:
-                tx = x0 + (change.get('x_percent', 0) * pdf_w)
-                ty = y0 + (change.get('y_percent', 0) * pdf_h)
-                tw = change.get('w_percent', 0) * pdf_w
-                th = change.get('h_percent', 0) * pdf_h
-                
-                text_content = change.get('text', '')
-                if 'font_size_percent' in change:
-                    target_fontsize = change['font_size_percent'] * pdf_h
-                else:
-                    target_fontsize = change.get('font_size', 16)
-                
-                fill_color_hex = change.get('fill_color', '#000000')
-                fg_hex = fill_color_hex.lstrip('#')
-                fg_rgb = tuple(int(fg_hex[i:i+2], 16)/255.0 for i in (0, 2, 4))
-                
-                bg_color_hex = change.get('bg_color')
-                if change.get('is_new') and bg_color_hex and bg_color_hex != 'transparent':
-                    bg_hex = bg_color_hex.lstrip('#')
-                    bg_rgb = tuple(int(bg_hex[i:i+2], 16)/255.0 for i in (0, 2, 4))
-                    rect = fitz.Rect(tx, ty, tx + tw, ty + th)
-                    page.draw_rect(rect, color=None, fill=bg_rgb)
-                
-                align_str = change.get('text_align', 'left').lower()
-                align = fitz.TEXT_ALIGN_LEFT
-                if align_str == 'center': align = fitz.TEXT_ALIGN_CENTER
-                elif align_str == 'right': align = fitz.TEXT_ALIGN_RIGHT
-                
-                is_paragraph = "\n" in text_content or len(text_content) > 60
-                font_kwargs = {}
-                if has_custom_font: font_kwargs['fontname'] = "inter"
-                else: font_kwargs['fontname'] = "helv"
-
-                if not is_paragraph:
-                    page.insert_text((tx, ty + (target_fontsize * 0.8)), text_content, fontsize=target_fontsize, color=fg_rgb, **font_kwargs)
-                else:
-                    target_rect = fitz.Rect(tx - 2, ty - (target_fontsize * 0.1), tx + tw + 4, ty + th + (target_fontsize * 0.4))
-                    page.insert_textbox(target_rect, text_content, fontsize=target_fontsize, color=fg_rgb, align=align, **font_kwargs)
-            # --- End apply edits logic ---
-            
-            # Render to image
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_bytes = pix.tobytes("png")
-            img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-            
-            doc.close()
-            return JsonResponse({'image': f"data:image/png;base64,{img_base64}"})
+
+            # Runs on the render pool, keeping MuPDF work off the event loop. Only the
+            # regions whose edits changed since the last preview are re-rendered, and
+            # clients that send the version they display get just those tiles back.
+            # An unknown page raises ValueError (a 400) once the file is opened.
+            preview = await run_in_render_pool(
+                render_preview, file_path, p_idx, plan.edits_for_page(p_idx), since=data.get('since')
+            )
+
+            def data_url(img_bytes):
+                return f"data:image/png;base64,{base64.b64encode(img_bytes).decode('utf-8')}"
+
+            response = {
+                'version': preview['version'],
+                'width': preview['width'],
+                'height': preview['height'],
+            }
+            if preview['image'] is not None:
+                response['image'] = data_url(preview['image'])
+            else:
+                response['tiles'] = [dict(tile, image=data_url(tile['image'])) for tile in preview['tiles']]
+            return JsonResponse(response)
             
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             import traceback
             return JsonResponse({'error': str(e), 'traceback': traceback.format_exc()}, status=500)
             
     return JsonResponse({'error': 'POST required'}, status=405)
+
+
+
+@async_csrf_exempt
+async def preview_pdf_image(request):
+    """
+    Renders a page preview and returns the raw image bytes (no base64/JSON wrapping).
+    
+    GET  /api/preview/image/?filename=...&page=1&width=160
+        Unedited page, e.g. thumbnails for the page strip.
+    POST /api/preview/image/
+    Body: {"filename": "...", "page": 1, "changes": [...]}
+
+    Options (query string, or body keys for POST):
+        format: 'png', 'jpeg' or 'webp' (otherwise negotiated from the Accept header)
+        quality: 1-100 for jpeg/webp (default 80)
+        width or dpi: output size instead of the default 2x zoom
+    """
+    import fitz
+    try:
+        if request.method == 'POST':
+            data = json.loads(request.body)
+            if not isinstance(data, dict):
+                return JsonResponse({'error': 'Request body must be a JSON object'}, status=400)
+        elif request.method == 'GET':
+            data = request.GET.dict()
+        else:
+            return JsonResponse({'error': 'GET or POST required'}, status=405)
+
+        options = {**request.GET.dict(), **data}
+        filename = data.get('filename')
+        page_num = _page_number(data.get('page', 1))
+        if not filename:
+            return JsonResponse({'error': 'Missing filename'}, status=400)
+
+        plan = compile_edit_plan(data.get('changes', [])) if request.method == 'POST' else None
+        fmt = negotiate_format(options.get('format'), request.headers.get('Accept', ''))
+        encode = make_encoder(fmt, options.get('quality', 80))
+
+        file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', filename)
+        if not os.path.exists(file_path):
+            return JsonResponse({'error': 'File not found'}, status=404)
+
+        p_idx = page_num - 1
+
+        def render():
+            # Runs on the render pool, keeping MuPDF work and encoding off the event loop
+            with fitz.open(file_path) as doc:
+                if p_idx < 0 or p_idx >= len(doc):
+                    return None
+                zoom = zoom_for(doc[p_idx].rect, options.get('width'), options.get('dpi'))
+                if plan is None:
+                    # Unedited pages skip the composite cache kept for the pages being edited
+                    return render_page(doc[p_idx], zoom=zoom, encode=encode)
+            return render_preview(file_path, p_idx, plan.edits_for_page(p_idx), zoom=zoom, encode=encode)
+
+        preview = await run_in_render_pool(render)
+        if preview is None:
+            return JsonResponse({'error': 'Invalid page number'}, status=400)
+
+        response = HttpResponse(preview['image'], content_type=IMAGE_FORMATS[fmt])
+        response['X-Preview-Version'] = preview['version']
+        response['Vary'] = 'Accept'
+        if request.method == 'GET':
+            # Unedited renders only change if the file does
+            response['Cache-Control'] = 'private, max-age=300'
+        return response
+
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        import traceback
+        return JsonResponse({'error': str(e), 'traceback': traceback.format_exc()}, status=500)
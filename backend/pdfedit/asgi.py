@@ -0,0 +1,17 @@
+"""
+ASGI config for pdfedit project.
+
+The upload, save, targeted OCR and preview views are async. Served through
+ASGI, a slow upload or a queued preview render waits on the event loop instead
+of holding a worker thread, e.g.:
+
+    uvicorn pdfedit.asgi:application --workers 2
+
+The Server-Sent Events endpoint (/api/tasks/<task_id>/events/) only streams
+under ASGI; through WSGI (runserver, gunicorn's sync workers) it answers 501.
+"""
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pdfedit.settings')
+application = get_asgi_application()
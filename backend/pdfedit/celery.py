@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pdfedit.settings')
@@ -17,3 +18,10 @@ app.autodiscover_tasks()
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
+
+
+@worker_process_init.connect
+def warm_ocr_readers(**kwargs):
+    """Load the OCR models once per worker process instead of once per task."""
+    from ocr.reader_pool import preload_readers
+    preload_readers()
@@ -60,6 +60,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'pdfedit.wsgi.application'
+ASGI_APPLICATION = 'pdfedit.asgi.application'  # Async deployment: uvicorn pdfedit.asgi:application
 
 # Database
 DATABASES = {
@@ -108,12 +109,69 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Task progress events for /api/tasks/<id>/events/ (Redis streams, see ocr/events.py)
+TASK_EVENTS_ENABLED = True
+TASK_EVENTS_REDIS_URL = os.environ.get('TASK_EVENTS_REDIS_URL', CELERY_RESULT_BACKEND)
+TASK_EVENTS_TTL = 3600  # Seconds a job's events are kept after the last one
+TASK_EVENTS_MAX_LEN = 10000  # Events kept per job
+TASK_EVENTS_HEARTBEAT = 15  # Seconds between keep-alives on an idle stream
+
+# OCR engine
+OCR_LANGUAGES = ['en']
+OCR_ENGINE = os.environ.get('OCR_ENGINE', 'easyocr')  # 'easyocr', 'tesseract' or 'auto' (per page, see ocr/engines.py)
+OCR_TESSERACT_LANG = None  # Tesseract languages, e.g. 'eng+fra' (None: derived from OCR_LANGUAGES)
+OCR_TESSERACT_CONFIG = '--psm 3'
+OCR_AUTO_MIN_CONFIDENCE = 0.8  # 'auto' OCRs a page with EasyOCR when Tesseract's mean line confidence is lower
+OCR_USE_GPU = False  # Set to True if you have CUDA setup
+# Pages whose text lines EasyOCR recognizes together (1: one readtext() per page). Off by
+# default: it relies on EasyOCR internals, and a group's 'page' events and cache writes
+# wait until its last page is recognized, so the first pages show up later.
+OCR_RECOGNITION_BATCH_PAGES = int(os.environ.get('OCR_RECOGNITION_BATCH_PAGES', 1))
+OCR_RECOGNITION_BATCH_SIZE = int(os.environ.get('OCR_RECOGNITION_BATCH_SIZE', 32))  # Line crops per recognizer forward pass
+OCR_TORCH_THREADS = int(os.environ['OCR_TORCH_THREADS']) if os.environ.get('OCR_TORCH_THREADS') else None  # Torch CPU threads per worker process (None: one per core)
+OCR_PRELOAD_READERS = True  # Load the default reader at worker_process_init
+OCR_READER_POOL_SIZE = int(os.environ.get('OCR_READER_POOL_SIZE', 2))
+OCR_READER_MAX_MEMORY_MB = int(os.environ['OCR_READER_MAX_MEMORY_MB']) if os.environ.get('OCR_READER_MAX_MEMORY_MB') else None
+OCR_PAGES_PER_SUBTASK = int(os.environ.get('OCR_PAGES_PER_SUBTASK', 10))  # Longer uploads fan out as a chord
+OCR_NATIVE_TEXT_MIN_COVERAGE = 0.6  # Share of page content that must be native text to skip OCR (None disables)
+OCR_NATIVE_TEXT_MAX_IMAGE_AREA = 0.05  # Pages with more of their area in images are OCR'd anyway (None: no limit)
+OCR_CACHE_BACKEND = os.environ.get('OCR_CACHE_BACKEND', 'disk')  # 'disk', 'redis', or '' to disable
+OCR_CACHE_DIR = BASE_DIR / 'cache' / 'ocr'
+OCR_CACHE_REDIS_URL = os.environ.get('OCR_CACHE_REDIS_URL', CELERY_RESULT_BACKEND)
+OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+OCR_RESULT_PAGE_STORE = True  # Keep OCR results per page in Redis and serve them by range (see ocr/results.py)
+OCR_RESULT_REDIS_URL = os.environ.get('OCR_RESULT_REDIS_URL', CELERY_RESULT_BACKEND)
+OCR_RESULT_TTL = 24 * 3600  # Seconds, matching Celery's default result_expires
+OCR_RESULT_FORMAT = 'compact'  # 'compact' (columnar msgpack, see ocr/compact.py) or 'json'
+OCR_RUN_RECORDS = True  # Record uploads, OCR runs and their pages in the database (see ocr/records.py)
+OCR_RUN_REUSE = True  # Serve the pages of an earlier run for a re-upload of the same file
+OCR_RUN_PAGE_BATCH = 20  # Pages per bulk insert...
+OCR_RUN_FLUSH_SECONDS = 2  # ...or sooner, this many seconds after the previous insert
+# Pages rendered ahead of OCR. Peak rendered pages in memory is this plus
+# OCR_RECOGNITION_BATCH_PAGES. Each page is a separate poppler process that reparses
+# the PDF, so rendering ahead mostly hides that per-page start-up behind OCR.
+OCR_RASTER_IN_FLIGHT_PAGES = int(os.environ.get('OCR_RASTER_IN_FLIGHT_PAGES', 2))
+OCR_TARGETED_BATCH_MAX_REGIONS = int(os.environ.get('OCR_TARGETED_BATCH_MAX_REGIONS', 100))  # Regions accepted per /api/ocr/targeted/batch/ call
+OCR_TARGETED_MIN_HEIGHT_PX = 96  # Targeted regions shorter than this (at 150 DPI) are rendered at a higher DPI
+OCR_TARGETED_MAX_DPI = 600  # Upper bound for that higher DPI
+PDF_SAVE_INCREMENTAL = True  # Append edits to a copy of the upload instead of rewriting the whole file (see ocr/saving.py)
+PDF_EDIT_SESSIONS = True  # Keep each save as a version of the upload, stored as a delta (see ocr/sessions.py)
+PDF_OPTIMIZE_DELAY = None  # Seconds after an incremental save to queue optimize_pdf on the output (None: only via /api/optimize/)
+# Deltas of saved versions (see ocr/sessions.py), outside MEDIA_ROOT so they aren't served; only materialized versions are
+EDIT_SESSION_DIR = BASE_DIR / 'sessions'
+
+# Live preview: pages whose last render is kept per process for incremental re-rendering
+PREVIEW_CACHE_MAX_PAGES = int(os.environ.get('PREVIEW_CACHE_MAX_PAGES', 8))
+PREVIEW_RENDER_WORKERS = int(os.environ.get('PREVIEW_RENDER_WORKERS', 2))  # Threads rendering previews for the async views
+
 # File uploads
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 # Create uploads directory
 UPLOADS_DIR = MEDIA_ROOT / 'uploads'
+UPLOAD_DEDUP = True  # Store identical uploads once and link each upload name to it (see ocr/uploads.py)
+UPLOAD_BLOB_DIR = MEDIA_ROOT / 'blobs'  # Upload bytes, stored once per SHA-256
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
 # REST Framework settings
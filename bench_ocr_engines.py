@@ -0,0 +1,176 @@
+"""
+Compare the OCR engines of backend/ocr/engines.py on a fixed page corpus.
+
+    python bench_ocr_engines.py [--corpus DIR] [--engines easyocr,tesseract,auto] [--batch-pages N]
+
+DIR holds page images (.png/.jpg) with their ground truth in a .txt file of the
+same name. Without --corpus a synthetic corpus is generated (the same pages on
+every run): typeset text at 150 DPI, like the pages ocr_process_pdf renders.
+
+Per engine this prints the load time, pages per second (load excluded), and
+accuracy as 1 - character error rate and as the share of ground truth words
+found, both over whitespace-normalized text in reading order. With --batch-pages
+N > 1, pages go through readtext_batch() N at a time, as ocr_process_pdf does
+with OCR_RECOGNITION_BATCH_PAGES (set OCR_TORCH_THREADS in the environment to
+pin torch's thread count).
+"""
+
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pdfedit.settings')
+
+from ocr.engines import ENGINES, get_engine
+
+WORDS = (
+    "invoice total amount due date account number payment received balance customer "
+    "order shipping address street city postal code reference item quantity price tax "
+    "description service period contract signed office phone email number summary"
+).split()
+
+
+def make_corpus(pages=8, seed=3):
+    """Synthetic pages: (name, RGB array, ground truth text)."""
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(pages):
+        doc = fitz.open()
+        page = doc.new_page()
+        lines, y = [], 60
+        font_size = (9, 11, 14)[n % 3]
+        while y < page.rect.height - 60:
+            line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+            if rng.random() < 0.3:
+                line += f' {rng.randint(10, 99999)}'
+            page.insert_text((50, y), line, fontsize=font_size)
+            lines.append(line)
+            y += font_size * 2
+        pix = page.get_pixmap(dpi=150)
+        image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        corpus.append((f'synthetic-{n + 1}', image.copy(), '\n'.join(lines)))
+        doc.close()
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        stem, ext = os.path.splitext(path)
+        if ext.lower() not in ('.png', '.jpg', '.jpeg') or not os.path.exists(f'{stem}.txt'):
+            continue
+        with open(f'{stem}.txt', encoding='utf-8') as f:
+            truth = f.read()
+        corpus.append((os.path.basename(stem), np.array(Image.open(path).convert('RGB')), truth))
+    return corpus
+
+
+def reading_order(results):
+    """Join (bbox, text, conf) results top to bottom, left to right."""
+    def key(result):
+        bbox = result[0]
+        top = min(pt[1] for pt in bbox)
+        bottom = max(pt[1] for pt in bbox)
+        return (round((top + bottom) / 2 / 10), min(pt[0] for pt in bbox))
+    return ' '.join(text for _, text, _ in sorted(results, key=key))
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def word_recall(found, truth):
+    remaining = {}
+    for word in found.split():
+        remaining[word] = remaining.get(word, 0) + 1
+    hits = 0
+    for word in truth.split():
+        if remaining.get(word):
+            remaining[word] -= 1
+            hits += 1
+    return hits / max(1, len(truth.split()))
+
+
+def bench_engine(name, corpus, batch_pages=1):
+    try:
+        engine = get_engine(name)
+        timing = engine.load()
+    except Exception as e:
+        print(f"{name:10} unavailable: {e}")
+        return None
+
+    errors = chars = 0
+    recall = 0.0
+    start = time.perf_counter()
+    if batch_pages > 1:
+        images = [image for _, image, _ in corpus]
+        outputs = [
+            reading_order(results)
+            for first in range(0, len(images), batch_pages)
+            for results in engine.readtext_batch(images[first:first + batch_pages])
+        ]
+    else:
+        outputs = [reading_order(engine.readtext(image)) for _, image, _ in corpus]
+    seconds = time.perf_counter() - start
+
+    for (_, _, truth), found in zip(corpus, outputs):
+        truth, found = normalize(truth), normalize(found)
+        errors += edit_distance(found, truth)
+        chars += len(truth)
+        recall += word_recall(found, truth)
+
+    row = {
+        'load_s': timing['reader_seconds'],
+        'pages_per_s': len(corpus) / seconds,
+        'char_accuracy': max(0.0, 1 - errors / max(1, chars)),
+        'word_recall': recall / len(corpus),
+    }
+    extra = f"  ({timing['fallback_pages']} pages fell back)" if 'fallback_pages' in timing else ''
+    print(
+        f"{name:10} load {row['load_s']:6.2f} s  {row['pages_per_s']:7.2f} pages/s  "
+        f"chars {row['char_accuracy']:6.1%}  words {row['word_recall']:6.1%}{extra}"
+    )
+    return row
+
+
+def bench_ocr_engines(corpus_dir=None, engines=None, batch_pages=1):
+    corpus = load_corpus(corpus_dir) if corpus_dir else make_corpus()
+    if not corpus:
+        print(f"❌ No page images with .txt ground truth in {corpus_dir}")
+        return False
+    print(f"Corpus: {len(corpus)} pages from {corpus_dir or 'the synthetic generator'}")
+
+    rows = {name: bench_engine(name, corpus, batch_pages) for name in engines or ENGINES}
+    if not any(rows.values()):
+        print("❌ No OCR engine could be loaded")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help='Directory of page images with .txt ground truth')
+    parser.add_argument('--engines', help=f"Comma-separated engines (default: {','.join(ENGINES)})")
+    parser.add_argument('--batch-pages', type=int, default=1, help='Pages per readtext_batch() call (1: readtext() per page)')
+    args = parser.parse_args()
+    engines = args.engines.split(',') if args.engines else None
+    sys.exit(0 if bench_ocr_engines(args.corpus, engines, args.batch_pages) else 1)
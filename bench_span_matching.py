@@ -0,0 +1,84 @@
+import os
+import random
+import sys
+import time
+import fitz  # PyMuPDF
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+
+from ocr.spatial import SpanIndex
+
+
+def make_dense_page(rows=120, cols=25, seed=7):
+    """Synthetic table page: rows x cols cells, one span per cell."""
+    rng = random.Random(seed)
+    spans = []
+    for r in range(rows):
+        for c in range(cols):
+            x0 = 20 + c * 22
+            y0 = 20 + r * 6.5
+            spans.append({
+                "text": f"R{r}C{c}",
+                "bbox": (x0, y0, x0 + 18 + rng.random() * 3, y0 + 6),
+            })
+    return spans
+
+
+def make_ocr_boxes(spans, count=200, seed=11):
+    """OCR-like boxes: jittered copies of random spans, a few matching nothing."""
+    rng = random.Random(seed)
+    boxes = []
+    for _ in range(count):
+        span = rng.choice(spans)
+        x0, y0, x1, y1 = span["bbox"]
+        jitter = lambda: rng.uniform(-1.5, 1.5)
+        text = span["text"] if rng.random() > 0.1 else "noise"
+        boxes.append((fitz.Rect(x0 + jitter(), y0 + jitter(), x1 + jitter(), y1 + jitter()), text))
+    return boxes
+
+
+def linear_match(native_spans, ocr_rect_pdf, text):
+    """The original O(spans) scan from ocr_process_pdf."""
+    matched_span = None
+    best_overlap = 0
+    for span in native_spans:
+        span_rect = fitz.Rect(span["bbox"])
+        intersect = ocr_rect_pdf & span_rect
+        if not intersect.is_empty:
+            overlap = intersect.width * intersect.height
+            if overlap > best_overlap:
+                if span["text"].strip() in text or text in span["text"].strip():
+                    best_overlap = overlap
+                    matched_span = span
+    return matched_span
+
+
+def bench_span_matching():
+    spans = make_dense_page()
+    boxes = make_ocr_boxes(spans)
+    print(f"Dense page: {len(spans)} spans, {len(boxes)} OCR boxes")
+
+    start = time.perf_counter()
+    linear = [linear_match(spans, rect, text) for rect, text in boxes]
+    linear_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = SpanIndex(spans)
+    indexed = [index.best_match(tuple(rect), text) for rect, text in boxes]
+    indexed_s = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(linear, indexed) if a is not b)
+    print(f"Linear scan:  {linear_s * 1000:8.1f} ms")
+    print(f"Grid index:   {indexed_s * 1000:8.1f} ms (including build)")
+    print(f"Speedup:      {linear_s / indexed_s:8.1f}x")
+
+    if mismatches:
+        print(f"❌ Span matching differs for {mismatches} boxes")
+        return False
+    print("✅ Indexed matching picks the same spans as the linear scan.")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if bench_span_matching() else 1)
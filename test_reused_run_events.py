@@ -0,0 +1,114 @@
+"""
+Upload the same PDF twice and check that the second upload, which reuses the first
+one's OCR run, still streams every page over the task's Server-Sent Events.
+
+Needs the Redis of TASK_EVENTS_REDIS_URL, as the app does. Celery runs eagerly and
+the database is a throwaway SQLite file.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+import fitz  # PyMuPDF
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pdfedit.settings')
+
+import django
+from django.conf import settings
+
+WORK_DIR = tempfile.mkdtemp(prefix='reused-run-')
+settings.DATABASES['default']['NAME'] = os.path.join(WORK_DIR, 'db.sqlite3')
+settings.MEDIA_ROOT = os.path.join(WORK_DIR, 'media')
+settings.UPLOAD_BLOB_DIR = os.path.join(WORK_DIR, 'media', 'blobs')
+settings.OCR_CACHE_BACKEND = ''
+settings.CELERY_TASK_ALWAYS_EAGER = True
+settings.ALLOWED_HOSTS = ['testserver']
+settings.TASK_EVENTS_HEARTBEAT = 1
+django.setup()
+
+from django.core.management import call_command
+from django.test import AsyncClient, Client
+
+from pdfedit.celery import app
+
+PAGES = 3
+
+
+def make_pdf(path):
+    """A born-digital PDF, so both uploads take the native text path and need no OCR engine."""
+    doc = fitz.open()
+    for n in range(PAGES):
+        page = doc.new_page()
+        for line in range(20):
+            page.insert_text((50, 60 + line * 30), f'Page {n + 1} line {line} of native text', fontsize=12)
+    doc.save(path)
+    doc.close()
+
+
+def upload(client, path):
+    with open(path, 'rb') as f:
+        response = client.post('/api/upload/', {'file': f})
+    assert response.status_code == 200, response.content
+    return response.json()['task_id']
+
+
+async def read_stream(task_id):
+    """(event, data) pairs of the task's event stream, up to its 'done' or 'error'."""
+    response = await AsyncClient().get(f'/api/tasks/{task_id}/events/')
+    assert response.status_code == 200, response.status_code
+    events, buffer = [], ''
+    async for chunk in response.streaming_content:
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        while '\n\n' in buffer:
+            message, buffer = buffer.split('\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in message.splitlines() if ': ' in line)
+            if 'event' not in fields:
+                continue  # Keep-alive comment
+            events.append((fields['event'], json.loads(fields['data'])))
+            if fields['event'] in ('done', 'error'):
+                return events
+    return events
+
+
+def test_reused_run_streams_pages():
+    print("Testing the event stream of a reused OCR run...")
+    from ocr.models import OcrRun
+
+    app.conf.task_always_eager = True
+    call_command('migrate', verbosity=0)
+    pdf_path = os.path.join(WORK_DIR, 'document.pdf')
+    make_pdf(pdf_path)
+
+    client = Client()
+    first = upload(client, pdf_path)
+    second = upload(client, pdf_path)
+    run = OcrRun.objects.get(task_id=second)
+    if run.reused_from is None or run.reused_from.task_id != first:
+        print(f"❌ Second upload wasn't served from the first run (status {run.status})")
+        return False
+
+    events = asyncio.run(asyncio.wait_for(read_stream(second), timeout=30))
+    pages = [data['page_number'] for event, data in events if event == 'page']
+    if not events or events[-1][0] != 'done':
+        print(f"❌ Stream didn't end with 'done': {[event for event, _ in events]}")
+        return False
+    if pages != list(range(1, PAGES + 1)):
+        print(f"❌ Expected pages 1..{PAGES} before 'done', got {pages}")
+        return False
+    if not all(data['text_blocks'] for event, data in events if event == 'page'):
+        print("❌ A replayed page has no text blocks")
+        return False
+    print(f"✅ Reused run streamed {len(pages)} pages, then 'done'.")
+    return True
+
+
+if __name__ == "__main__":
+    if test_reused_run_streams_pages():
+        print("\nAll event stream checks passed!")
+        sys.exit(0)
+    sys.exit(1)
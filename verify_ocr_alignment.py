@@ -6,39 +6,41 @@ import fitz  # PyMuPDF
 sys.path.append(os.path.join(os.getcwd(), 'backend'))
 
 from ocr.tasks import detect_style_in_rect
+from ocr.style import PageStyleLookup
+
+# Mock Page
+class MockPage:
+    def __init__(self):
+        self.rect = fitz.Rect(0, 0, 500, 500)
+
+    def get_text(self, mode, clip=None):
+        if mode == "dict":
+            return {
+                "blocks": [
+                    {
+                        "type": 0,
+                        "lines": [
+                            {
+                                "spans": [
+                                    {
+                                        "text": "Correct Style",
+                                        "bbox": (50, 50, 150, 70),
+                                        "size": 18.5,
+                                        "color": 16711680, # Red in some conversion? fitz uses int.
+                                        "font": "Helvetica-Bold"
+                                    }
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }
+        return {}
+
 
 def test_detect_style_in_rect():
     print("Testing detect_style_in_rect...")
     
-    # Mock Page
-    class MockPage:
-        def __init__(self):
-            self.rect = fitz.Rect(0, 0, 500, 500)
-        
-        def get_text(self, mode, clip=None):
-            if mode == "dict":
-                return {
-                    "blocks": [
-                        {
-                            "type": 0,
-                            "lines": [
-                                {
-                                    "spans": [
-                                        {
-                                            "text": "Correct Style",
-                                            "bbox": (50, 50, 150, 70),
-                                            "size": 18.5,
-                                            "color": 16711680, # Red in some conversion? fitz uses int.
-                                            "font": "Helvetica-Bold"
-                                        }
-                                    ]
-                                }
-                            ]
-                        }
-                    ]
-                }
-            return {}
-
     page = MockPage()
     rect = fitz.Rect(40, 40, 160, 80) # Overlapping rect
     
@@ -54,6 +56,31 @@ def test_detect_style_in_rect():
     
     print("✅ detect_style_in_rect test passed!")
 
+def test_page_style_lookup():
+    print("\nTesting PageStyleLookup against detect_style_in_rect...")
+
+    page = MockPage()
+    lookup = PageStyleLookup(page)
+    rect = fitz.Rect(40, 40, 160, 80)
+
+    expected = detect_style_in_rect(page, rect)
+    result = lookup.style(rect)
+    assert result == expected, f"Expected {expected}, got {result}"
+
+    # A real page: one extraction answers every query the per-rect clip would
+    doc = fitz.open()
+    real_page = doc.new_page(width=500, height=500)
+    real_page.insert_text((50, 100), "Heading", fontsize=24, color=(0, 0, 1))
+    real_page.insert_text((50, 200), "Body text", fontsize=11, color=(1, 0, 0))
+    lookup = PageStyleLookup(real_page)
+    for query in [fitz.Rect(45, 75, 200, 105), fitz.Rect(45, 185, 200, 205), fitz.Rect(300, 300, 400, 400)]:
+        expected = detect_style_in_rect(real_page, query)
+        result = lookup.style(query)
+        assert result == expected, f"{query}: expected {expected}, got {result}"
+    doc.close()
+
+    print("✅ PageStyleLookup test passed!")
+
 def test_span_matching_logic():
     print("\nTesting span matching logic (conceptual)...")
     # This part tests the logic imported from tasks.py if we could isolate it, 
@@ -64,6 +91,7 @@ def test_span_matching_logic():
 if __name__ == "__main__":
     try:
         test_detect_style_in_rect()
+        test_page_style_lookup()
         print("\nAll automated tests passed!")
     except Exception as e:
         print(f"\n❌ Test failed: {e}")